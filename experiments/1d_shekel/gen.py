@@ -31,7 +31,8 @@ X_v_train, v_train, _, \
                                                     hp["train_val"],
                                                     eps=hp["eps"], n_L=hp["n_L"],
                                                     u_noise=hp["u_noise"],
-                                                    x_noise=hp["x_noise"])
+                                                    x_noise=hp["x_noise"],
+                                                    seed=hp["seed"])
 
 model.initVNNs(hp["n_M"], hp["h_layers"], hp["lr"], hp["lambda"],
                hp["adv_eps"], hp["soft_0"], hp["norm"])
@@ -1,7 +1,7 @@
 """Default hyperparameters for 1D time-dep Burgers Equation."""
 
 import numpy as np
-from poduqnn.varneuralnetwork import NORM_MEANSTD, NORM_CENTER, NORM_NONE
+from poduqnn.handling import NORM_MEANSTD, NORM_CENTER, NORM_NONE
 
 HP = {}
 # Dimension of u(x, t, mu)
@@ -24,6 +24,8 @@ HP["n_L"] = 0
 HP["x_noise"] = 0.
 # Train/val split
 HP["train_val"] = (4/5, 1/5)
+# Seed of the sampling and splits, for reproducible datasets
+HP["seed"] = 1111
 # Deep NN hidden layers topology
 HP["h_layers"] = [128, 128, 128]
 # Setting up TF SGD-based optimizer
@@ -43,13 +45,11 @@ HP["mu_min_out"] = [0.0005]
 HP["mu_max_out"] = [0.0105]
 
 def u(X, t, mu):
-    """Burgers2 explicit solution."""
+    """Burgers2 explicit solution, for all the times in t at once."""
     x = X[0]
     mu = mu[0]
 
-    if t == 1.:
-        res = x / (1 + np.exp(1/(4*mu)*(x**2 - 1/4)))
-    else:
-        t0 = np.exp(1 / (8*mu))
-        res = (x/t) / (1 + np.sqrt(t/t0)*np.exp(x**2/(4*mu*t)))
-    return res.reshape((1, x.shape[0]))
+    t0 = np.exp(1 / (8*mu))
+    x = np.ascontiguousarray(x).reshape((x.shape[0], 1))
+    res = (x/t) / (1 + np.sqrt(t/t0)*np.exp(x**2/(4*mu*t)))
+    return res.reshape((1, x.shape[0], t.shape[0]))
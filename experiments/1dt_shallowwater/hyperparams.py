@@ -1,7 +1,7 @@
 """Default hyperparameters for 1D time-dep Burgers Equation."""
 
 import numpy as np
-from poduqnn.varneuralnetwork import NORM_MEANSTD
+from poduqnn.handling import NORM_MEANSTD
 from scipy.optimize import brentq
 
 HP = {}
@@ -25,6 +25,8 @@ HP["n_L"] = 0
 HP["x_noise"] = 0.
 # Train/val split
 HP["train_val"] = (4/5, 1/5)
+# Seed of the sampling and splits, for reproducible datasets
+HP["seed"] = 1111
 # Deep NN hidden layers topology
 HP["h_layers"] = [256, 256, 256]
 # Setting up TF SGD-based optimizer
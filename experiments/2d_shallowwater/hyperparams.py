@@ -3,7 +3,7 @@
 import numpy as np
 import tensorflow as tf
 
-from poduqnn.varneuralnetwork import NORM_MEANSTD, NORM_CENTER, NORM_NONE
+from poduqnn.handling import NORM_MEANSTD, NORM_CENTER, NORM_NONE
 
 
 HP = {}
@@ -21,6 +21,8 @@ HP["eps"] = 1e-10
 HP["n_L"] = 0
 # Train/val split
 HP["train_val"] = (3/5, 1/5)
+# Seed of the sampling and splits, for reproducible datasets
+HP["seed"] = 1111
 # Deep NN hidden layers topology
 HP["h_layers"] = [40, 40]
 # HP["h_layers"] = [128, 128, 128]
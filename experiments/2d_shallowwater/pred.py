@@ -16,7 +16,7 @@ from poduqnn.mesh import read_multi_space_sol_input_mesh
 from hyperparams import HP as hp
 
 #%% Load models
-model = PodnnModel.load("cache")
+model = PodnnModel.load_bundle("cache")
 
 #%% Sample the new model to generate a test prediction
 with open(os.path.join("cache", "train_tst_idx.pkl"), "rb") as f:
@@ -14,7 +14,7 @@ from poduqnn.plotting import figsize, savefig
 from hyperparams import HP as hp
 
 #%% Load models
-model = PodnnModel.load("cache")
+model = PodnnModel.load_bundle("cache")
 
 X_v_in_n_out = np.linspace(500, 1500, 300).reshape(-1, 1)
 _, U_pred_sig_in_n_out = model.predict(X_v_in_n_out)
@@ -17,7 +17,7 @@ from poduqnn.mesh import read_multi_space_sol_input_mesh
 from hyperparams import HP as hp
 
 #%% Load models
-model = PodnnModel.load("cache")
+model = PodnnModel.load_bundle("cache")
 # X_v_train, v_train, U_train, X_v_val, v_val, U_val = model.load_train_data()
 
 X_v_up = np.linspace(800, 1200, 400).reshape(-1, 1)
@@ -1,6 +1,6 @@
 """Default hyperparameters for 2D inviscid Shallow Water Equations."""
 
-from poduqnn.varneuralnetwork import NORM_MEANSTD, NORM_CENTER, NORM_NONE
+from poduqnn.handling import NORM_MEANSTD, NORM_CENTER, NORM_NONE
 
 
 HP = {}
@@ -22,6 +22,8 @@ HP["eps_init"] = 1e-6
 HP["n_L"] = 0
 # Train/val split
 HP["train_val"] = (.8, .2)
+# Seed of the sampling and splits, for reproducible datasets
+HP["seed"] = 1111
 # Deep NN hidden layers topology
 HP["h_layers"] = [128, 128, 128]
 # Setting up TF SGD-based optimizer
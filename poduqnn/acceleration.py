@@ -1,44 +1,104 @@
 """Compiled and parallelized functions."""
 
+import hashlib
+import importlib.util
+import inspect
+import mmap
+import multiprocessing
+import os
+import sys
+import types
 import warnings
+from functools import partial
+import numba
 import numpy as np
-from numba import jit
+from numba import jit, njit, prange
+from numba.core.errors import NumbaError
+
+from .hashing import func_key
 
 
 # Disable bad division warning when summing up squares
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 
 
-@jit(nopython=True, parallel=True)
-def loop_u(u, n_h, X_v, U, U_no_noise, X, mu_lhs, u_noise=0., x_noise=0.):
-    """Return the inputs/snapshots matrices from parallel computation."""
-    # pylint: disable=not-an-iterable
+# Snapshots executors: numba if u compiles, or a pool of processes
+EXEC_AUTO = "auto"
+EXEC_NUMBA = "numba"
+EXEC_PROCESS = "process"
+
+# Errors of functions numba can't compile, some bytecodes not being NumbaErrors
+COMPILE_ERRORS = (NumbaError, getattr(numba.core.errors, "UnsupportedBytecodeError",
+                                      NumbaError))
+
+# On-disk cache of the loops specialized on a given u
+JIT_CACHE_DIR = os.environ.get("PODUQNN_JIT_CACHE",
+                               os.path.join(os.path.expanduser("~"), ".cache", "poduqnn"))
+
+# SplitMix64 constants, for the counter-based random streams
+GOLDEN = np.uint64(0x9e3779b97f4a7c15)
+MIX_1 = np.uint64(0xbf58476d1ce4e5b9)
+MIX_2 = np.uint64(0x94d049bb133111eb)
+
+
+@jit(nopython=True, cache=True)
+def mix64(x):
+    """SplitMix64 finalizer, turning a counter into 64 random bits."""
+    x = (x ^ (x >> np.uint64(30))) * MIX_1
+    x = (x ^ (x >> np.uint64(27))) * MIX_2
+    return x ^ (x >> np.uint64(31))
+
 
+@jit(nopython=True, cache=True)
+def rand_normal(seed, stream, offset, n):
+    """Return n standard normal draws at position offset of a (seed, stream) stream."""
+    key = mix64(np.uint64(seed) + mix64(np.uint64(stream) * GOLDEN))
+    res = np.empty(n)
+    for k in range(n):
+        # Box-Muller transform of two uniforms in (0, 1] and [0, 1)
+        c = np.uint64(2 * (offset + k))
+        b_1 = mix64(key + c * GOLDEN)
+        b_2 = mix64(key + (c + np.uint64(1)) * GOLDEN)
+        u_1 = ((b_1 >> np.uint64(11)) + np.uint64(1)) * 2.**-53
+        u_2 = (b_2 >> np.uint64(11)) * 2.**-53
+        res[k] = np.sqrt(-2. * np.log(u_1)) * np.cos(2. * np.pi * u_2)
+    return res
 
-    for i in range(mu_lhs.shape[0]):
+
+@jit(nopython=True, parallel=True)
+def loop_u(u, n_h, X_v, U, U_no_noise, X, mu_lhs, u_noise=0., x_noise=0., seed=0,
+           i_0=0, no_noise=True):
+    """Fill the inputs/snapshots matrices from parallel computation."""
+    n_p = X_v.shape[1]
+    # The noise-free solution is only needed separately if there's noise
+    noisy_copy = no_noise and (x_noise > 0. or u_noise > 0.)
+    # pylint: disable=not-an-iterable
+    for i in prange(mu_lhs.shape[0]):
+        # Each sample draws from its own stream, whatever the threads count
         X_v[i, :] = mu_lhs[i]
-        U_i_no_noise = u(X, 0, X_v[i, :]).reshape((n_h,))
+        if noisy_copy:
+            U_no_noise[:, i] = u(X, 0, X_v[i, :]).reshape((n_h,))
         if x_noise > 0.:
-            # X_v[i, :] += x_noise*np.std(X_v[i, :])*np.random.randn(X_v[i, :].shape[0])
-            X_v[i, :] += np.random.normal(0., x_noise*np.std(X_v[i, :]), X_v.shape[1])
+            X_v[i, :] += x_noise*np.std(X_v[i, :])*rand_normal(seed, i_0 + i, 0, n_p)
         U_i = u(X, 0, X_v[i, :]).reshape((n_h,))
         if u_noise > 0.:
-            U_i += u_noise*np.std(U_i)*np.random.randn(U_i.shape[0])
+            U_i += u_noise*np.std(U_i)*rand_normal(seed, i_0 + i, n_p, n_h)
         U[:, i] = U_i
-        U_no_noise[:, i] = U_i_no_noise
-    U_struct = U
-    return X_v, U, U_struct, U_no_noise
 
 
 @jit(nopython=True, parallel=True)
 def loop_u_t(u, n_t, n_v, n_xyz, n_h,
-             X_v, U, U_no_noise, U_struct, X, mu_lhs, t_min, t_max, u_noise=0., x_noise=0.):
-    """Return the inputs/snapshots matrices from parallel computation (w/ t)."""
+             X_v, U, U_no_noise, X, mu_lhs, t_min, t_max, u_noise=0., x_noise=0.,
+             seed=0, i_0=0, no_noise=True):
+    """Fill the inputs/snapshots matrices from parallel computation (w/ t)."""
     # Creating the time steps
     t = np.linspace(t_min, t_max, n_t)
     tT = t.reshape((n_t, 1))
+    n_p = mu_lhs.shape[1]
+    # The noise-free solution is only needed separately if there's noise
+    noisy_copy = no_noise and (x_noise > 0. or u_noise > 0.)
     # pylint: disable=not-an-iterable
-    for i in range(mu_lhs.shape[0]):
+    for i in prange(mu_lhs.shape[0]):
         # Getting the snapshot times indices
         s = n_t * i
         e = n_t * (i + 1)
@@ -49,30 +109,289 @@ def loop_u_t(u, n_t, n_v, n_xyz, n_h,
         dev = np.std(mu_i)
         if dev == 0.:
             dev = mu_i[0]
+        # Each sample draws from its own stream, whatever the threads count
         mu_i = mu_i_no_noise + \
-               x_noise*dev*np.random.randn(mu_i.shape[0])
+               x_noise*dev*rand_normal(seed, i_0 + i, 0, n_p)
         X_v[s:e, :] = np.hstack((tT, np.ones_like(tT)*mu_i))
 
-        # Calling the analytical solution function
-        Ui = np.zeros((n_v, n_xyz, n_t))
-        Ui_no_noise = np.zeros((n_v, n_xyz, n_t))
+        # Calling the analytical solution function, straight into the columns
         for j in range(n_t):
             Uij = u(X, t[j], mu_i)
-            Uij_no_noise = u(X, t[j], mu_i_no_noise)
             if u_noise > 0.:
-                Uij += u_noise*np.std(Uij)*np.random.randn(Uij.shape[0], Uij.shape[1])
-            Ui[:, :, j] = Uij
-            Ui_no_noise[:, :, j] = Uij_no_noise
+                Uij = Uij + u_noise*np.std(Uij) * \
+                    rand_normal(seed, i_0 + i, n_p + j*n_h, n_h).reshape((n_v, n_xyz))
+            U[:, s+j] = np.ascontiguousarray(Uij).reshape((n_h,))
+            if noisy_copy:
+                Uij_no_noise = u(X, t[j], mu_i_no_noise)
+                U_no_noise[:, s+j] = np.ascontiguousarray(Uij_no_noise).reshape((n_h,))
+
+
+@jit(nopython=True, parallel=True)
+def loop_u_t_batch(u, n_t, n_v, n_xyz, n_h,
+                   X_v, U, U_no_noise, X, mu_lhs, t_min, t_max, u_noise=0., x_noise=0.,
+                   seed=0, i_0=0, no_noise=True):
+    """Same as loop_u_t, with u(X, t, mu) taking all the times at once."""
+    # Creating the time steps
+    t = np.linspace(t_min, t_max, n_t)
+    tT = t.reshape((n_t, 1))
+    n_p = mu_lhs.shape[1]
+    # The noise-free solution is only needed separately if there's noise
+    noisy_copy = no_noise and (x_noise > 0. or u_noise > 0.)
+    # pylint: disable=not-an-iterable
+    for i in prange(mu_lhs.shape[0]):
+        # Getting the snapshot times indices
+        s = n_t * i
+        e = n_t * (i + 1)
+
+        # Setting the regression inputs (t, mu)
+        mu_i_no_noise = mu_lhs[i, :]
+        mu_i = mu_lhs[i, :]
+        dev = np.std(mu_i)
+        if dev == 0.:
+            dev = mu_i[0]
+        mu_i = mu_i_no_noise + \
+               x_noise*dev*rand_normal(seed, i_0 + i, 0, n_p)
+        X_v[s:e, :] = np.hstack((tT, np.ones_like(tT)*mu_i))
 
+        # Calling the analytical solution function, (n_v, n_xyz, n_t)-shaped
+        Ui = np.ascontiguousarray(u(X, t, mu_i))
+        if u_noise > 0.:
+            # Same streams as in loop_u_t, step by step
+            Ui = Ui.copy()
+            for j in range(n_t):
+                Ui[:, :, j] += u_noise*np.std(Ui[:, :, j]) * \
+                    rand_normal(seed, i_0 + i, n_p + j*n_h, n_h).reshape((n_v, n_xyz))
         U[:, s:e] = Ui.reshape((n_h, n_t))
-        U_no_noise[:, s:e] = Ui_no_noise.reshape((n_h, n_t))
-        U_struct[:, :, i] = U[:, s:e]
-    return X_v, U, U_struct, U_no_noise
+        if noisy_copy:
+            Ui_no_noise = np.ascontiguousarray(u(X, t, mu_i_no_noise))
+            U_no_noise[:, s:e] = Ui_no_noise.reshape((n_h, n_t))
 
 
-@jit(nopython=True, parallel=True)
+# Loops taking u as an argument, that get specialized by get_kernels
+KERNELS = (loop_u, loop_u_t, loop_u_t_batch)
+
+# Compiled u and kernels, once per process
+_JIT_U = {}
+_KERNELS = {}
+
+
+def jit_u(u):
+    """Return u compiled by numba, cached on disk if it only depends on its file.
+
+    Numba's own cache is only invalidated by changes to the file of u, not to
+    the helpers or modules it reads from elsewhere.
+    """
+    if u not in _JIT_U:
+        _, files = func_key(u)
+        try:
+            if files != {u.__code__.co_filename}:
+                raise RuntimeError("Depends on other files")
+            _JIT_U[u] = njit(cache=True)(u)
+        except RuntimeError:
+            # Also no locator for functions defined interactively
+            _JIT_U[u] = njit(u)
+    return _JIT_U[u]
+
+
+def get_kernels(u, cache_dir=JIT_CACHE_DIR):
+    """Return the loops with u bound, compiled once and cached on disk.
+
+    Numba can't cache functions taking another function as argument, so the
+    loops are written to a module calling u as a global. The compiled u being
+    inlined, the module is keyed by u with the globals and functions it reads.
+    """
+    if u in _KERNELS:
+        return _KERNELS[u]
+    u_jit = jit_u(u)
+    try:
+        if numba.config.DISABLE_JIT:
+            raise TypeError("Nothing to compile")
+        inspect.getsource(u)
+        src = [f'"""Loops specialized on {u.__module__}.{u.__qualname__}."""\n\n'
+               "import numpy as np\n"
+               "from numba import jit, prange\n"
+               f"from {__name__} import rand_normal\n"]
+        for kernel in KERNELS:
+            name = kernel.__name__
+            k_src = inspect.getsource(kernel.py_func)
+            k_src = k_src.replace("parallel=True)", "parallel=True, cache=True)", 1)
+            src.append(k_src.replace(f"def {name}(u, ", f"def {name}(", 1))
+        src = "\n\n".join(src)
+    except (OSError, TypeError):
+        # No source to key the cache with, the loops are compiled every time
+        _KERNELS[u] = types.SimpleNamespace(
+            **{k.__name__: partial(k, u_jit) for k in KERNELS})
+        return _KERNELS[u]
+
+    u_key, _ = func_key(u)
+    key = hashlib.blake2b((numba.__version__ + u_key + src).encode(),
+                          digest_size=10).hexdigest()
+    name = f"kernels_{key}"
+    path = os.path.join(cache_dir, name + ".py")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # Atomic write, as concurrent jobs may share the cache
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(src)
+        os.replace(tmp_path, path)
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    module.u = u_jit
+    # The cached code looks its environment up by module name
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    _KERNELS[u] = module
+    return module
+
+
+def is_batched_t(u, X, t, mu, shape):
+    """Check if u(X, t, mu) accepts a vector of times, returning shape."""
+    try:
+        with np.errstate(all="ignore"):
+            U_t = u(X, t, mu)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return np.shape(U_t) == shape
+
+
+def is_jittable(u, *args):
+    """Check if the numba-compiled u can be called on args."""
+    try:
+        u(*args)
+    except COMPILE_ERRORS:
+        return False
+    return True
+
+
+def fork_is_safe():
+    """Check that numba hasn't started its TBB or OpenMP threads, after which a
+    process that forked hangs at exit."""
+    from numba.np.ufunc import parallel
+    # pylint: disable=protected-access
+    if not parallel._is_initialized:
+        return True
+    return numba.threading_layer() == "workqueue"
+
+
+def process_pool(n_workers=None, initializer=None, initargs=()):
+    """Return a pool of forked processes, or None if it isn't safe to fork, the
+    work being then left to the calling process, initializer included."""
+    if not fork_is_safe():
+        print("Numba's threads are running, working from a single process")
+        return None
+    return multiprocessing.get_context("fork").Pool(n_workers, initializer, initargs)
+
+
+def shared_zeros(shape):
+    """Return a zeros array in an anonymous shared mapping, seen by forked workers."""
+    buf = mmap.mmap(-1, max(int(np.prod(shape)) * 8, 1))
+    return np.frombuffer(buf, dtype=np.float64, count=int(np.prod(shape))).reshape(shape)
+
+
+def noisy_mu(mu, x_noise, seed, stream, has_t):
+    """Return mu perturbated as in loop_u (steady) or loop_u_t."""
+    dev = np.std(mu)
+    if has_t and dev == 0.:
+        dev = mu[0]
+    return mu + x_noise*dev*rand_normal(seed, stream, 0, mu.shape[0])
+
+
+# State of the snapshots pool, set in each worker by init_pool
+_POOL = {}
+
+
+def init_pool(state):
+    """Set the state of a snapshots pool worker."""
+    _POOL.update(state)
+
+
+def pool_u_worker(item):
+    """Compute the snapshots of sample i for the time steps j_s to j_e, straight
+    into the shared U (and U_no_noise)."""
+    i, j_s, j_e = item
+    p = _POOL
+    n_h, n_t, n_p = p["n_h"], p["n_t"], p["mu_lhs"].shape[1]
+    has_t = n_t > 0
+    stream = p["i_0"] + i
+    mu_i_no_noise = p["mu_lhs"][i]
+    mu_i = noisy_mu(mu_i_no_noise, p["x_noise"], p["seed"], stream, has_t) \
+        if p["x_noise"] > 0. else mu_i_no_noise
+    noisy_copy = p["no_noise"] and (p["x_noise"] > 0. or p["u_noise"] > 0.)
+
+    def solve(mu, j_s, j_e):
+        if not has_t:
+            return np.reshape(p["u"](p["X"], 0, mu), (n_h, 1))
+        if p["batched_t"]:
+            return np.reshape(p["u"](p["X"], p["t"][j_s:j_e], mu), (n_h, j_e - j_s))
+        return np.stack([np.reshape(p["u"](p["X"], p["t"][j], mu), (n_h,))
+                         for j in range(j_s, j_e)], axis=-1)
+
+    U_i = solve(mu_i, j_s, j_e)
+    if p["u_noise"] > 0.:
+        for j in range(j_s, j_e):
+            # Same streams as in the compiled loops
+            offset = n_p + j*n_h if has_t else n_p
+            U_i[:, j - j_s] += p["u_noise"]*np.std(U_i[:, j - j_s]) * \
+                rand_normal(p["seed"], stream, offset, n_h)
+    s = max(n_t, 1) * i
+    p["U"][:, s+j_s:s+j_e] = U_i
+    if noisy_copy:
+        p["U_no_noise"][:, s+j_s:s+j_e] = solve(mu_i_no_noise, j_s, j_e)
+    return i
+
+
+def loop_u_pool(u, n_t, n_h, X_v, U, U_no_noise, X, mu_lhs, t_min, t_max,
+                u_noise=0., x_noise=0., seed=0, i_0=0, no_noise=True,
+                batched_t=False, n_workers=None, batch_size=0):
+    """Fill the inputs/snapshots matrices from a pool of processes (n_t=0 if steady),
+    U and U_no_noise having to be allocated by shared_zeros."""
+    has_t = n_t > 0
+    t = np.linspace(t_min, t_max, n_t)
+    n_s = mu_lhs.shape[0]
+
+    # Setting the regression inputs (t, mu)
+    for i in range(n_s):
+        mu_i = mu_lhs[i]
+        if x_noise > 0.:
+            mu_i = noisy_mu(mu_i, x_noise, seed, i_0 + i, has_t)
+        if has_t:
+            X_v[n_t*i:n_t*(i+1)] = np.hstack((t[:, np.newaxis],
+                                              np.ones((n_t, 1))*mu_i))
+        else:
+            X_v[i] = mu_i
+
+    # Work items are (sample, batch of time steps)
+    if batch_size == 0:
+        batch_size = max(n_t, 1)
+    items = [(i, j, min(j + batch_size, max(n_t, 1)))
+             for i in range(n_s) for j in range(0, max(n_t, 1), batch_size)]
+
+    # Forked workers inherit the state, the shared buffers included
+    state = dict(u=u, X=X, t=t, n_h=n_h, n_t=n_t, mu_lhs=mu_lhs, U=U,
+                 U_no_noise=U_no_noise, u_noise=u_noise, x_noise=x_noise,
+                 seed=seed, i_0=i_0, no_noise=no_noise, batched_t=batched_t)
+    pool = process_pool(n_workers, init_pool, (state,))
+    if pool is None:
+        init_pool(state)
+    try:
+        results = map(pool_u_worker, items) if pool is None else \
+            pool.imap_unordered(pool_u_worker, items)
+        # Each item has its own place in U, the completion order doesn't matter
+        for _ in results:
+            pass
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _POOL.clear()
+
+
+@jit(nopython=True, cache=True)
 def lhs(n, samples):
-    """Borrowed, parallelized __lhscentered() from pyDOE."""
+    """Borrowed, compiled __lhscentered() from pyDOE."""
+    # Not parallel, starting numba's threads would keep a later pool from forking
 
     # Generate the intervals
     cut = np.linspace(0, 1, samples + 1)
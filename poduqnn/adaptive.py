@@ -0,0 +1,148 @@
+"""Uncertainty-driven adaptive sampling of the HiFi snapshots."""
+
+import numpy as np
+
+from .handling import sample_mu, DESIGN_MAXIMIN, DESIGN_SOBOL
+from .pod import IncrementalPod
+from .metrics import re_s
+
+
+def analytic_solver(model, u, t_min=0, t_max=0, **kwargs):
+    """Return a solve(mu_lhs) -> (X_v, U) computing the snapshots of u(X, t, mu)."""
+    def solve(mu_lhs):
+        n_d = mu_lhs.shape[1] + int(model.has_t)
+        X_v, U, _, _ = model.create_snapshots(n_d, model.n_h, u, mu_lhs,
+                                              t_min, t_max, **kwargs)
+        return X_v, U
+    return solve
+
+
+class AdaptiveSampler:
+    """Active learning loop, requesting HiFi snapshots where the ensemble disagrees."""
+    def __init__(self, model, solve, mu_min, mu_max, t_min=0, t_max=0, seed=None):
+        # PodnnModel, its regression ensemble being trained by the sampler
+        self.model = model
+        # HiFi solver, from (n_s, n_p) parameters to (X_v, U) as in create_snapshots
+        self.solve = solve
+        self.mu_min, self.mu_max = np.array(mu_min), np.array(mu_max)
+        self.t = np.linspace(t_min, t_max, model.n_t)
+        self.n_t = max(model.n_t, 1)
+        self.seed = seed
+
+        self.pod = None
+        self.mu_train = None
+        self.X_v_train, self.U_train = None, None
+        self.X_v_val, self.U_val = None, None
+        self.history = []
+
+    def expand_t(self, mu):
+        """Return the regression inputs (t, mu) of each parameters set, as X_v."""
+        if not self.model.has_t:
+            return mu
+        n_s = mu.shape[0]
+        return np.hstack((np.tile(self.t, n_s)[:, np.newaxis],
+                          np.repeat(mu, self.n_t, axis=0)))
+
+    def init_design(self, n_s, train_val, eps=0., n_L=0, design=DESIGN_MAXIMIN):
+        """Solve an initial design of n_s samples, and build the POD from it."""
+        mu_lhs = sample_mu(n_s, self.mu_min, self.mu_max, design=design,
+                           seed=self.seed)
+        n_val = int(np.floor(n_s * train_val[1]))
+        if n_val == 0:
+            raise ValueError("The stopping criterion needs validation samples.")
+        self.mu_train = mu_lhs[n_val:]
+        self.X_v_val, self.U_val = self.solve(mu_lhs[:n_val])
+        self.X_v_train, self.U_train = self.solve(self.mu_train)
+
+        self.pod = IncrementalPod()
+        self.update_pod(self.U_train)
+        self.model.V = self.pod.get_basis(eps, n_L)
+        self.model.n_L = self.model.V.shape[1]
+        self.model.n_d = self.X_v_train.shape[1]
+        self.update_pod_sig()
+        return self.get_train_data()
+
+    def update_pod(self, U):
+        """Feed the incremental POD, one sample (trajectory) at a time."""
+        for i in range(0, U.shape[1], self.n_t):
+            self.pod.update(U[:, i:i+self.n_t])
+
+    def update_pod_sig(self):
+        """Compute the POD error, as in PodnnModel.generate_dataset."""
+        U_pod = self.model.project_to_U(self.model.project_to_v(self.U_train))
+        self.model.pod_sig = np.stack((self.U_train, U_pod), axis=-1).std(-1).mean(-1)
+
+    def get_train_data(self):
+        """Return the current (X_v_train, v_train, U_train, X_v_val, v_val, U_val)."""
+        return (self.X_v_train, self.model.project_to_v(self.U_train), self.U_train,
+                self.X_v_val, self.model.project_to_v(self.U_val), self.U_val)
+
+    def train(self, epochs, freq=100):
+        """Train (or fine-tune) each model of the ensemble on the current data."""
+        X_v_train, v_train, _, X_v_val, v_val, _ = self.get_train_data()
+        for i in range(len(self.model.regnn)):
+            self.model.train_model(i, X_v_train, v_train, X_v_val, v_val,
+                                   epochs, freq)
+
+    def score(self, mu):
+        """Return the predicted variance of each parameters set, and the mean
+        relative uncertainty, the predicted std over the norm of v.
+
+        As V is orthonormal, the total variance on U is the one on v. Both tell
+        how much the ensemble disagrees, ranking the candidates, not how wrong
+        it is: see val_error for that.
+        """
+        v_pred, v_pred_sig = self.model.predict_v(self.expand_t(mu))
+        v_var = (v_pred_sig**2).sum(-1).reshape((mu.shape[0], self.n_t))
+        v_norm = np.linalg.norm(v_pred, axis=-1).reshape((mu.shape[0], self.n_t))
+        unc = (np.sqrt(v_var) / np.maximum(v_norm, 1e-12)).mean()
+        return v_var.mean(-1), unc
+
+    def val_error(self):
+        """Return the relative error of the predicted mean on the validation
+        snapshots, POD truncation included."""
+        v_pred, _ = self.model.predict_v(self.X_v_val)
+        return re_s(self.U_val, self.model.project_to_U(v_pred))
+
+    def add(self, mu):
+        """Solve new samples, and update the POD basis without changing n_L."""
+        X_v, U = self.solve(mu)
+        self.mu_train = np.vstack((self.mu_train, mu))
+        self.X_v_train = np.vstack((self.X_v_train, X_v))
+        self.U_train = np.hstack((self.U_train, U))
+        # The outputs dimension is kept, for the ensemble to be fine-tuned
+        self.update_pod(U)
+        self.model.V = self.pod.get_basis(n_L=self.model.n_L, verbose=False)
+        self.update_pod_sig()
+
+    def run(self, n_pool, n_add, epochs, tol, epochs_tune=None, max_iter=10,
+            freq=100):
+        """Train, then add the n_add most uncertain of n_pool candidates until
+        the relative error on the validation samples gets under tol."""
+        if self.model.regnn is None:
+            raise ValueError("Regression model isn't defined, call initVNNs.")
+        epochs_tune = epochs if epochs_tune is None else epochs_tune
+        seed = None if self.seed is None else self.seed + 1
+        mu_pool = sample_mu(n_pool, self.mu_min, self.mu_max,
+                            design=DESIGN_SOBOL, seed=seed)
+
+        self.train(epochs, freq)
+        for it in range(max_iter + 1):
+            scores, unc = self.score(mu_pool)
+            err = float(self.val_error())
+            self.history.append({"n_s": self.mu_train.shape[0], "err": err,
+                                 "unc": float(unc)})
+            print(f"Adaptive sampling #{it}: n_s={self.mu_train.shape[0]}, "
+                  f"validation error={err:.4e}, uncertainty={float(unc):.4e}")
+            if err <= tol or it == max_iter or mu_pool.shape[0] == 0:
+                break
+
+            # Requesting the HiFi solutions only at the top-k candidates
+            top = np.argsort(scores)[::-1][:n_add]
+            self.add(mu_pool[top])
+            mu_pool = np.delete(mu_pool, top, axis=0)
+            self.train(epochs_tune, freq)
+
+        self.model.save_train_data(*self.get_train_data())
+        self.model.save_model()
+        return self.history
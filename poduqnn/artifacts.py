@@ -0,0 +1,128 @@
+"""Directory artifacts: one .npy per array, and a small JSON metadata file."""
+
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+
+META_NAME = "meta.json"
+ARTIFACT_VERSION = 1
+
+
+def save_arrays(path, arrays, meta=None):
+    """Save the {name: array or None} arrays and meta in the directory path,
+    written aside then swapped in, so readers never see a partial artifact."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        if array is not None:
+            np.save(os.path.join(tmp_path, name + ".npy"), np.asarray(array))
+    meta = {"version": ARTIFACT_VERSION, "meta": meta or {},
+            "arrays": list(arrays),
+            "none": [name for name, array in arrays.items() if array is None]}
+    with open(os.path.join(tmp_path, META_NAME), "w") as f:
+        json.dump(meta, f)
+    replace_dir(tmp_path, path)
+
+
+def replace_dir(tmp_path, path):
+    """Swap the fully written directory tmp_path in place of path.
+
+    path is a link to a hidden versioned directory next to it, flipped
+    atomically, so it always leads to a complete copy.
+    """
+    parent, base = os.path.split(os.path.abspath(path))
+    version = f".{base}.{time.time_ns()}.{os.getpid()}"
+    os.replace(tmp_path, os.path.join(parent, version))
+    old_path = None
+    if os.path.islink(path):
+        old_path = os.path.join(parent, os.readlink(path))
+    elif os.path.isdir(path):
+        # Plain directory of an earlier layout, moved aside once
+        old_path = os.path.join(parent, f".{base}.old.{os.getpid()}")
+        os.replace(path, old_path)
+    link_path = f"{path}.{os.getpid()}.lnk"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(version, link_path)
+    os.replace(link_path, path)
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def remove_dir(path):
+    """Remove the directory path, with the version it links to."""
+    if os.path.islink(path):
+        target = os.path.join(os.path.dirname(os.path.abspath(path)), os.readlink(path))
+        os.remove(path)
+        shutil.rmtree(target, ignore_errors=True)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def link_artifact(src, dst):
+    """Make dst a copy of the artifact directory src, without copying the data.
+
+    Files are hard-linked, and copied only across file systems. Artifacts
+    being never modified in place, both stay independent.
+    """
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name in os.listdir(src):
+        try:
+            os.link(os.path.join(src, name), os.path.join(tmp_path, name))
+        except OSError:
+            shutil.copy2(os.path.join(src, name), os.path.join(tmp_path, name))
+    replace_dir(tmp_path, dst)
+
+
+class Artifact:
+    """Arrays of an artifact directory, memory-mapped when opened.
+
+    Maps outlive a replacement of the directory, only the pages read are
+    loaded. Without mmap_mode, arrays are read when first accessed.
+    """
+    def __init__(self, path, mmap_mode="c"):
+        # The version current when opened, even if replaced in the meantime
+        self.path = os.path.realpath(path)
+        # Copy-on-write by default: arrays are writable, the files untouched
+        self.mmap_mode = mmap_mode
+        meta_path = os.path.join(self.path, META_NAME)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Can't find artifact {path}.")
+        with open(meta_path, "r") as f:
+            data = json.load(f)
+        if data["version"] != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported artifact version: {data['version']}")
+        self.meta = data["meta"]
+        self.names = data["arrays"]
+        self.none = set(data["none"])
+        self.arrays = {}
+        if mmap_mode is not None:
+            self.get(self.names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        if name in self.none:
+            return None
+        if name not in self.arrays:
+            self.arrays[name] = np.load(os.path.join(self.path, name + ".npy"),
+                                        mmap_mode=self.mmap_mode)
+        return self.arrays[name]
+
+    def get(self, names):
+        """Return the tuple of the arrays names."""
+        return tuple(self[name] for name in names)
+
+
+def load_arrays(path, mmap_mode="c"):
+    """Open the artifact directory path, its arrays being read on demand."""
+    return Artifact(path, mmap_mode)
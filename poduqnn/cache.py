@@ -0,0 +1,98 @@
+"""Content-addressed cache of the generated datasets, bounded in size."""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from .artifacts import link_artifact, replace_dir, remove_dir
+from .hashing import feed_hash
+
+# Cache directory, under the model resdir
+DATASET_CACHE_NAME = "datasets"
+ENTRY_NAME = "entry.json"
+CACHE_VERSION = 2
+# Total size of the cached datasets, the least recently used being evicted
+CACHE_MAX_SIZE = int(os.environ.get("PODUQNN_CACHE_SIZE", 8 * 2**30))
+
+
+def dataset_key(**parts):
+    """Return the hash key of the dataset generated from parts."""
+    h = hashlib.blake2b(digest_size=20)
+    feed_hash(h, {"version": CACHE_VERSION, **parts})
+    return h.hexdigest()
+
+
+def dir_size(path):
+    """Return the total size of the files under path."""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+class DatasetCache:
+    """Directory of cached datasets, each a set of artifacts under its hash key.
+
+    Entries are hard-linked to and from the model resdir, and the least
+    recently used ones are evicted past max_size bytes.
+    """
+    def __init__(self, path, max_size=CACHE_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.entry_path(key), ENTRY_NAME))
+
+    def get(self, key, dsts):
+        """Link the {name: dir} artifacts of the key entry, and return its meta,
+        or None if the key isn't cached."""
+        if key not in self:
+            return None
+        entry_path = self.entry_path(key)
+        with open(os.path.join(entry_path, ENTRY_NAME), "r") as f:
+            meta = json.load(f)
+        for name in meta["artifacts"]:
+            link_artifact(os.path.join(entry_path, name), dsts[name])
+        # Marking the entry as recently used
+        os.utime(os.path.join(entry_path, ENTRY_NAME))
+        return meta["meta"]
+
+    def put(self, key, srcs, meta=None):
+        """Cache the {name: dir} artifacts and meta under key."""
+        tmp_path = f"{self.entry_path(key)}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, src in srcs.items():
+            link_artifact(src, os.path.join(tmp_path, name))
+        with open(os.path.join(tmp_path, ENTRY_NAME), "w") as f:
+            json.dump({"artifacts": list(srcs), "meta": meta or {},
+                       "time": time.time()}, f)
+        replace_dir(tmp_path, self.entry_path(key))
+        self.evict(keep=key)
+
+    def entries(self):
+        """Return the cached keys, least recently used first."""
+        # Skipping the temporary and versioned directories
+        keys = [key for key in os.listdir(self.path) if "." not in key and key in self]
+        return sorted(keys, key=lambda key: os.path.getmtime(
+            os.path.join(self.entry_path(key), ENTRY_NAME)))
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until under max_size."""
+        keys = self.entries()
+        sizes = {key: dir_size(self.entry_path(key)) for key in keys}
+        total = sum(sizes.values())
+        for key in keys:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            remove_dir(self.entry_path(key))
+            total -= sizes[key]
@@ -8,6 +8,20 @@ from .acceleration import lhs
 
 MODEL_NAME = "model_weights"
 
+# Inputs normalizations of the regression networks
+NORM_NONE = "none"
+NORM_MEANSTD = "meanstd"
+NORM_CENTER = "center"
+
+# Designs of experiments for the non-spatial parameters
+DESIGN_LHS = "lhs"
+DESIGN_MAXIMIN = "maximin"
+DESIGN_SOBOL = "sobol"
+DESIGN_HALTON = "halton"
+
+# Number of random LHS screened for the maximin design
+MAXIMIN_CANDIDATES = 32
+
 
 def pack_layers(i, hiddens, o):
     """Create the full NN topology from input size, hidden layers, and output."""
@@ -27,23 +41,109 @@ def scarcify(X, u, N):
     return X[idx, :], u[idx, :], X[mask, :], u[mask, :]
 
 
+def split_samples(n_s, test_size, seed=None):
+    """Randomly split the indices of n_s samples into train and test ones, from
+    the global RNG unless a seed is given."""
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    indices = rng.permutation(n_s)
+    limit = np.floor(n_s * (1. - test_size)).astype(int)
+    return indices[:limit], indices[limit:]
+
+
+def split_snapshots(samples, n_t, rm_init=False):
+    """Return the snapshots columns of samples, time-wise first, and the number
+    n_0 of initial conditions put first with rm_init.
+
+    Each array is then gathered once, A[:n_0] and A[n_0:] being views.
+    """
+    n_t_s = max(n_t, 1)
+    cols = (np.asarray(samples)[:, np.newaxis] * n_t_s + np.arange(n_t_s)).ravel()
+    if not rm_init or n_t == 0:
+        return cols, 0
+    is_init = np.arange(cols.shape[0]) % n_t == 0
+    return np.concatenate((cols[is_init], cols[~is_init])), np.count_nonzero(is_init)
+
+
 def split_dataset(X_v, v, test_size, idx_only=False):
     """Randomly splitting the dataset (X_v, v)."""
-    indices = np.random.permutation(X_v.shape[0])
-    limit = np.floor(X_v.shape[0] * (1. - test_size)).astype(int)
+    train_idx, tst_idx = split_samples(X_v.shape[0], test_size)
     if idx_only:
-        return indices[:limit].tolist(), indices[limit:].tolist()
-    train_idx, tst_idx = indices[:limit], indices[limit:]
+        return train_idx.tolist(), tst_idx.tolist()
     return X_v[train_idx], X_v[tst_idx], v[train_idx], v[tst_idx]
 
 
-def sample_mu(n_s, mu_min, mu_max, indices=None):
-    """Return a LHS sampling between mu_min and mu_max of size n_s."""
+def lhs_candidates(n_s, X_0, n_c, rng):
+    """Return n_c LHS of n_s points in [0, 1], in the strata X_0 leaves free.
+
+    Strata are those of the n_0 + n_s grid, so X_0 and the new points
+    together still are a LHS, as long as X_0 is one.
+    """
+    n_0, n_p = X_0.shape
+    n = n_0 + n_s
+    H = np.zeros((n_c, n_s, n_p))
+    for j in range(n_p):
+        taken = np.clip(np.floor(X_0[:, j] * n).astype(int), 0, n - 1)
+        free = np.setdiff1d(np.arange(n), taken)
+        if free.shape[0] < n_s:
+            # X_0 points sharing strata, completing with the busy ones
+            busy = np.setdiff1d(np.arange(n), free)
+            free = np.concatenate((free, rng.choice(busy, n_s - free.shape[0],
+                                                    replace=False)))
+        # A random pairing of the strata for each candidate
+        order = rng.random((n_c, free.shape[0])).argsort(axis=1)[:, :n_s]
+        H[:, :, j] = (free[order] + rng.random((n_c, n_s))) / n
+    return H
+
+
+def min_distances(H, X_0):
+    """Return the minimum distance between points of each design H[i] and X_0."""
+    from scipy.spatial.distance import cdist, pdist
+    d_min = np.full(H.shape[0], np.inf)
+    for i in range(H.shape[0]):
+        if H.shape[1] > 1:
+            d_min[i] = pdist(H[i]).min()
+        if X_0.shape[0] > 0:
+            d_min[i] = min(d_min[i], cdist(H[i], X_0).min())
+    return d_min
+
+
+def sample_mu(n_s, mu_min, mu_max, indices=None, design=DESIGN_LHS, seed=None,
+              existing=None):
+    """Return a LHS sampling between mu_min and mu_max of size n_s.
+
+    design is one of the DESIGN_*, and existing a previous sampling of the
+    same design and seed, to which n_s new points are added.
+    """
     if indices is not None:
         mu = np.linspace(mu_min, mu_max, n_s)[indices]
         return mu
-    X_lhs = lhs(n_s, mu_min.shape[0]).T
-    mu_lhs = mu_min + (mu_max - mu_min)*X_lhs
+    n_p = mu_min.shape[0]
+    X_0 = np.zeros((0, n_p))
+    if existing is not None:
+        X_0 = (np.reshape(existing, (-1, n_p)) - mu_min) / (mu_max - mu_min)
+
+    if design in (DESIGN_SOBOL, DESIGN_HALTON):
+        if seed is None and X_0.shape[0] > 0:
+            raise ValueError("Extending a scrambled sequence requires its seed.")
+        from scipy.stats import qmc
+        engine = qmc.Sobol if design == DESIGN_SOBOL else qmc.Halton
+        sampler = engine(n_p, scramble=True, seed=seed)
+        # Resuming the sequence after the existing points
+        if X_0.shape[0] > 0:
+            sampler.fast_forward(X_0.shape[0])
+        X = sampler.random(n_s)
+    elif design == DESIGN_LHS and seed is None and existing is None:
+        X = lhs(n_p, n_s)
+    elif design in (DESIGN_LHS, DESIGN_MAXIMIN):
+        # The compiled lhs draws from numba's generator, that can't be seeded
+        rng = np.random.default_rng(seed)
+        n_c = MAXIMIN_CANDIDATES if design == DESIGN_MAXIMIN else 1
+        H = lhs_candidates(n_s, X_0, n_c, rng)
+        X = H[np.argmax(min_distances(H, X_0))]
+    else:
+        raise ValueError(f"Unknown design: {design}")
+
+    mu_lhs = mu_min + (mu_max - mu_min)*X
     return mu_lhs
 
 
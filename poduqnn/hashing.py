@@ -0,0 +1,130 @@
+"""Content hashes keying the on-disk caches, of arrays as well as functions."""
+
+import hashlib
+import inspect
+import os
+import sys
+import sysconfig
+import types
+import numpy as np
+
+# Standard library and installed packages, only identified by their versions
+LIB_DIRS = tuple(sorted({os.path.join(os.path.realpath(path), "")
+                         for name, path in sysconfig.get_paths().items()
+                         if name in ("stdlib", "platstdlib", "purelib", "platlib")}))
+
+
+def feed_hash(h, obj):
+    """Update the hash h with a canonical encoding of obj."""
+    if isinstance(obj, np.ndarray):
+        h.update(f"array{obj.shape}{obj.dtype.str}".encode())
+        h.update(np.ascontiguousarray(obj).data)
+    elif isinstance(obj, dict):
+        h.update(f"dict{len(obj)}".encode())
+        for key in sorted(obj, key=str):
+            feed_hash(h, key)
+            feed_hash(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"list{len(obj)}".encode())
+        for item in obj:
+            feed_hash(h, item)
+    elif isinstance(obj, np.generic):
+        feed_hash(h, obj.item())
+    elif hasattr(obj, "__code__") or hasattr(obj, "py_func"):
+        # Solutions keyed by their source and the globals and helpers they read
+        feed_func(h, obj)
+    else:
+        h.update(f"{type(obj).__name__}{obj!r}".encode())
+
+
+def is_lib_file(filename):
+    """Check if filename is part of the standard library or an installed package."""
+    return os.path.join(os.path.realpath(filename), "").startswith(LIB_DIRS)
+
+
+def lib_version(obj):
+    """Return the version of the package the module, function or class obj is from."""
+    module = getattr(obj, "__module__", None) or getattr(obj, "__name__", "")
+    package = sys.modules.get(str(module).split(".")[0])
+    return getattr(package, "__version__", sys.version)
+
+
+def code_names(code):
+    """Return the global names code and the functions it defines may read."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= code_names(const)
+    return names
+
+
+def feed_value(h, obj, files, seen):
+    """Update the hash h with a global read by a function, see feed_func."""
+    if isinstance(obj, types.ModuleType):
+        filename = getattr(obj, "__file__", None)
+        if filename is None or is_lib_file(filename):
+            h.update(f"module{obj.__name__}{lib_version(obj)}".encode())
+        else:
+            # Any attribute of a user module may be read, hashing all of it
+            files.add(filename)
+            with open(filename, "rb") as f:
+                h.update(f.read())
+    elif hasattr(obj, "__code__") or hasattr(obj, "py_func"):
+        feed_func(h, obj, files, seen)
+    elif isinstance(obj, type) or callable(obj):
+        # Classes and builtins, by name
+        name = getattr(obj, "__qualname__", type(obj).__qualname__)
+        h.update(f"object{getattr(obj, '__module__', None)}.{name}{lib_version(obj)}"
+                 .encode())
+    else:
+        feed_hash(h, obj)
+
+
+def feed_func(h, func, files=None, seen=None):
+    """Update the hash h with func and what it reads when called, returning the
+    user source files involved.
+
+    Compiled code freezes the globals it reads, so their values and the
+    sources of the user functions called are hashed as well. Library functions
+    and modules are identified by their package version.
+    """
+    files = set() if files is None else files
+    seen = set() if seen is None else seen
+    func = getattr(func, "py_func", func)
+    code = func.__code__
+    if is_lib_file(code.co_filename):
+        h.update(f"lib{func.__module__}.{func.__qualname__}{lib_version(func)}".encode())
+        return files
+    if func in seen:
+        h.update(f"seen{func.__qualname__}".encode())
+        return files
+    seen.add(func)
+    files.add(code.co_filename)
+
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = repr((code.co_code, code.co_consts))
+    h.update(f"func{source}".encode())
+    feed_hash(h, (func.__defaults__, func.__kwdefaults__))
+
+    # Globals, then the variables of the enclosing functions
+    for name in sorted(code_names(code)):
+        if name in func.__globals__:
+            h.update(f"global{name}".encode())
+            feed_value(h, func.__globals__[name], files, seen)
+    for name, cell in zip(code.co_freevars, func.__closure__ or ()):
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            continue
+        h.update(f"free{name}".encode())
+        feed_value(h, value, files, seen)
+    return files
+
+
+def func_key(func):
+    """Return the hash key of func with what it reads, and the user files involved."""
+    h = hashlib.blake2b(digest_size=20)
+    files = feed_func(h, func)
+    return h.hexdigest(), files
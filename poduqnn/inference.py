@@ -0,0 +1,56 @@
+"""Predict-only regression networks, running without TensorFlow."""
+
+import numpy as np
+
+from .handling import NORM_NONE, NORM_MEANSTD, NORM_CENTER
+
+
+class InferenceNetwork:
+    """Predict-only twin of a trained VarNeuralNetwork, as a numpy forward pass."""
+    def __init__(self, weights, layers, soft_0=1., norm=NORM_NONE, norm_bounds=None):
+        # Kernels and biases of the Dense layers, as from model.get_weights()
+        self.weights = weights
+        self.layers = layers
+        self.soft_0 = soft_0
+        self.norm = norm
+        self.norm_bounds = norm_bounds
+
+    @classmethod
+    def from_network(cls, regnn):
+        """Build from a VarNeuralNetwork, copying its weights."""
+        return cls(regnn.model.get_weights(), regnn.layers, regnn.soft_0,
+                   regnn.norm, regnn.norm_bounds)
+
+    def normalize(self, X):
+        """Perform the normalization on the inputs, as VarNeuralNetwork."""
+        X = np.asarray(X, dtype=np.float64)
+        if self.norm_bounds is None:
+            return X
+        if self.norm == NORM_CENTER:
+            lb, ub = self.norm_bounds
+            X = (X - lb) - 0.5 * (ub - lb)
+        elif self.norm == NORM_MEANSTD:
+            mean, std = self.norm_bounds
+            X = (X - mean) / std
+        return X
+
+    def forward(self, X):
+        """Return the mean and standard deviation of the output distribution."""
+        x = self.normalize(X)
+        n_layers = len(self.weights) // 2
+        for k in range(n_layers):
+            x = x.dot(self.weights[2*k]) + self.weights[2*k+1]
+            if k < n_layers - 1:
+                x = np.maximum(x, 0.)
+        n_L = self.layers[-1]
+        return x[..., :n_L], np.logaddexp(0., self.soft_0 * x[..., n_L:]) + 1e-6
+
+    def predict(self, X):
+        """Get the prediction for a new input X."""
+        y_pred_mean, y_pred_sig = self.forward(X)
+        return y_pred_mean, y_pred_sig**2
+
+    def predict_dist(self, X):
+        """Get the predicted distribution for a new input X."""
+        import tensorflow_probability as tfp
+        return tfp.distributions.Normal(*self.forward(X))
@@ -1,6 +1,5 @@
 import yaml
 import time
-import tensorflow as tf
 import numpy as np
 from datetime import datetime
 
@@ -19,6 +18,7 @@ class Logger(object):
         self.get_val_err = None
 
         if not self.silent:
+            import tensorflow as tf
             print(f"TensorFlow version: {tf.version}")
             print(f"Eager execution: {tf.executing_eagerly()}")
             # print(f"GPU-accerelated: {len(tf.config.list_physical_devices('GPU')) > 0}")
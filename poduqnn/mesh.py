@@ -1,11 +1,54 @@
 import os
 import sys
 import time
-import pandas as pd
+import base64
+import hashlib
+import json
+import zlib
 import numpy as np
-import meshio
 import re
 from tqdm import tqdm
+from functools import partial
+
+from .acceleration import process_pool, shared_zeros, JIT_CACHE_DIR
+
+# Samples read ahead of the POD when streaming the solutions
+PREFETCH_SAMPLES = 4
+
+# State of the reading pool, set in each worker by init_reader
+_READER = {}
+
+# Data types of the legacy (big-endian when binary) and XML VTK formats
+VTK_TYPES = {
+    b"unsigned_char": "u1", b"char": "i1", b"unsigned_short": "u2", b"short": "i2",
+    b"unsigned_int": "u4", b"int": "i4", b"unsigned_long": "u8", b"long": "i8",
+    b"float": "f4", b"double": "f8",
+    b"vtktypeint8": "i1", b"vtktypeuint8": "u1", b"vtktypeint16": "i2",
+    b"vtktypeuint16": "u2", b"vtktypeint32": "i4", b"vtktypeuint32": "u4",
+    b"vtktypeint64": "i8", b"vtktypeuint64": "u8",
+    b"vtktypefloat32": "f4", b"vtktypefloat64": "f8",
+}
+VTU_TYPES = {
+    b"Int8": "i1", b"UInt8": "u1", b"Int16": "i2", b"UInt16": "u2",
+    b"Int32": "i4", b"UInt32": "u4", b"Int64": "i8", b"UInt64": "u8",
+    b"Float32": "f4", b"Float64": "f8",
+}
+
+# On-disk cache of the submeshes, keyed by the mesh file and the selection
+SUBMESH_CACHE_DIR = os.environ.get("PODUQNN_MESH_CACHE",
+                                   os.path.join(JIT_CACHE_DIR, "submesh"))
+
+# Binary copies of the text solutions, one per run directory
+TXT_CACHE_DIR = os.environ.get("PODUQNN_TXT_CACHE",
+                               os.path.join(JIT_CACHE_DIR, "txt"))
+TXT_PREFIX = "0_sol_nodes_"
+TXT_CACHE_VERSION = 2
+
+# Text solutions copies already opened, keyed by run directory
+_TXT_CACHES = {}
+
+# Point data layouts already parsed, keyed by (extension, file size)
+_VTK_LAYOUTS = {}
 
 
 def create_linear_mesh(x_min, x_max, n_x,
@@ -54,105 +97,595 @@ def natural_keys(text):
     return [ atoi(c) for c in re.split(r'(\d+)', text) ]
 
 
-def read_vtk_conf(filename, sel=None):
+def extract_submesh(points, cells, sel):
+    """Keep the cells sel, returning their points, remapped cells and points_idx."""
+    cells = cells[sel]
+    # Flagging the used points, their new index being their rank among them
+    used = np.zeros(points.shape[0], dtype=bool)
+    used[cells.ravel()] = True
+    points_idx = np.flatnonzero(used)
+    remap = np.cumsum(used) - 1
+    return (np.array(points[points_idx], dtype=np.float64),
+            remap[cells].astype(cells.dtype), points_idx)
+
+
+def submesh_path(filename, sel, cache_dir):
+    """Return the cache file of a selection, invalidated if the mesh changes."""
+    stat = os.stat(filename)
+    key = hashlib.blake2b(digest_size=10)
+    key.update(f"{os.path.abspath(filename)}:{stat.st_size}:{stat.st_mtime_ns}:".encode())
+    if sel is not None:
+        sel = np.ascontiguousarray(sel)
+        key.update(f"{sel.dtype.str}:{sel.shape}".encode())
+        key.update(sel.tobytes())
+    return os.path.join(cache_dir, f"submesh_{key.hexdigest()}.npz")
+
+
+def read_vtk_conf(filename, sel=None, cache_dir=SUBMESH_CACHE_DIR):
+    """Read the mesh of filename, restricted to the cells sel if given, the
+    (sub)mesh being cached in cache_dir (None to disable), keyed by selection."""
+    path = None
+    if cache_dir is not None:
+        path = submesh_path(filename, sel, cache_dir)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                points_idx = data["points_idx"] if sel is not None else None
+                return data["points"], data["cells"], points_idx
+
+    import meshio
     vtk = meshio.read(filename)
     # Getting the cells array
     cells = vtk.cells[0].data
     points = vtk.points
 
+    points_idx = None
     if sel is not None:
-        # Keeping only the selected cells
-        cells = cells[sel]
-        # Getting a unique, sorted list of the associated points
-        points_idx = np.unique(cells.flatten())
-        points = np.zeros((points_idx.shape[0], vtk.points.shape[1]))
-        for i, pt in enumerate(points_idx.tolist()):
-            points[i] = vtk.points[pt]
-            cells[cells == pt] = i
-        return points, cells, points_idx
-
-    return points, cells, None
+        # Keeping only the selected cells, and their points
+        points, cells, points_idx = extract_submesh(points, cells, sel)
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Atomic write, as concurrent jobs may share the cache
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, points=points, cells=cells,
+                 points_idx=np.zeros(0, dtype=int) if points_idx is None else points_idx)
+        os.replace(tmp_path, path)
+    return points, cells, points_idx
+
+
+def parse_vtk_layout(buf, keys):
+    """Locate the point data arrays of a legacy VTK file.
+
+    Records are (header position, header, kind, start, length, dtype, count,
+    blocks header dtype), the header bytes telling if another file shares the
+    same layout.
+    """
+    header = buf.split(b"\n", 4)
+    pos = sum(len(line) + 1 for line in header[:4])
+    if header[2].strip().upper() != b"BINARY":
+        return parse_vtk_ascii_layout(buf, keys, pos)
+
+    def next_words():
+        nonlocal pos
+        while pos < len(buf):
+            e = buf.find(b"\n", pos)
+            e = len(buf) if e < 0 else e
+            words, pos = buf[pos:e].split(), e + 1
+            if len(words) > 0:
+                return words
+        return []
+
+    layout = {}
+    n, point_data = 0, False
+    while pos < len(buf):
+        hdr_pos = pos
+        words = next_words()
+        if len(words) == 0:
+            break
+        kw, count, vtk_type = words[0].upper(), 0, None
+        if kw == b"POINTS":
+            count, vtk_type = 3 * int(words[1]), words[2]
+        elif kw == b"CELLS":
+            if buf.startswith(b"OFFSETS", pos):
+                # Version 5 files, with offsets and connectivity arrays
+                offsets_type = next_words()[1]
+                pos += int(words[1]) * np.dtype(VTK_TYPES[offsets_type]).itemsize
+                count, vtk_type = int(words[2]), next_words()[1]
+            else:
+                count, vtk_type = int(words[2]), b"int"
+        elif kw == b"CELL_TYPES":
+            count, vtk_type = int(words[1]), b"int"
+        elif kw in (b"POINT_DATA", b"CELL_DATA"):
+            n, point_data = int(words[1]), kw == b"POINT_DATA"
+            continue
+        elif kw == b"SCALARS":
+            n_comp = int(words[3]) if len(words) > 3 else 1
+            if buf.startswith(b"LOOKUP_TABLE", pos):
+                next_words()
+            count, vtk_type = n * n_comp, words[2]
+        elif kw in (b"VECTORS", b"NORMALS"):
+            count, vtk_type = 3 * n, words[2]
+        elif kw == b"TENSORS":
+            count, vtk_type = 9 * n, words[2]
+        elif kw == b"FIELD":
+            for _ in range(int(words[2])):
+                hdr_pos = pos
+                name, n_comp, n_tuples, vtk_type = next_words()[:4]
+                dtype = ">" + VTK_TYPES[vtk_type]
+                length = int(n_comp) * int(n_tuples) * np.dtype(dtype).itemsize
+                if point_data:
+                    layout[name.decode()] = (hdr_pos, buf[hdr_pos:pos], "raw", pos,
+                                             length, dtype, -1, None)
+                pos += length
+            continue
+        elif kw == b"METADATA":
+            # Skipping up to the next blank line
+            pos = buf.find(b"\n\n", pos) + 2
+            continue
+        else:
+            raise ValueError(f"Unsupported VTK section: {kw.decode()}")
+
+        dtype = ">" + VTK_TYPES[vtk_type]
+        length = count * np.dtype(dtype).itemsize
+        if point_data:
+            layout[words[1].decode()] = (hdr_pos, buf[hdr_pos:pos], "raw", pos,
+                                         length, dtype, -1, None)
+        pos += length
+    return layout
+
+
+def parse_vtk_ascii_layout(buf, keys, pos=0):
+    """Locate the point data arrays keys of a legacy ASCII VTK file."""
+    p = buf.find(b"\nPOINT_DATA", pos)
+    if p < 0:
+        return {}
+    e = buf.find(b"\nCELL_DATA", p)
+    e = len(buf) if e < 0 or e < p else e
+    n = int(buf[p:buf.find(b"\n", p + 1)].split()[1])
+
+    layout = {}
+    for key in keys:
+        name = re.escape(str(key).encode())
+        m = re.compile(rb"\n(SCALARS|VECTORS|NORMALS) " + name + rb" (\w+)( \d+)?\s*?\n"
+                       rb"(LOOKUP_TABLE \S+\s*?\n)?").search(buf, p, e)
+        if m is not None:
+            n_comp = 1 if m.group(1) == b"SCALARS" else 3
+            n_comp = int(m.group(3)) if m.group(3) else n_comp
+            vtk_type, n_tuples = m.group(2), n
+        else:
+            m = re.compile(rb"\n" + name + rb" (\d+) (\d+) (\w+)\s*?\n").search(buf, p, e)
+            if m is None:
+                continue
+            n_comp, n_tuples, vtk_type = int(m.group(1)), int(m.group(2)), m.group(3)
+        layout[str(key)] = (m.start() + 1, buf[m.start() + 1:m.end()], "ascii", m.end(),
+                            e - m.end(), VTK_TYPES[vtk_type], n_tuples * n_comp, None)
+    return layout
+
+
+def parse_vtu_layout(buf):
+    """Locate the point data arrays of an XML VTK (.vtu) file."""
+    app = buf.find(b"<AppendedData")
+    head = buf if app < 0 else buf[:app]
+    attrs = dict(re.findall(rb'(\w+)="([^"]*)"', re.search(rb"<VTKFile[^>]*>", head).group()))
+    order = ">" if attrs.get(b"byte_order") == b"BigEndian" else "<"
+    h_type = order + VTU_TYPES[attrs.get(b"header_type", b"UInt32")]
+    h_size = np.dtype(h_type).itemsize
+    compressor = attrs.get(b"compressor")
+    if compressor not in (None, b"vtkZLibDataCompressor"):
+        raise ValueError(f"Unsupported VTU compressor: {compressor.decode()}")
+    app_start = 0
+    if app >= 0:
+        if b'encoding="raw"' not in buf[app:buf.index(b">", app)]:
+            raise ValueError("Unsupported VTU appended data encoding")
+        app_start = buf.index(b"_", app) + 1
+
+    layout = {}
+    section = re.search(rb"<PointData[^>]*>(.*?)</PointData>", head, re.S)
+    if section is None:
+        return layout
+    for m in re.finditer(rb"<DataArray([^>]*?)(?:/>|>(.*?)</DataArray>)",
+                         section.group(1), re.S):
+        hdr_pos = section.start(1) + m.start()
+        hdr = buf[hdr_pos:section.start(1) + (m.end() if m.group(2) is None else m.start(2))]
+        attrs = dict(re.findall(rb'(\w+)="([^"]*)"', m.group(1)))
+        dtype = order + VTU_TYPES[attrs[b"type"]]
+        fmt = attrs.get(b"format", b"ascii")
+        if fmt == b"appended":
+            start = app_start + int(attrs[b"offset"])
+            if compressor is None:
+                length = int(np.frombuffer(buf, h_type, 1, start)[0])
+                record = ("raw", start + h_size, length)
+            else:
+                n_b = int(np.frombuffer(buf, h_type, 1, start)[0])
+                sizes = np.frombuffer(buf, h_type, 3 + n_b, start)
+                record = ("zraw", start, (3 + n_b) * h_size + int(sizes[3:].sum()))
+        else:
+            text = m.group(2)
+            start = hdr_pos + len(hdr) + len(text) - len(text.lstrip())
+            kind = "ascii"
+            if fmt == b"binary":
+                kind = "b64" if compressor is None else "zb64"
+            record = (kind, start, len(text.strip()))
+        layout[attrs[b"Name"].decode()] = (hdr_pos, hdr) + record + (dtype, -1, h_type)
+    return layout
+
+
+def decode_vtk_array(chunk, record):
+    """Decode the raw bytes chunk of an array located by record."""
+    kind, dtype, count, h_type = record[2], record[5], record[6], record[7]
+    if kind == "raw":
+        return np.frombuffer(chunk, dtype)
+    if kind == "ascii":
+        return np.fromstring(chunk, dtype=dtype, sep=" ", count=count)
+    # XML binary data, prefixed by a header of h_type integers
+    h_size = np.dtype(h_type).itemsize
+    if kind == "b64":
+        raw = base64.b64decode(chunk)
+        return np.frombuffer(raw[h_size:h_size + int(np.frombuffer(raw, h_type, 1)[0])], dtype)
+    if kind == "zb64":
+        # The blocks header is encoded apart from the data
+        n_b = int(np.frombuffer(base64.b64decode(chunk[:4*-(-h_size // 3)]), h_type, 1)[0])
+        n_chars = 4*-(-(3 + n_b) * h_size // 3)
+        sizes = np.frombuffer(base64.b64decode(chunk[:n_chars]), h_type, 3 + n_b)
+        data = base64.b64decode(chunk[n_chars:])
+    else:
+        n_b = int(np.frombuffer(chunk, h_type, 1)[0])
+        sizes = np.frombuffer(chunk, h_type, 3 + n_b)
+        data = chunk[(3 + n_b) * h_size:]
+    ends = np.cumsum(sizes[3:])
+    raw = b"".join(zlib.decompress(data[e - c:e]) for e, c in zip(ends, sizes[3:]))
+    return np.frombuffer(raw, dtype)
+
+
+def read_point_data(filename, keys):
+    """Read the point data arrays keys only, parsing the layout once per file size.
+
+    Files of the same size are checked to share the cached layout by comparing
+    the arrays headers, and then only the requested bytes are read.
+    """
+    keys = [str(key) for key in keys]
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in (".vtk", ".vtu"):
+        raise ValueError(f"Unsupported VTK extension: {ext}")
+    size = os.path.getsize(filename)
+    with open(filename, "rb") as f:
+        layout = _VTK_LAYOUTS.get((ext, size), {})
+        chunks = []
+        for key in keys:
+            if key not in layout:
+                break
+            record = layout[key]
+            f.seek(record[0])
+            if f.read(len(record[1])) != record[1]:
+                break
+            f.seek(record[3])
+            chunks.append(f.read(record[4]))
+        else:
+            return np.stack([decode_vtk_array(chunk, layout[key]).astype(np.float64)
+                             for chunk, key in zip(chunks, keys)])
+
+        # Different layout, parsing this file's one
+        f.seek(0)
+        buf = f.read()
+    layout = parse_vtu_layout(buf) if ext == ".vtu" else parse_vtk_layout(buf, keys)
+    _VTK_LAYOUTS[(ext, size)] = layout
+    return np.stack([decode_vtk_array(buf[layout[key][3]:layout[key][3]+layout[key][4]],
+                                      layout[key]).astype(np.float64)
+                     for key in keys])
 
 
 def read_vtk_data(filename, idx, points_idx=None):
-    vtk = meshio.read(filename)
-    points = vtk.points
+    try:
+        U = read_point_data(filename, idx)
+    except (ValueError, KeyError, zlib.error):
+        # Falling back to meshio for what the direct reader doesn't handle
+        import meshio
+        vtk = meshio.read(filename)
+        U = np.stack([np.asarray(vtk.point_data[key], dtype=np.float64).ravel()
+                      for key in idx])
     if points_idx is not None:
-        points = points[points_idx]
-    U = np.zeros((points.shape[0], len(idx)))
-    for i, key in enumerate(idx):
-        data = vtk.point_data[key]
-        if points_idx is not None:
-            data = data[points_idx]
-        U[:, i] = data
-    return U.T
-
-
-def read_txt_data(filename, idx, points_idx=None):
-    U = pd.read_table(filename, header=None).to_numpy()
+        U = U[:, points_idx]
+    return U
+
+
+def parse_txt(filename):
+    """Parse a tab-separated text solution, with pandas' C parser."""
+    import pandas as pd
+    return pd.read_csv(filename, sep="\t", header=None, dtype=np.float64,
+                       na_filter=False, engine="c").to_numpy()
+
+
+def txt_cache_paths(dirname, cache_dir):
+    """Return the (array, index) cache files of a run directory."""
+    key = hashlib.blake2b(os.path.abspath(dirname).encode(), digest_size=10)
+    path = os.path.join(cache_dir, f"txt_{key.hexdigest()}")
+    return path + ".npy", path + ".json"
+
+
+def list_txt_stats(dirname):
+    """Return the [name, size, mtime] of the text solutions of a run directory."""
+    names = sorted((name for name in os.listdir(dirname)
+                    if name.startswith(TXT_PREFIX) and name.endswith(".txt")),
+                   key=natural_keys)
+    stats = [os.stat(os.path.join(dirname, name)) for name in names]
+    return [[name, stat.st_size, stat.st_mtime_ns] for name, stat in zip(names, stats)]
+
+
+def load_txt_index(index_path):
+    """Return the index of a converted run directory, or None if outdated."""
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "r") as f:
+        index = json.load(f)
+    if not isinstance(index, dict) or index.get("version") != TXT_CACHE_VERSION:
+        return None
+    return index
+
+
+def convert_txt_dir(dirname, cache_dir=TXT_CACHE_DIR, pool=None):
+    """Convert the text solutions of a run directory into a flat array, unless its
+    copy is up to date. Return whether it was converted.
+
+    The index holds the shape of each file, as meshes may differ between them.
+    """
+    stats = list_txt_stats(dirname)
+    path, index_path = txt_cache_paths(dirname, cache_dir)
+    if len(stats) == 0:
+        return False
+    index = load_txt_index(index_path)
+    if index is not None and index["stats"] == stats:
+        return False
+
+    paths = [os.path.join(dirname, name) for name, _, _ in stats]
+    arrays = list(map(parse_txt, paths) if pool is None else
+                  pool.imap(parse_txt, paths, chunksize=4))
+    os.makedirs(cache_dir, exist_ok=True)
+    # Atomic writes, the index being written last
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, np.concatenate([a.ravel() for a in arrays]))
+    os.replace(tmp_path, path)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": TXT_CACHE_VERSION, "stats": stats,
+                   "shapes": [list(a.shape) for a in arrays]}, f)
+    os.replace(tmp_path, index_path)
+    _TXT_CACHES.pop(os.path.abspath(dirname), None)
+    return True
+
+
+def convert_txt_files(x_u_mesh_path, picked_idx, cache_dir=TXT_CACHE_DIR,
+                      n_workers=None):
+    """Convert the text solutions of the picked runs, parsing them from a pool."""
+    dirs = [os.path.join(x_u_mesh_path, f"multi_{idx+1}") for idx in picked_idx]
+    dirs = [dirname for dirname in dirs if os.path.isdir(dirname)]
+    pool = None
+    if n_workers != 1:
+        pool = process_pool(n_workers)
+    try:
+        n_converted = sum(convert_txt_dir(dirname, cache_dir, pool)
+                          for dirname in tqdm(dirs))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    print(f"Converted {n_converted} runs to {cache_dir}")
+
+
+def load_txt_cached(filename, cache_dir=TXT_CACHE_DIR):
+    """Return the converted copy of a text solution, or None if it's outdated."""
+    dirname, name = os.path.split(os.path.abspath(filename))
+    for _ in range(2):
+        if dirname not in _TXT_CACHES:
+            path, index_path = txt_cache_paths(dirname, cache_dir)
+            index = load_txt_index(index_path)
+            if index is None:
+                return None
+            # Position of each file in the flat array
+            files, offset = {}, 0
+            for (name_j, size, mtime), shape in zip(index["stats"], index["shapes"]):
+                files[name_j] = (offset, shape, [size, mtime])
+                offset += int(np.prod(shape))
+            _TXT_CACHES[dirname] = files, np.load(path, mmap_mode="r")
+        files, array = _TXT_CACHES[dirname]
+        if name in files:
+            stat = os.stat(filename)
+            offset, shape, (size, mtime) = files[name]
+            if [stat.st_size, stat.st_mtime_ns] == [size, mtime]:
+                return array[offset:offset + int(np.prod(shape))].reshape(shape)
+        # Checking once if the copy was updated since it was opened
+        del _TXT_CACHES[dirname]
+    return None
+
+
+def read_txt_data(filename, idx, points_idx=None, cache_dir=TXT_CACHE_DIR):
+    U = None
+    if cache_dir is not None:
+        U = load_txt_cached(filename, cache_dir)
+    if U is None:
+        U = parse_txt(filename)
     if points_idx is not None:
         U = U[points_idx]
-    return U.T
+    return np.asarray(U).T
+
+
+def list_multi_files(n_t, picked_idx, x_u_mesh_path):
+    """Return the {(i, j): path} VTK files of each sample i and time step j."""
+    files_ij = {}
+    for i, idx in enumerate(picked_idx):
+        dirname = os.path.join(x_u_mesh_path, f"multi_{idx+1}")
+        # Get files of directories
+        for sub_root, _, files in os.walk(dirname):
+            # Sorting and picking the righ ones
+            picked_files = filter(lambda file: file.startswith("0_FV-Paraview"), files)
+            picked_files = sorted(picked_files, key=natural_keys)
+            if n_t == 1:
+                picked_files = picked_files[-1:]
+            for j, filename in enumerate(picked_files[:n_t]):
+                files_ij[(i, j)] = os.path.join(sub_root, filename)
+    return files_ij
+
+
+def init_reader(state):
+    """Set the state of a reading pool worker."""
+    _READER.update(state)
+
+
+def read_worker(item):
+    """Parse a solution file into its (time step, slot) place in the shared U."""
+    slot, j, path = item
+    r = _READER
+    if r["txt"]:
+        path = os.path.join(os.path.dirname(path), f"0_sol_nodes_{j}.txt")
+    r["U"][:, :, j, slot] = r["read_data"](path, r["qties"], r["points_idx"])
+    return slot
+
+
+def read_multi_files(n_s, n_t, files_ij, qties, sel=None, pod=None, txt=False,
+                     n_workers=None, prefetch=PREFETCH_SAMPLES, store=None,
+                     X_v=None, keys=None, txt_cache_dir=TXT_CACHE_DIR):
+    """Read the solutions from a pool of processes, into a shared U.
+
+    With a pod, only prefetch samples are held at once, fed in order. With a
+    store, the samples keys missing from it are appended, and U is its view of
+    the keys, in their order.
+    """
+    samples = list(range(n_s))
+    if store is not None:
+        keys = samples if keys is None else [int(key) for key in keys]
+        samples = store.missing(keys)
+    if len(files_ij) == 0 or (store is not None and len(samples) == 0 and
+                              store.x_mesh is not None):
+        if store is None:
+            return None, None, None, None
+        # Everything was ingested already
+        print(f"All {n_s} samples are in {store.path}")
+        x_mesh, connectivity, points_idx = store.x_mesh, store.connectivity, None
+        if sel is not None and len(files_ij) > 0:
+            x_mesh, connectivity, points_idx = read_vtk_conf(files_ij[min(files_ij)], sel)
+        return stored_outputs(store.select(keys), n_t, pod, x_mesh, connectivity,
+                              points_idx)
+
+    x_mesh, connectivity, points_idx = read_vtk_conf(files_ij[min(files_ij)], sel)
+    if store is not None:
+        store.set_mesh(x_mesh, connectivity)
+    # Only a few samples at a time are needed when streaming
+    n_slots = len(samples)
+    if pod is not None or store is not None:
+        n_slots = max(min(prefetch, len(samples)), 1)
+    U = shared_zeros((len(qties), x_mesh.shape[0], n_t, n_slots))
+
+    # Forked workers inherit the state, the shared U included
+    state = dict(U=U, qties=qties, points_idx=points_idx, txt=txt,
+                 read_data=partial(read_txt_data, cache_dir=txt_cache_dir)
+                 if txt else read_vtk_data)
+    pool = None
+    if n_workers != 1:
+        pool = process_pool(n_workers, init_reader, (state,))
+    if pool is None:
+        init_reader(state)
+    try:
+        todo = set(samples)
+        progress = tqdm(total=sum(1 for i, _ in files_ij if i in todo))
+        for w in range(0, len(samples), n_slots):
+            window = samples[w:w+n_slots]
+            slots = {i: slot for slot, i in enumerate(window)}
+            items = [(slots[i], j, path) for (i, j), path in sorted(files_ij.items())
+                     if i in slots]
+            if pod is not None or store is not None:
+                U[:] = 0.
+            # Each file has its own place in U, the completion order doesn't matter
+            results = map(read_worker, items) if pool is None else \
+                pool.imap_unordered(read_worker, items, chunksize=4)
+            for _ in results:
+                progress.update()
+
+            for i, slot in slots.items():
+                if (i, 0) not in files_ij:
+                    continue
+                if store is not None:
+                    store.append(U[..., slot], X_v[n_t*i:n_t*(i+1)], keys[i])
+                elif pod is not None:
+                    pod.update(U[..., slot].reshape((-1, n_t)))
+        progress.close()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _READER.clear()
+
+    if store is not None:
+        return stored_outputs(store.select(keys), n_t, pod, x_mesh, connectivity,
+                              points_idx)
+    if pod is not None:
+        U = None
+    elif n_t == 1:
+        # Flattening the time dimension in steady case
+        U = U[:, :, 0, :]
+    return x_mesh, connectivity, U, points_idx
+
+
+def stored_outputs(store, n_t, pod, x_mesh, connectivity, points_idx):
+    """Return the readers outputs from a store selection, feeding pod in its order."""
+    U = store.U
+    if pod is not None:
+        for U_i in store.iter_samples():
+            pod.update(U_i)
+        U = None
+    elif n_t == 1:
+        U = U[:, :, 0, :]
+    return x_mesh, connectivity, U, points_idx
+
+
+def multi_inputs(mu, n_s, n_t, d_t, n_p):
+    """Return the regression inputs (t, mu) of the samples mu."""
+    t = np.arange(n_t)*d_t
+    tT = t.reshape((n_t, 1))
+    X_v = np.zeros((n_s*n_t, n_p))
+    for i, mu_i in enumerate(mu):
+        if n_t == 1:
+            X_v[i] = mu_i
+        else:
+            X_v[n_t * i:n_t* (i+1)] = np.hstack((tT, np.ones_like(tT)*mu_i))
+    return X_v
 
 
 def read_multi_space_sol_input_mesh(n_s, n_t, d_t, picked_idx, qties, x_u_mesh_path,
                                     mu_mesh_path, mu_mesh_idx,
-                                    sel=None):
-    x_mesh = None
-    U = None
-    connectivity = None
+                                    sel=None, pod=None, n_workers=None,
+                                    prefetch=PREFETCH_SAMPLES, store=None):
+    """Read the VTK solutions, feeding each sample to pod if given (U isn't kept).
 
+    With a SnapshotStore, only the samples it misses are read, and U, X_v are
+    its views of picked_idx.
+    """
     # Number of parameters, 1+others
     n_p = len(mu_mesh_idx)
     if n_t > 1:
         n_p += 1
     mu = np.loadtxt(mu_mesh_path, skiprows=1)
     mu = mu[picked_idx, mu_mesh_idx]
-    t = np.arange(n_t)*d_t
-    tT = t.reshape((n_t, 1))
-    X_v = np.zeros((n_s*n_t, n_p))
+    X_v = multi_inputs(mu, n_s, n_t, d_t, n_p)
 
-    first = True
     # Getting data
     print(f"Loading {n_s} samples...")
-    for i, mu_i in enumerate(tqdm(mu)):
-        dirname = os.path.join(x_u_mesh_path, f"multi_{picked_idx[i]+1}")
-        # Get files of directories
-        for sub_root, _, files in os.walk(dirname):
-            # Sorting and picking the righ ones
-            picked_files = filter(lambda file: file.startswith("0_FV-Paraview"), files)
-            picked_files = sorted(picked_files, key=natural_keys)
-            if n_t == 1:
-                picked_files = picked_files[-1:]
-            # For filtered/sorted files
-            for j, filename in enumerate(picked_files[:n_t]):
-                # First sample
-                if first:
-                    first = False
-                    samplename = os.path.join(sub_root, filename)
-                    x_mesh, connectivity, points_idx = read_vtk_conf(samplename, sel)
-                    U = np.zeros((len(qties), x_mesh.shape[0], n_t, n_s))
-
-                # Parse the file and append
-                U_ij = read_vtk_data(os.path.join(sub_root, filename), qties, points_idx)
-                U[:, :, j, i] = U_ij
-
-            if n_t == 1:
-                X_v[i] = mu_i
-            else:
-                X_v[n_t * i:n_t* (i+1)] = np.hstack((tT, np.ones_like(tT)*mu_i))
-    if n_t == 1:
-        # Flattening the time dimension in steady case
-        U = U[:, :, 0, :]
+    files_ij = list_multi_files(n_t, picked_idx, x_u_mesh_path)
+    x_mesh, connectivity, U, _ = read_multi_files(n_s, n_t, files_ij, qties, sel,
+                                                  pod, False, n_workers, prefetch,
+                                                  store, X_v, picked_idx)
+    if store is not None:
+        X_v = store.select([int(idx) for idx in picked_idx]).X_v
     return x_mesh, connectivity, X_v, U
 
 def read_multi_space_sol_input_mesh_txt(n_s, n_t, d_t, picked_idx, qties, x_u_mesh_path,
                                     mu_mesh_path, mu_mesh_idx,
-                                    sel=None):
-    x_mesh = None
-    U = None
-    connectivity = None
-
+                                    sel=None, pod=None, n_workers=None,
+                                    prefetch=PREFETCH_SAMPLES, store=None,
+                                    cache_dir=TXT_CACHE_DIR):
+    """Read the TXT solutions, feeding each sample to pod if given (U isn't kept).
+
+    With a SnapshotStore, only the samples it misses are read, and U, X_v are
+    its views of picked_idx. The text files are first converted to binary copies in
+    cache_dir (None to parse them every time), refreshed if they change.
+    """
     # Number of parameters, 1+others
     n_p = len(mu_mesh_idx)
     if n_t > 1:
@@ -160,43 +693,21 @@ def read_multi_space_sol_input_mesh_txt(n_s, n_t, d_t, picked_idx, qties, x_u_me
     mu = np.loadtxt(mu_mesh_path, skiprows=1)
     mu = mu[picked_idx, mu_mesh_idx]
     print(mu)
-    t = np.arange(n_t)*d_t
-    tT = t.reshape((n_t, 1))
-    X_v = np.zeros((n_s*n_t, n_p))
+    X_v = multi_inputs(mu, n_s, n_t, d_t, n_p)
 
-    first = True
     # Getting data
     print(f"Loading {n_s} samples...")
-    for i, mu_i in enumerate(tqdm(mu)):
-        dirname = os.path.join(x_u_mesh_path, f"multi_{picked_idx[i]+1}")
-        # Get files of directories
-        for sub_root, _, files in os.walk(dirname):
-            # Sorting and picking the righ ones
-            picked_files = filter(lambda file: file.startswith("0_FV-Paraview"), files)
-            picked_files = sorted(picked_files, key=natural_keys)
-            if n_t == 1:
-                picked_files = picked_files[-1:]
-            # For filtered/sorted files
-            for j, filename in enumerate(picked_files[:n_t]):
-                # First sample
-                if first:
-                    first = False
-                    samplename = os.path.join(sub_root, filename)
-                    x_mesh, connectivity, points_idx = read_vtk_conf(samplename, sel)
-                    U = np.zeros((len(qties), x_mesh.shape[0], n_t, n_s))
-
-                # Parse the file and append
-                filename = f"0_sol_nodes_{j}.txt"
-                U_ij = read_txt_data(os.path.join(sub_root, filename), qties, points_idx)
-                U[:, :, j, i] = U_ij
-
-            if n_t == 1:
-                X_v[i] = mu_i
-            else:
-                X_v[n_t * i:n_t* (i+1)] = np.hstack((tT, np.ones_like(tT)*mu_i))
-    if n_t == 1:
-        # Flattening the time dimension in steady case
-        U = U[:, :, 0, :]
+    files_ij = list_multi_files(n_t, picked_idx, x_u_mesh_path)
+    if cache_dir is not None:
+        todo = picked_idx if store is None else \
+            [picked_idx[i] for i in store.missing([int(idx) for idx in picked_idx])]
+        convert_txt_files(x_u_mesh_path, todo, cache_dir, n_workers)
+    x_mesh, connectivity, U, points_idx = read_multi_files(n_s, n_t, files_ij, qties,
+                                                           sel, pod, True, n_workers,
+                                                           prefetch, store, X_v,
+                                                           picked_idx, cache_dir)
+    if store is not None:
+        X_v = store.select([int(idx) for idx in picked_idx]).X_v
     return x_mesh, connectivity, X_v, U, points_idx
 
 
@@ -206,6 +717,7 @@ def read_space_sol_input_mesh(n_s, idx, x_u_mesh_path, mu_mesh_path):
     X_v = np.loadtxt(mu_mesh_path)[:, 0:1]
 
     print("Loading " + x_u_mesh_path + "")
+    import pandas as pd
     x_u_mesh = pd.read_table(x_u_mesh_path,
                              header=None,
                              delim_whitespace=True).to_numpy()
@@ -1,10 +1,10 @@
 """Metrics functions to output results."""
 import numpy as np
-import tensorflow as tf
 from numpy.linalg import norm
 
 
 def mse(v, v_pred):
+    import tensorflow as tf
     return tf.reduce_mean(tf.square(v - v_pred))
 
 
@@ -30,6 +30,16 @@ def re_s(U, U_pred, div_max=False):
     return err / n_s
 
 
+def re_s_chunks(chunks, div_max=False):
+    """Return relative error over an iterable of (U, U_pred) column chunks."""
+    err = 0.
+    n_s = 0
+    for U, U_pred in chunks:
+        err += re_s(U, U_pred, div_max) * U.shape[1]
+        n_s += U.shape[1]
+    return err / n_s
+
+
 def re_mean_std(U_s, U_pred_s):
     """Define the relative error metric."""
     U_pred_mean, U_mean = np.mean(U_pred_s, axis=-1), np.mean(U_s, axis=-1)
@@ -1,5 +1,7 @@
 """Utililities for plotting and saving results."""
 
+import importlib.abc
+import importlib.util
 import os
 import platform
 import sys
@@ -7,9 +9,6 @@ import subprocess
 import yaml
 import numpy as np
 from datetime import datetime
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import matplotlib.font_manager
 
 
 # From https://github.com/maziarraissi/PINNs (MIT License, maziarraissi)
@@ -21,6 +20,7 @@ def figsize(n_plot_x, n_plot_y, scale=1.):
     fig_width = n_plot_y*plot_width_pt*inches_per_pt*scale    # width in inches
     fig_height = n_plot_x*plot_height_pt*inches_per_pt*scale    # width in inches
     return [fig_width, fig_height]
+
 pgf_with_latex = {                      # setup matplotlib to use latex for output
     "pgf.texsystem": "pdflatex",        # change this if using xetex or lautex
     "text.usetex": True,                # use LaTeX to write all text
@@ -33,7 +33,6 @@ pgf_with_latex = {                      # setup matplotlib to use latex for outp
     "legend.fontsize": 8,               # Make the legend/label fonts a little smaller
     "xtick.labelsize": 8,
     "ytick.labelsize": 8,
-    "figure.figsize": figsize(1, 1),     # default fig size of 0.9 textwidth
     "pgf.preamble": [
         r"\usepackage[utf8x]{inputenc}",    # use utf8 fonts becasue your computer can handle it :)
         r"\usepackage{siunitx}",    # use utf8 fonts becasue your computer can handle it :)
@@ -41,7 +40,46 @@ pgf_with_latex = {                      # setup matplotlib to use latex for outp
         r"\usepackage[T1]{fontenc}",        # plots will be generated using this preamble
         ]
     }
-mpl.rcParams.update(pgf_with_latex)
+
+# Whether matplotlib is set up yet, done once it's imported rather than here
+_STYLE = {"latex": False}
+
+
+def set_latex_style():
+    """Import matplotlib and set it up to use LaTeX, once."""
+    if _STYLE["latex"]:
+        return
+    _STYLE["latex"] = True
+    import matplotlib as mpl
+    import matplotlib.font_manager  # pylint: disable=unused-import
+    mpl.rcParams.update(pgf_with_latex)
+    mpl.rcParams["figure.figsize"] = figsize(1, 1)     # default fig size of 0.9 textwidth
+
+
+class LatexStyleHook(importlib.abc.MetaPathFinder):
+    """Import hook setting the LaTeX style up right after matplotlib is imported,
+    whoever imports it."""
+    def find_spec(self, name, path, target=None):
+        if name != "matplotlib":
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        if spec is None or spec.loader is None:
+            return spec
+        exec_module = spec.loader.exec_module
+
+        def exec_and_style(module):
+            exec_module(module)
+            set_latex_style()
+        spec.loader.exec_module = exec_and_style
+        return spec
+
+
+if "matplotlib" in sys.modules:
+    set_latex_style()
+elif not any(isinstance(hook, LatexStyleHook) for hook in sys.meta_path):
+    sys.meta_path.insert(0, LatexStyleHook())
+
 
 def genresultdir():
     """Generate the results dir name."""
@@ -82,6 +120,8 @@ def openPdfGraph(filename):
 
 def savefig(filename, tight_box=True):
     """Saves current matplotlib plot in an image and a pdf file."""
+    set_latex_style()
+    import matplotlib.pyplot as plt
 
     if tight_box:
         plt.savefig('{}.png'.format(filename), bbox_inches='tight', pad_inches=0.05)
@@ -1,9 +1,24 @@
 """Module to handle Proper Orthogonal Decomposition tasks."""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from numba import njit
 
+POD_AUTO = "auto"
+POD_SVD = "svd"
+POD_SNAPSHOTS = "snapshots"
+POD_RANDOMIZED = "randomized"
+POD_TSQR = "tsqr"
 
-@njit(parallel=False)
+# Aspect ratio n_h/n_st above which the method of snapshots is picked
+SNAPSHOTS_RATIO = 10
+# Number of values held by a row block of U when forming the Gram matrix
+BLOCK_VALUES = 2**23
+# Energy fraction left out of the modes stored in a cached POD spectrum
+SPECTRUM_EPS = 1e-10
+
+
+@njit(parallel=False, nogil=True, cache=True)
 def perform_pod(U, eps=0., n_L=0, verbose=True):
     """POD algorithmm."""
     # Number of DOFs
@@ -38,31 +53,360 @@ def perform_pod(U, eps=0., n_L=0, verbose=True):
         print("Contructing the reduced bases V")
 
     U = np.ascontiguousarray(U)
+    Z_trunc = np.ascontiguousarray(Z[:, :n_L])
 
-    V = np.zeros((n_h, n_L))
-    for i in range(n_L):
-        Z_i = np.ascontiguousarray(Z[:, i])
-        V[:, i] = U.dot(Z_i) / np.sqrt(lambdas_trunc[i])
+    V = U.dot(Z_trunc) / np.sqrt(lambdas_trunc)
 
     return np.ascontiguousarray(V)
 
 
-# @njit(parallel=False)
-def perform_fast_pod(U, eps, eps_init):
+def merge_pods(parts, eps=0.):
+    """Merge (Phi, D, energy) partial SVDs into the SVD of their concatenation."""
+    # [U_1, U_2] has the same left vectors and singular values as [Phi_1.D_1, Phi_2.D_2]
+    Phi, D, _ = np.linalg.svd(np.hstack([Phi_k * D_k for Phi_k, D_k, _ in parts]),
+                              full_matrices=False)
+    energy = sum(energy_k for _, _, energy_k in parts)
+
+    # Dropping the modes carrying the last eps fraction of the energy
+    ratios = np.cumsum(D**2) / energy
+    n_r = np.searchsorted(ratios, 1 - eps) + 1
+    n_r = min(n_r, max(np.count_nonzero(D > D[0] * np.finfo(D.dtype).eps), 1))
+    return Phi[:, :n_r], D[:n_r], energy
+
+
+def perform_fast_pod(U, eps, eps_init, n_workers=None, merge_ratio=0.1):
     """Two-step version of POD algorithm."""
     print("Performing initial time-trajectory POD")
     # Number of snapshots n_s x Number of space nodes (n_x * n_y * ...)
     n_s = U.shape[-1]
 
-    T_list = []
-    for k in range(n_s):
-        U_k = U[:, :, k]
-        # Retrieving each time-trajectory
-        T_k = perform_pod(U_k, eps=eps_init, n_L=0, verbose=False)
-        T_list.append(T_k)
+    # Retrieving each time-trajectory, the bases being weighted evenly
+    def trajectory_pod(k):
+        T_k = perform_pod(np.ascontiguousarray(U[:, :, k]),
+                          eps=eps_init, n_L=0, verbose=False)
+        return T_k, np.ones(T_k.shape[1]), float(T_k.shape[1])
+
+    with ThreadPoolExecutor(n_workers) as executor:
+        parts = list(executor.map(trajectory_pod, range(n_s)))
+
+        # Tree-merging pairs of partial SVDs, level by level
+        print("Merging the time-trajectory bases")
+        depth = max(int(np.ceil(np.log2(n_s))), 1)
+        eps_merge = merge_ratio * eps / depth
+        while len(parts) > 1:
+            pairs = [parts[i:i+2] for i in range(0, len(parts), 2)]
+            parts = list(executor.map(lambda pair: merge_pods(pair, eps_merge),
+                                      pairs))
+
+    V, _, _ = merge_pods(parts, eps)
+    print("Contructing the reduced bases V")
+    return np.ascontiguousarray(V)
+
+
+def perform_rand_pod(U, eps=0., n_L=0, n_oversamples=10, n_iter=2, rank_0=16,
+                     seed=None, verbose=True):
+    """Randomized range-finder version of POD algorithm."""
+    n_st = U.shape[1]
+    rng = np.random.default_rng(seed)
+
+    # Total energy of the snapshots, sum of all the eigenvalues
+    sum_lambdas = np.linalg.norm(U)**2
+
+    # Growing the rank until the energy criterion is met
+    k = n_L if n_L > 0 else min(rank_0, n_st)
+    while True:
+        n_r = min(k + n_oversamples, n_st)
+        Q, _ = np.linalg.qr(U.dot(rng.standard_normal((n_st, n_r))))
+        # Power iterations, to sharpen the decay of the spectrum
+        for _ in range(n_iter):
+            Q_t, _ = np.linalg.qr(U.T.dot(Q))
+            Q, _ = np.linalg.qr(U.dot(Q_t))
+
+        # Small SVD on the projected snapshots
+        U_b, D, _ = np.linalg.svd(Q.T.dot(U), full_matrices=False)
+        lambdas = D**2
+
+        if n_L > 0:
+            n_L_eps = min(n_L, lambdas.shape[0])
+            break
+        ratios = np.cumsum(lambdas) / sum_lambdas
+        n_L_eps = np.searchsorted(ratios, 1 - eps) + 1
+        if n_L_eps <= k or n_r == n_st:
+            n_L_eps = min(n_L_eps, lambdas.shape[0])
+            break
+        k *= 2
+
+    # Estimated relative truncation error, in Frobenius norm
+    err = np.sqrt(max(1. - np.sum(lambdas[:n_L_eps]) / sum_lambdas, 0.))
+    if verbose:
+        print(f"Contructing the reduced bases V (n_L={n_L_eps}, " +
+              f"est. truncation error={err:.4e})")
+
+    return np.ascontiguousarray(Q.dot(U_b[:, :n_L_eps]))
+
+
+def snapshots_eig(U, block_size=0, n_workers=1):
+    """Eigendecomposition of the correlation matrix U^T.U, in descending order."""
+    n_h, n_st = U.shape
+    if block_size == 0:
+        block_size = max(BLOCK_VALUES // n_st, 1)
+
+    # Forming the (n_st, n_st) correlation matrix U^T.U by row blocks
+    def gram_block(start):
+        U_b = U[start:start+block_size]
+        return U_b.T.dot(U_b)
+    starts = range(0, n_h, block_size)
+    if n_workers > 1:
+        with ThreadPoolExecutor(n_workers) as executor:
+            C = sum(executor.map(gram_block, starts))
+    else:
+        C = sum(map(gram_block, starts))
+
+    # Eigenvalues are the squared singular values
+    lambdas, Z = np.linalg.eigh(C)
+    lambdas, Z = lambdas[::-1], Z[:, ::-1]
+    n_pos = np.count_nonzero(lambdas > lambdas[0] * np.finfo(lambdas.dtype).eps)
+    return lambdas, Z, n_pos
+
+
+def perform_snapshots_pod(U, eps=0., n_L=0, block_size=0, n_workers=1,
+                          verbose=True):
+    """Method of snapshots version of POD algorithm, for tall U."""
+    lambdas, Z, n_pos = snapshots_eig(U, block_size, n_workers)
+
+    # Finding n_L
+    if n_L == 0:
+        ratios = np.cumsum(lambdas[:n_pos]) / np.sum(lambdas[:n_pos])
+        n_L = np.searchsorted(ratios, 1 - eps) + 1
+    n_L = min(n_L, n_pos)
+
+    if verbose:
+        print("Contructing the reduced bases V")
+
+    # Single BLAS-3 product to get back the spatial modes
+    V = U.dot(Z[:, :n_L] / np.sqrt(lambdas[:n_L]))
+
+    return np.ascontiguousarray(V)
+
+
+def compute_pod(U, eps=0., n_L=0, method=POD_AUTO, verbose=True, n_workers=None,
+                **kwargs):
+    """Perform POD on U with the requested backend, kwargs being its options.
+
+    n_workers threads the backends working by blocks (POD_SNAPSHOTS, POD_TSQR),
+    the others relying on the BLAS ones.
+    """
+    if method == POD_AUTO:
+        n_h, n_st = U.shape
+        method = POD_SNAPSHOTS if n_h >= SNAPSHOTS_RATIO * n_st else POD_SVD
+    if method == POD_SVD:
+        # No options to the compiled SVD, a mistyped one would go unnoticed
+        if kwargs:
+            raise TypeError(f"Unexpected options for {method}: {', '.join(kwargs)}")
+        return perform_pod(U, eps, n_L, verbose)
+    if method == POD_SNAPSHOTS:
+        return perform_snapshots_pod(U, eps, n_L, n_workers=n_workers or 1,
+                                     verbose=verbose, **kwargs)
+    if method == POD_RANDOMIZED:
+        return perform_rand_pod(U, eps, n_L, verbose=verbose, **kwargs)
+    if method == POD_TSQR:
+        return perform_tsqr_pod(U, eps, n_L, n_workers=n_workers, verbose=verbose,
+                                **kwargs)
+    raise ValueError(f"Unknown POD method: {method}")
+
+
+class IncrementalPod:
+    """Brand-style incremental SVD, fed with blocks of snapshots columns."""
+    def __init__(self, max_rank=0, tol=1e-12):
+        # Maximum number of modes kept between updates (0 for no limit)
+        self.max_rank = max_rank
+        # Singular values below tol*D[0] are discarded between updates
+        self.tol = tol
+
+        self.Phi = None
+        self.D = None
+        self.sum_lambdas = 0.
+        self.n_st = 0
 
-    # Reshaping the 3d-mat into a 2d-mat
-    U_f = np.concatenate(T_list, axis=1)
+    def update(self, U_b):
+        """Add a (n_h, n_b) block of snapshots to the decomposition."""
+        U_b = np.asarray(U_b, dtype=np.float64)
+        if U_b.ndim == 1:
+            U_b = U_b[:, np.newaxis]
+        self.sum_lambdas += np.linalg.norm(U_b)**2
+        self.n_st += U_b.shape[1]
 
-    print("Performing SVD")
-    return perform_pod(U_f, eps=eps, n_L=0, verbose=True)
+        if self.Phi is None:
+            Phi, D, _ = np.linalg.svd(U_b, full_matrices=False)
+        else:
+            # Components in the current basis, and orthogonal residual
+            L = self.Phi.T.dot(U_b)
+            H = U_b - self.Phi.dot(L)
+            # Second Gram-Schmidt pass, to keep the basis orthogonal
+            L_c = self.Phi.T.dot(H)
+            H -= self.Phi.dot(L_c)
+            L += L_c
+            J, K = np.linalg.qr(H)
+
+            # SVD of the small (k + n_b)-sized core matrix
+            k = self.D.shape[0]
+            M = np.zeros((k + K.shape[0], k + U_b.shape[1]))
+            M[:k, :k] = np.diag(self.D)
+            M[:k, k:] = L
+            M[k:, k:] = K
+            U_m, D, _ = np.linalg.svd(M, full_matrices=False)
+            Phi = self.Phi.dot(U_m[:k]) + J.dot(U_m[k:])
+
+        # Truncating the numerically null and extra modes
+        n_r = np.count_nonzero(D > self.tol * D[0]) if D[0] > 0. else 1
+        if self.max_rank > 0:
+            n_r = min(n_r, self.max_rank)
+        self.Phi = np.ascontiguousarray(Phi[:, :n_r])
+        self.D = D[:n_r]
+
+    def get_basis(self, eps=0., n_L=0, verbose=True):
+        """Return the reduced bases V, truncated as in perform_pod."""
+        if self.Phi is None:
+            raise ValueError("No snapshots have been added.")
+        lambdas = self.D**2
+        if n_L == 0:
+            ratios = np.cumsum(lambdas) / self.sum_lambdas
+            n_L = np.searchsorted(ratios, 1 - eps) + 1
+        n_L = min(n_L, lambdas.shape[0])
+
+        if verbose:
+            print(f"Contructing the reduced bases V from {self.n_st} snapshots")
+        return np.ascontiguousarray(self.Phi[:, :n_L])
+
+
+class LazySnapshots:
+    """(n_h, n_st) snapshots matrix over a (n_h, n_t, n_s) array, read by rows."""
+    def __init__(self, U_struct, samples=None):
+        # Any array-like supporting U_struct[rows, :, samples], e.g. np.memmap
+        self.U_struct = U_struct
+        n_h, n_t, n_s = U_struct.shape
+        self.samples = np.arange(n_s) if samples is None else np.asarray(samples)
+        # Columns are ordered as in PodnnModel.destruct, time-wise first
+        self.shape = (n_h, n_t * self.samples.shape[0])
+
+    def __getitem__(self, rows):
+        """Gather the rows slice into a dense (n_rows, n_st) block."""
+        U_b = np.asarray(self.U_struct[rows, :, self.samples], dtype=np.float64)
+        return U_b.transpose((0, 2, 1)).reshape((U_b.shape[0], -1))
+
+
+def map_row_blocks(U, fn, block_size=0, n_workers=None):
+    """Apply fn(start, U_b) to dense row blocks of U, in order, from a pool."""
+    if isinstance(U, str):
+        U = np.load(U, mmap_mode="r")
+    n_h, n_st = U.shape
+    if block_size == 0:
+        block_size = max(BLOCK_VALUES // n_st, n_st)
+
+    def fn_block(start):
+        U_b = np.asarray(U[start:start+block_size], dtype=np.float64)
+        return fn(start, U_b)
+    with ThreadPoolExecutor(n_workers) as executor:
+        return list(executor.map(fn_block, range(0, n_h, block_size)))
+
+
+def perform_tsqr_pod(U, eps=0., n_L=0, block_size=0, n_workers=None,
+                     verbose=True):
+    """Out-of-core POD algorithm, via a tall-skinny QR over row blocks of U."""
+    if isinstance(U, str):
+        U = np.load(U, mmap_mode="r")
+    n_h = U.shape[0]
+
+    # Local QR of each row block, only the triangular factors are kept
+    R_list = map_row_blocks(U, lambda _, U_b: np.linalg.qr(U_b, mode="r"),
+                            block_size, n_workers)
+
+    # Reducing the stacked factors, a few at a time
+    while len(R_list) > 1:
+        R_list = [np.linalg.qr(np.vstack(R_list[i:i+8]), mode="r")
+                  for i in range(0, len(R_list), 8)]
+
+    # Small SVD of R, sharing its singular values and right vectors with U
+    _, D, ZT = np.linalg.svd(R_list[0], full_matrices=False)
+    lambdas = D**2
+
+    # Finding n_L
+    if n_L == 0:
+        ratios = np.cumsum(lambdas) / np.sum(lambdas)
+        n_L = np.searchsorted(ratios, 1 - eps) + 1
+    n_L = min(n_L, np.count_nonzero(D > D[0] * np.finfo(D.dtype).eps))
+
+    if verbose:
+        print("Contructing the reduced bases V")
+
+    # Second pass over the blocks: V = U.Z.D^-1
+    Z_D = ZT[:n_L].T / D[:n_L]
+    V = np.zeros((n_h, n_L))
+    def project_block(start, U_b):
+        V[start:start+U_b.shape[0]] = U_b.dot(Z_D)
+    map_row_blocks(U, project_block, block_size, n_workers)
+
+    return V
+
+
+def project_row_blocks(U, V, block_size=0, n_workers=None):
+    """Out-of-core projection (V^T.U)^T, one row block of U at a time."""
+    def project_block(start, U_b):
+        return V[start:start+U_b.shape[0]].T.dot(U_b)
+    return sum(map_row_blocks(U, project_block, block_size, n_workers)).T
+
+
+def pod_sig_row_blocks(U, V, v, block_size=0, n_workers=None):
+    """Out-of-core mean deviation between U and its POD reconstruction."""
+    def sig_block(start, U_b):
+        U_pod_b = V[start:start+U_b.shape[0]].dot(v.T)
+        return np.stack((U_b, U_pod_b), axis=-1).std(-1).mean(-1)
+    return np.concatenate(map_row_blocks(U, sig_block, block_size, n_workers))
+
+
+def hash_snapshots(U):
+    """Return a hash key identifying the content of the snapshots matrix."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str((U.shape, U.dtype.str)).encode())
+    h.update(np.ascontiguousarray(U).data)
+    return h.hexdigest()
+
+
+def get_cumulative_energy(D):
+    """Return the cumulative energy ratios of the modes, from singular values."""
+    lambdas = D**2
+    return np.cumsum(lambdas) / np.sum(lambdas)
+
+
+def compute_pod_spectrum(U, eps=SPECTRUM_EPS, n_L=0, method=POD_AUTO,
+                         n_workers=None):
+    """Return all singular values of U, and its modes up to eps (or n_L), method
+    being POD_SVD or POD_SNAPSHOTS, picked as in compute_pod if POD_AUTO."""
+    n_h, n_st = U.shape
+    if method == POD_AUTO:
+        method = POD_SNAPSHOTS if n_h >= SNAPSHOTS_RATIO * n_st else POD_SVD
+    if method == POD_SNAPSHOTS:
+        lambdas, Z, n_pos = snapshots_eig(U, n_workers=n_workers or 1)
+        D = np.sqrt(np.maximum(lambdas[:n_pos], 0.))
+    elif method == POD_SVD:
+        Phi, D, _ = np.linalg.svd(U, full_matrices=False)
+        n_pos = np.count_nonzero(D > D[0] * np.finfo(D.dtype).eps)
+        D = D[:n_pos]
+    else:
+        raise ValueError(f"No full spectrum from the POD method: {method}")
+
+    n_keep = np.searchsorted(get_cumulative_energy(D), 1 - eps) + 1
+    n_keep = min(max(n_keep, n_L), n_pos)
+    if method == POD_SNAPSHOTS:
+        Phi = U.dot(Z[:, :n_keep] / D[:n_keep])
+    return np.ascontiguousarray(Phi[:, :n_keep]), D
+
+
+def truncate_pod_spectrum(Phi, D, eps=0., n_L=0):
+    """Re-truncate a POD spectrum, returning None if it lacks the modes."""
+    if n_L == 0:
+        n_L = np.searchsorted(get_cumulative_energy(D), 1 - eps) + 1
+    n_L = min(n_L, D.shape[0])
+    if n_L > Phi.shape[1]:
+        return None
+    return np.ascontiguousarray(Phi[:, :n_L])
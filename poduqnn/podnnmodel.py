@@ -3,30 +3,51 @@
 import os
 import pickle
 import time
-import tensorflow as tf
-import tensorflow_probability as tfp
 import numpy as np
 from tqdm import tqdm
 import numba as nb
 
-from .pod import perform_pod, perform_fast_pod
-from .handling import sample_mu, split_dataset, clean_models
+from .pod import compute_pod, perform_fast_pod, POD_AUTO, POD_SVD, POD_SNAPSHOTS, \
+    POD_TSQR, SPECTRUM_EPS, LazySnapshots, perform_tsqr_pod, project_row_blocks, \
+    pod_sig_row_blocks, hash_snapshots, compute_pod_spectrum, \
+    truncate_pod_spectrum, get_cumulative_energy
+from .handling import sample_mu, split_samples, split_snapshots, clean_models, \
+    DESIGN_LHS, NORM_MEANSTD
 from .logger import Logger
-from .varneuralnetwork import VarNeuralNetwork, NORM_MEANSTD
-from .acceleration import loop_u, loop_u_t
+from .inference import InferenceNetwork
+from .acceleration import loop_u_pool, jit_u, get_kernels, \
+    is_batched_t, is_jittable, shared_zeros, EXEC_AUTO, EXEC_NUMBA, EXEC_PROCESS
 from .metrics import re_s
+from .store import SnapshotStore
+from .snapshots import SnapshotArray, restruct, destruct, gather_snapshots
+from .artifacts import save_arrays, load_arrays, META_NAME
+from .cache import DatasetCache, DATASET_CACHE_NAME, dataset_key
 
 SETUP_DATA_NAME = "setup_data.pkl"
-TRAIN_DATA_NAME = "train_data.pkl"
-INIT_DATA_NAME = "init_data.pkl"
+# Artifact directories, the former pickles being still read if present
+TRAIN_DATA_NAME = "train_data"
+INIT_DATA_NAME = "init_data"
+PICKLE_EXT = ".pkl"
+# Datasets arrays, in the order of load_train_data and load_init_data
+DATA_NAMES = ("X_v_train", "v_train", "U_train", "X_v_val", "v_val", "U_val")
+POD_SPECTRUM_NAME = "pod_spectrum.pkl"
+
+# Number of samples generated at once when streaming snapshots
+CHUNK_SIZE = 16
 MODEL_PARAMS_NAME = "model_params.pkl"
+# Inference-only export: basis, POD error and the ensemble weights
+BUNDLE_NAME = "inference"
 MODEL_NAME = "model_weights"
 MODEL_NAME_EXT = ".index"
 
+# Uncertainty propagation from v to U: exact (linear) or Monte Carlo
+PRED_ANALYTIC = "analytic"
+PRED_MC = "mc"
+
 
 class PodnnModel:
     """Wrapper class to handle POD projections and regression model."""
-    def __init__(self, resdir, n_v, x_mesh, n_t):
+    def __init__(self, resdir, n_v, x_mesh, n_t, save_setup=True):
         # Dimension of the function output
         self.n_v = n_v
         # Mesh definition array in space
@@ -43,7 +64,9 @@ class PodnnModel:
         self.setup_data_path = os.path.join(resdir, SETUP_DATA_NAME)
         self.train_data_path = os.path.join(resdir, TRAIN_DATA_NAME)
         self.init_data_path = os.path.join(resdir, INIT_DATA_NAME)
+        self.pod_spectrum_path = os.path.join(resdir, POD_SPECTRUM_NAME)
         self.model_params_path = os.path.join(resdir, MODEL_PARAMS_NAME)
+        self.dataset_cache_path = os.path.join(resdir, DATASET_CACHE_NAME)
         self.model_path = []
 
         self.regnn = None
@@ -53,14 +76,16 @@ class PodnnModel:
         self.layers = None
         self.pod_sig = None
 
+        # TensorFlow is only imported once networks are built or loaded
         self.dtype = "float64"
-        tf.keras.backend.set_floatx(self.dtype)
-        self.save_setup_data()
+        if save_setup:
+            self.save_setup_data()
 
-    def generate_hifi_inputs(self, n_s, mu_min, mu_max, t_min=0, t_max=0):
+    def generate_hifi_inputs(self, n_s, mu_min, mu_max, t_min=0, t_max=0,
+                             design=DESIGN_LHS, seed=None):
         """Return large inputs to be used in a HiFi prediction task."""
         mu_min, mu_max = np.array(mu_min), np.array(mu_max)
-        mu_lhs = sample_mu(n_s, mu_min, mu_max)
+        mu_lhs = sample_mu(n_s, mu_min, mu_max, design=design, seed=seed)
 
         n_st = n_s
         n_d = mu_min.shape[0]
@@ -87,121 +112,269 @@ class PodnnModel:
         return X_v
 
     def create_snapshots(self, n_d, n_h, u, mu_lhs,
-                         t_min=0, t_max=0, u_noise=0., x_noise=0.):
-        """Create a generated snapshots matrix and inputs for benchmarks."""
+                         t_min=0, t_max=0, u_noise=0., x_noise=0., pod=None,
+                         seed=None, n_threads=None, batched_t=None,
+                         no_noise=False, i_0=0, executor=EXEC_AUTO):
+        """Create a generated snapshots matrix and inputs for benchmarks.
+
+        u(X, t, mu) may take a vector of times and return (n_v, n_xyz, n_t).
+        The noise-free U is only returned if no_noise, None otherwise.
+        """
         n_s = mu_lhs.shape[0]
         n_xyz = self.x_mesh.shape[0]
         n_st = n_s
         if self.has_t:
             n_st *= self.n_t
 
-        # Numba-ifying the function
-        u = nb.njit(u)
-
         # Getting the nodes coordinates
         X = self.x_mesh[:, 1:].T
 
-        # Declaring the common output arrays
+        # Detecting if all time steps can be computed in a single call
+        if batched_t is None and self.has_t:
+            t = np.linspace(t_min, t_max, self.n_t)
+            batched_t = is_batched_t(u, X, t, mu_lhs[0],
+                                     (self.n_v, n_xyz, self.n_t))
+
+        # Same argument types on every call, not to compile the loops again
+        t_min, t_max = float(t_min), float(t_max)
+        u_noise, x_noise = float(u_noise), float(x_noise)
+
+        # Numba-ifying the function, falling back to processes if it can't be
+        u_jit = jit_u(u)
+        if executor == EXEC_AUTO:
+            t_0 = np.linspace(t_min, t_max, self.n_t) if batched_t else float(t_min)
+            t_0 = t_0 if self.has_t else 0
+            executor = EXEC_NUMBA if is_jittable(u_jit, X, t_0, mu_lhs[0]) \
+                else EXEC_PROCESS
+        if executor not in (EXEC_NUMBA, EXEC_PROCESS):
+            raise ValueError(f"Unknown snapshots executor: {executor}")
+
+        # Declaring the common output arrays, written in place by the workers
+        zeros = shared_zeros if executor == EXEC_PROCESS else np.zeros
         X_v = np.zeros((n_st, n_d))
-        U = np.zeros((n_h, n_st))
-
-        # Computing
-        U_no_noise = np.zeros((n_h, n_st))
-        if self.has_t:
-            U_struct = np.zeros((n_h, self.n_t, n_s))
-            return loop_u_t(u, self.n_t, self.n_v, n_xyz, n_h,
-                            X_v, U, U_no_noise, U_struct, X, mu_lhs, t_min, t_max,
-                            u_noise, x_noise)
-
-        return loop_u(u, n_h, X_v, U, U_no_noise, X, mu_lhs, u_noise, x_noise)
+        U = zeros((n_h, n_st))
+
+        # Noise streams are seeded per sample, from the global RNG by default
+        seed = np.random.randint(2**31) if seed is None else seed
+        seed, i_0 = int(seed), int(i_0)
+
+        # Computing, the noise-free copy being U itself if there is no noise
+        U_no_noise = None
+        if no_noise:
+            U_no_noise = zeros((n_h, n_st)) if u_noise > 0. or x_noise > 0. else U
+        U_no_noise_buf = U if U_no_noise is None else U_no_noise
+        if executor == EXEC_PROCESS:
+            # Not touching numba's threads, that would keep the pool from forking
+            print("Generating the snapshots from a pool of processes")
+            loop_u_pool(u, self.n_t, n_h, X_v, U, U_no_noise_buf, X, mu_lhs,
+                        t_min, t_max, u_noise, x_noise, seed, i_0, no_noise,
+                        bool(batched_t), n_threads)
+        else:
+            n_threads_prev = nb.get_num_threads()
+            if n_threads is not None:
+                nb.set_num_threads(min(n_threads, nb.config.NUMBA_NUM_THREADS))
+            try:
+                kernels = get_kernels(u)
+                if self.has_t:
+                    loop_u_t_fn = kernels.loop_u_t_batch if batched_t \
+                        else kernels.loop_u_t
+                    loop_u_t_fn(self.n_t, self.n_v, n_xyz, n_h,
+                                X_v, U, U_no_noise_buf, X, mu_lhs, t_min, t_max,
+                                u_noise, x_noise, seed, i_0, no_noise)
+                else:
+                    kernels.loop_u(n_h, X_v, U, U_no_noise_buf, X, mu_lhs,
+                                   u_noise, x_noise, seed, i_0, no_noise)
+            finally:
+                nb.set_num_threads(n_threads_prev)
+        # (n_h, n_t, n_s) view on U
+        U_struct = U.reshape((n_h, n_s, self.n_t)).transpose((0, 2, 1)) \
+            if self.has_t else U
+
+        # Feeding the incremental POD, one sample (trajectory) at a time
+        if pod is not None:
+            n_t = max(self.n_t, 1)
+            for i in range(n_s):
+                pod.update(U[:, n_t*i:n_t*(i+1)])
+        return X_v, U, U_struct, U_no_noise
+
+    def iter_snapshots(self, n_d, n_h, u, mu_lhs, t_min=0, t_max=0,
+                       u_noise=0., x_noise=0., chunk_size=CHUNK_SIZE, seed=None,
+                       **kwargs):
+        """Yield create_snapshots outputs for chunks of chunk_size samples."""
+        # Fixing the seed, the chunks then match a single create_snapshots call
+        if seed is None:
+            seed = np.random.randint(2**31)
+        for i_0 in range(0, mu_lhs.shape[0], chunk_size):
+            yield self.create_snapshots(n_d, n_h, u, mu_lhs[i_0:i_0+chunk_size],
+                                        t_min, t_max, u_noise, x_noise,
+                                        seed=seed, i_0=i_0, **kwargs)
+
+    def write_snapshots(self, out_path, n_d, n_h, u, mu_lhs, t_min=0, t_max=0,
+                        u_noise=0., x_noise=0., chunk_size=CHUNK_SIZE, seed=None,
+                        **kwargs):
+        """Generate the snapshots chunk by chunk into a memory-mapped .npy file."""
+        n_st = mu_lhs.shape[0] * max(self.n_t, 1)
+        X_v = np.zeros((n_st, n_d))
+        U = np.lib.format.open_memmap(out_path, mode="w+", shape=(n_h, n_st))
+        s = 0
+        for X_v_c, U_c, _, _ in self.iter_snapshots(n_d, n_h, u, mu_lhs,
+                                                    t_min, t_max, u_noise, x_noise,
+                                                    chunk_size, seed, **kwargs):
+            e = s + U_c.shape[1]
+            X_v[s:e] = X_v_c
+            U[:, s:e] = U_c
+            s = e
+        U.flush()
+        return X_v, U
+
+    def precompile(self, n_d, n_h, u, mu, t_min=0, t_max=0, batched_t=None):
+        """Compile the snapshots loops for u, or load them from the disk cache, mu
+        being a single valid set of parameters, for one throwaway sample."""
+        mu_lhs = np.atleast_2d(np.asarray(mu, dtype=np.float64))
+        self.create_snapshots(n_d, n_h, u, mu_lhs, t_min, t_max, seed=0,
+                              batched_t=batched_t, executor=EXEC_NUMBA)
 
     def convert_multigpu_data(self, U_struct, X_v, train_val, eps, eps_init=None,
-                              n_L=0, use_cache=False, save_cache=False):
-        """Convert spatial mesh/solution to usable inputs/snapshot matrix."""
-        """U is (n_v, n_xyz, n_t, n_s)."""
-        if use_cache and os.path.exists(self.train_data_path):
-            return self.load_train_data()
-
+                              n_L=0, use_cache=True, save_cache=False,
+                              pod_method=POD_AUTO, pod=None, seed=None,
+                              n_workers=None):
+        """Convert spatial mesh/solution to usable inputs/snapshot matrix.
+
+        U is (n_v, n_xyz, n_t, n_s) or a SnapshotStore (X_v then being optional),
+        pod an empty IncrementalPod, fed here with the train samples one at a time.
+        With POD_TSQR or a pod, U can be on disk and U_train is never materialized.
+        With use_cache and a seed, the dataset of the same snapshots and settings
+        is reused. seed fixes the train/validation split, drawn from the global RNG
+        if None, and n_workers threads the POD.
+        """
         self.n_xyz = self.x_mesh.shape[0]
         self.n_h = self.n_xyz * self.n_v
-        n_st = X_v.shape[0]
-        n_s = U_struct.shape[-1]
+        if U_struct is None:
+            raise ValueError("Snapshots are required, e.g. as a SnapshotStore.")
+        if pod is not None and pod.n_st > 0:
+            raise ValueError("The pod has to be empty, it's fed with the train samples.")
+        # Unseeded splits can't be reproduced, nor cached
+        use_cache = use_cache and seed is not None
+        if use_cache:
+            # A store is identified by its manifest and selection, arrays by content
+            key = dataset_key(
+                U=(U_struct.manifest, U_struct.keys)
+                if isinstance(U_struct, SnapshotStore) else U_struct,
+                X_v=X_v, x_mesh=self.x_mesh, n_v=self.n_v, n_t=self.n_t,
+                train_val=train_val, eps=eps, eps_init=eps_init, n_L=n_L,
+                pod_method=pod_method, pod=pod is not None, seed=seed)
+            if self.load_cached_dataset(key):
+                X_v_train, v_train, _, X_v_val, v_val, U_val = self.load_train_data()
+                return X_v_train, v_train, X_v_val, v_val, U_val
+
         n_t = self.n_t
         if n_t == 0:
             n_t = 1
+        if isinstance(U_struct, SnapshotStore):
+            # Lazy views, only the needed samples being read from the store
+            X_v = U_struct.X_v if X_v is None else X_v
+            U_flat = U_struct.U_flat
+        else:
+            U_flat = U_struct.reshape((self.n_h, n_t, U_struct.shape[-1]))
+        n_st = X_v.shape[0]
+        n_s = U_flat.shape[-1]
 
         # Number of input in time (1) + number of params
         self.n_d = X_v.shape[1]
         
-        # Getting random indices to manually do the split
-        idx_s = np.random.permutation(n_s)
-        limit = np.floor(n_s * (1. - train_val[1])).astype(int)
-        train_idx, val_idx = idx_s[:limit], idx_s[limit:]
-
-        # Splitting the struct matrix
-        U_train_s = U_struct[..., train_idx]
-        U_val_s = U_struct[..., val_idx]
-
-        # Splitting the n_st-sized inputs
-        X_v_train = np.zeros((len(train_idx)*n_t, X_v.shape[1]))
-        X_v_val = np.zeros((len(val_idx)*n_t, X_v.shape[1]))
-        for i, idx in enumerate(train_idx):
-            X_v_train[i*n_t:(i+1)*n_t] = X_v[idx*n_t:(idx+1)*n_t]
-        for i, idx in enumerate(val_idx):
-            X_v_val[i*n_t:(i+1)*n_t] = X_v[idx*n_t:(idx+1)*n_t]
-
-        # Reshaping manually
-        U_train = self.destruct(U_train_s) 
-        U_val = self.destruct(U_val_s) 
-
-        # Getting the POD bases, with u_L(x, mu) = V.u_rb(x, mu) ~= u_h(x, mu)
-        # u_rb are the reduced coefficients we're looking for
-        if eps_init is not None and self.has_t:
-            self.V = perform_fast_pod(U_struct.reshape((self.n_h, n_t, n_s)),
-                                      eps, eps_init)
+        # Splitting the samples, their initial conditions being gathered first
+        train_idx, val_idx = split_samples(n_s, train_val[1], seed)
+        rm_init = self.n_t > 0
+        train_cols, n_0 = split_snapshots(train_idx, self.n_t, rm_init)
+        val_cols, n_0_val = split_snapshots(val_idx, self.n_t, rm_init)
+        X_v_train = np.asarray(X_v[train_cols], dtype=np.float64)
+        X_v_val = np.asarray(X_v[val_cols], dtype=np.float64)
+
+        # Out-of-core: U_struct (e.g. a np.memmap) is only read by row blocks
+        if pod_method == POD_TSQR or pod is not None:
+            U_train_lazy = LazySnapshots(U_flat, train_idx)
+            U_val = gather_snapshots(U_flat, val_cols)
+            if pod is not None:
+                # Streaming the train samples, a single one being held at once
+                for i in train_idx:
+                    pod.update(U_flat[:, :, i])
+                self.V = pod.get_basis(eps, n_L)
+            else:
+                self.V = perform_tsqr_pod(U_train_lazy, eps, n_L, n_workers=n_workers)
+            self.n_L = self.V.shape[1]
+            v_train = project_row_blocks(U_train_lazy, self.V)
+            v_val = self.project_to_v(U_val)
+            self.pod_sig = pod_sig_row_blocks(U_train_lazy, self.V, v_train)
+            print(f"Mean pod sig: {self.pod_sig.mean()}")
+            # Same columns order as train_cols
+            v_train = v_train[split_snapshots(np.arange(len(train_idx)),
+                                              self.n_t, rm_init)[0]]
+            U_train = None
         else:
-            self.V = perform_pod(U_train, eps, n_L, True)
+            # Gathering the snapshots matrices
+            U_train = gather_snapshots(U_flat, train_cols)
+            U_val = gather_snapshots(U_flat, val_cols)
 
-        self.n_L = self.V.shape[1]
+            # Getting the POD bases, with u_L(x, mu) = V.u_rb(x, mu) ~= u_h(x, mu)
+            # u_rb are the reduced coefficients we're looking for
+            if eps_init is not None and self.has_t:
+                self.V = perform_fast_pod(U_flat, eps, eps_init, n_workers)
+            else:
+                self.V = self.compute_cached_pod(U_train, eps, n_L, pod_method, n_workers)
 
-        # Projecting
-        # v = (self.V.T.dot(U)).T
-        v_train = self.project_to_v(U_train)
-        v_val = self.project_to_v(U_val)
-        
-        # Checking the POD error
-        U_pod = self.V.dot(v_train.T)
-        v_train_pod = self.project_to_v(U_pod)
-        self.pod_sig = np.stack((U_train, U_pod), axis=-1).std(-1).mean(-1)
-        print(f"Mean pod sig: {self.pod_sig.mean()}")
+            self.n_L = self.V.shape[1]
+
+            # Projecting
+            # v = (self.V.T.dot(U)).T
+            v_train = self.project_to_v(U_train)
+            v_val = self.project_to_v(U_val)
+
+            # Checking the POD error
+            U_pod = self.V.dot(v_train.T)
+            self.pod_sig = np.stack((U_train, U_pod), axis=-1).std(-1).mean(-1)
+            print(f"Mean pod sig: {self.pod_sig.mean()}")
 
         # Removing the initial condition from the training set
-        if self.n_t > 0:
-            idx = np.arange(limit) * self.n_t
-            X_v_train_0 = X_v_train[idx]
-            X_v_train = np.delete(X_v_train, idx, axis=0)
-            v_train_0 = v_train[idx]
-            v_train = np.delete(v_train, idx, axis=0)
-            U_train_0 = U_train[:, idx]
-            U_train = np.delete(U_train, idx, axis=1)
-            idx = np.arange(n_s - limit - 1) * self.n_t
-            X_v_val_0 = X_v_val[idx]
-            X_v_val = np.delete(X_v_val, idx, axis=0)
-            v_val_0 = X_v_val[idx]
-            v_val = np.delete(v_val, idx, axis=0)
-            U_val_0 = U_train[:, idx]
-            U_val = np.delete(U_val, idx, axis=1)
+        if rm_init:
+            X_v_train_0, X_v_train = X_v_train[:n_0], X_v_train[n_0:]
+            v_train_0, v_train = v_train[:n_0], v_train[n_0:]
+            U_train_0 = None
+            if U_train is not None:
+                U_train_0, U_train = U_train[:, :n_0], U_train[:, n_0:]
+            X_v_val_0, X_v_val = X_v_val[:n_0_val], X_v_val[n_0_val:]
+            v_val_0, v_val = v_val[:n_0_val], v_val[n_0_val:]
+            U_val_0, U_val = U_val[:, :n_0_val], U_val[:, n_0_val:]
             self.save_init_data(X_v_train_0, v_train_0, U_train_0, X_v_val_0, v_val_0, U_val_0)
 
         self.save_train_data(X_v_train, v_train, U_train, X_v_val, v_val, U_val)
+        if use_cache:
+            self.save_cached_dataset(key, rm_init)
         return X_v_train, v_train, X_v_val, v_val, U_val
 
     def generate_dataset(self, u, mu_min, mu_max, n_s,
                          train_val, eps=0., eps_init=None, n_L=0,
                          t_min=0, t_max=0, u_noise=0., x_noise=0.,
-                         rm_init=False):
-        """Generate a training dataset for benchmark problems."""
+                         rm_init=False, pod_method=POD_AUTO, design=DESIGN_LHS,
+                         seed=None, use_cache=True, n_workers=None,
+                         executor=EXEC_AUTO):
+        """Generate a training dataset for benchmark problems.
+
+        With use_cache and a seed, the dataset of the same u, mesh and settings
+        is reused. seed fixes the sampling, split and noise, drawn from the global
+        RNG if None, and n_workers parallelizes the snapshots and the POD.
+        """
         mu_min, mu_max = np.array(mu_min), np.array(mu_max)
+        # Unseeded datasets can't be reproduced, nor cached
+        use_cache = use_cache and seed is not None
+        if use_cache:
+            key = dataset_key(
+                u=u, x_mesh=self.x_mesh, n_v=self.n_v, n_t=self.n_t,
+                mu_min=mu_min, mu_max=mu_max, n_s=n_s, train_val=train_val,
+                eps=eps, eps_init=eps_init, n_L=n_L, t_min=t_min, t_max=t_max,
+                u_noise=u_noise, x_noise=x_noise, rm_init=rm_init,
+                pod_method=pod_method, design=design, seed=seed)
+            if self.load_cached_dataset(key):
+                return self.load_train_data()
 
         # Total number of snapshots
         n_st = n_s
@@ -218,28 +391,30 @@ class PodnnModel:
         n_h = self.n_v * self.x_mesh.shape[0]
 
         # LHS sampling (first uniform, then perturbated)
-        print("Doing the LHS sampling on the non-spatial params...")
-        mu_lhs = sample_mu(n_s, mu_min, mu_max)
-        fake_x = np.zeros_like(mu_lhs)
-
-        _, _, mu_lhs_train, mu_lhs_val = \
-             split_dataset(fake_x, mu_lhs, test_size=train_val[1])
+        print(f"Doing the {design} sampling on the non-spatial params...")
+        mu_lhs = sample_mu(n_s, mu_min, mu_max, design=design, seed=seed)
+        # The split drawing from its own stream, independent of the sampling one
+        train_idx, val_idx = split_samples(n_s, train_val[1],
+                                           None if seed is None else (seed, 1))
+        mu_lhs_train, mu_lhs_val = mu_lhs[train_idx], mu_lhs[val_idx]
 
         # Creating the snapshots
         print(f"Generating {n_st} corresponding snapshots")
         X_v_train, U_train, U_train_struct, U_no_noise = \
             self.create_snapshots(n_d, n_h, u, mu_lhs_train,
-                                  t_min, t_max, u_noise, x_noise)
+                                  t_min, t_max, u_noise, x_noise, seed=seed,
+                                  n_threads=n_workers, executor=executor)
         X_v_val, U_val, U_val_struct, _ = \
             self.create_snapshots(n_d, n_h, u, mu_lhs_val,
-                                  t_min, t_max)
+                                  t_min, t_max, seed=seed,
+                                  n_threads=n_workers, executor=executor)
 
         # Getting the POD bases, with u_L(x, mu) = V.u_rb(x, mu) ~= u_h(x, mu)
         # u_rb are the reduced coefficients we're looking for
         if eps_init is None:
-            self.V = perform_pod(U_train, eps=eps, n_L=n_L, verbose=True)
+            self.V = self.compute_cached_pod(U_train, eps, n_L, pod_method, n_workers)
         else:
-            self.V = perform_fast_pod(U_train_struct, eps, eps_init)
+            self.V = perform_fast_pod(U_train_struct, eps, eps_init, n_workers)
 
         self.n_L = self.V.shape[1]
 
@@ -254,29 +429,57 @@ class PodnnModel:
 
         # Removing the initial condition from the training set
         if self.n_t > 0 and rm_init:
-            idx = np.arange(mu_lhs_train.shape[0]) * self.n_t
-            X_v_train_0 = X_v_train[idx]
-            X_v_train = np.delete(X_v_train, idx, axis=0)
-            v_train_0 = v_train[idx]
-            v_train = np.delete(v_train, idx, axis=0)
-            U_train_0 = U_train[:, idx]
-            U_train = np.delete(U_train, idx, axis=1)
-
-            idx = np.arange(mu_lhs_val.shape[0]) * self.n_t
-            X_v_val_0 = X_v_val[idx]
-            X_v_val = np.delete(X_v_val, idx, axis=0)
-            v_val_0 = v_val[idx]
-            v_val = np.delete(v_val, idx, axis=0)
-            U_val_0 = U_val[:, idx]
-            U_val = np.delete(U_val, idx, axis=1)
+            # Reordering once, the initial conditions first
+            cols, n_0 = split_snapshots(np.arange(mu_lhs_train.shape[0]), self.n_t, True)
+            X_v_train, v_train, U_train = X_v_train[cols], v_train[cols], U_train[:, cols]
+            X_v_train_0, X_v_train = X_v_train[:n_0], X_v_train[n_0:]
+            v_train_0, v_train = v_train[:n_0], v_train[n_0:]
+            U_train_0, U_train = U_train[:, :n_0], U_train[:, n_0:]
+
+            cols, n_0 = split_snapshots(np.arange(mu_lhs_val.shape[0]), self.n_t, True)
+            X_v_val, v_val, U_val = X_v_val[cols], v_val[cols], U_val[:, cols]
+            X_v_val_0, X_v_val = X_v_val[:n_0], X_v_val[n_0:]
+            v_val_0, v_val = v_val[:n_0], v_val[n_0:]
+            U_val_0, U_val = U_val[:, :n_0], U_val[:, n_0:]
             self.save_init_data(X_v_train_0, v_train_0, U_train_0, X_v_val_0, v_val_0, U_val_0)
 
         self.save_train_data(X_v_train, v_train, U_train, X_v_val, v_val, U_val)
+        if use_cache:
+            self.save_cached_dataset(key, self.n_t > 0 and rm_init)
         return X_v_train, v_train, U_train, X_v_val, v_val, U_val
 
+    def compute_cached_pod(self, U, eps=0., n_L=0, pod_method=POD_AUTO, n_workers=None):
+        """Perform POD, re-truncating the cached spectrum if U is unchanged."""
+        # Only full decompositions yield the whole spectrum
+        if pod_method not in (POD_AUTO, POD_SVD, POD_SNAPSHOTS):
+            return compute_pod(U, eps, n_L, pod_method, True, n_workers=n_workers)
+
+        # Same snapshots (e.g. from a seeded generate_dataset) and same backend
+        key = f"{pod_method}:{hash_snapshots(U)}"
+        spectrum = self.load_pod_spectrum()
+        if spectrum is not None and spectrum[0] == key:
+            V = truncate_pod_spectrum(spectrum[1], spectrum[2], eps, n_L)
+            if V is not None:
+                print("Re-truncating the cached POD spectrum")
+                return V
+
+        print("Computing the POD spectrum")
+        Phi, D = compute_pod_spectrum(U, min(eps, SPECTRUM_EPS), n_L, pod_method,
+                                      n_workers)
+        self.save_pod_spectrum(key, Phi, D)
+        return truncate_pod_spectrum(Phi, D, eps, n_L)
+
+    def get_pod_energy(self):
+        """Return the cumulative energy curve of the cached POD spectrum."""
+        spectrum = self.load_pod_spectrum()
+        if spectrum is None:
+            raise FileNotFoundError("Can't find POD spectrum.")
+        return get_cumulative_energy(spectrum[2])
+
     def initVNNs(self, n_M, h_layers, lr, lam, adv_eps, soft_0=1.,
                  norm=NORM_MEANSTD):
         """Create the ensemble of dual-output Neural Networks."""
+        from .varneuralnetwork import VarNeuralNetwork
         clean_models(self.resdir)
         self.layers = [self.n_d, *h_layers, self.n_L]
         self.regnn = []
@@ -361,11 +564,22 @@ class PodnnModel:
         if self.pod_sig is not None:
             U_pred_sig += self.pod_sig[:, np.newaxis]
 
-        return U_pred.astype(self.dtype), U_pred_sig.astype(self.dtype)
+        return self.snapshots(U_pred.astype(self.dtype)), \
+            self.snapshots(U_pred_sig.astype(self.dtype))
 
-    def predict(self, X_v, samples=100):
-        print(f"Averaging {samples} model configurations...")
+    def predict(self, X_v, samples=100, mode=PRED_ANALYTIC):
+        """Predict the expanded solution mean and standard deviation."""
         v_pred, v_pred_sig = self.predict_v(X_v)
+        if mode == PRED_ANALYTIC:
+            # U = V.v is linear, so the diagonal Gaussian on v maps exactly
+            U_pred = self.project_to_U(v_pred)
+            U_pred_sig = np.sqrt((self.V**2).dot(v_pred_sig.T**2))
+            return self.snapshots(U_pred), self.snapshots(U_pred_sig)
+        if mode != PRED_MC:
+            raise ValueError(f"Unknown prediction mode: {mode}")
+
+        print(f"Averaging {samples} model configurations...")
+        import tensorflow_probability as tfp
         v_dist = tfp.distributions.Normal(loc=v_pred, scale=v_pred_sig)
         U_sum = np.zeros((self.n_h, X_v.shape[0]))
         U_sum_sq = np.zeros_like(U_sum)
@@ -376,49 +590,27 @@ class PodnnModel:
         U_pred = U_sum / samples
         U_pred_sig = np.sqrt((samples * U_sum_sq - U_sum**2) \
                      / (samples * (samples - 1)))
-        return U_pred, U_pred_sig
+        return self.snapshots(U_pred), self.snapshots(U_pred_sig)
 
+    def snapshots(self, U):
+        """Wrap a (n_h, n_st) matrix as a SnapshotArray, with the model layout."""
+        return SnapshotArray(U, self.n_v, self.n_t if self.has_t else 0)
 
-    def restruct(self, U, no_s=False, n_t=None):
-        """Restruct the snapshots matrix DOFs/space-wise and time/snapshots-wise."""
+    def restruct(self, U, no_s=False, n_t=None, copy=False):
+        """Restruct the snapshots matrix DOFs/space-wise and time/snapshots-wise,
+        as a view of U unless copy is set (see snapshots.restruct)."""
         if no_s:
             return U.reshape(self.get_u_tuple())
-        if self.has_t:
-            n_t = self.n_t if n_t is None else n_t
-            # (n_h, n_st) -> (n_v, n_xyz, n_t, n_s)
-            n_s = int(U.shape[-1] / n_t)
-            U_struct = np.zeros((self.n_v, self.n_xyz, n_t, n_s))
-            for i in range(n_s):
-                s = n_t * i
-                e = n_t * (i + 1)
-                U_struct[:, :, :, i] = U[:, s:e].reshape(self.get_u_tuple(n_t))
-            return U_struct
-
-        # (n_h, n_s) -> (n_v, n_xyz, n_s)
-        n_s = U.shape[-1]
-        U_struct = np.zeros((self.get_u_tuple() + (n_s,)))
-        for i in range(n_s):
-            U_struct[:, :, i] = U[:, i].reshape(self.get_u_tuple())
-        return U_struct
-
-    def destruct(self, U_struct):
-        """Destruct the snapshots matrix DOFs/space-wise and time/snapshots-wise."""
-        if self.has_t:
-            # (n_v, n_xyz, n_t, n_s) -> (n_h, n_st)
-            n_s = int(U_struct.shape[-1])
-            U = np.zeros((self.n_h, self.n_t * n_s))
-            for i in range(n_s):
-                s = self.n_t * i
-                e = self.n_t * (i + 1)
-                U[:, s:e] = U_struct[:, :, :, i].reshape((self.n_h, self.n_t))
-            return U
+        n_t = getattr(U, "n_t", None) if n_t is None else n_t
+        n_t = self.n_t if n_t is None else n_t
+        # (n_h, n_st) -> (n_v, n_xyz, n_t, n_s), or (n_v, n_xyz, n_s) if steady
+        return restruct(np.asarray(U), self.n_v, n_t if self.has_t else 0, copy)
 
-        # (n_v, n_xyz, n_s) -> (n_h, n_s)
-        n_s = U_struct.shape[-1]
-        U = np.zeros((self.n_h, n_s))
-        for i in range(n_s):
-            U[:, i] = U_struct[:, :, i].reshape((self.n_h))
-        return U
+    def destruct(self, U_struct, copy=False):
+        """Destruct the snapshots matrix DOFs/space-wise and time/snapshots-wise,
+        as a view of U_struct if it comes from restruct, a single copy otherwise."""
+        # (n_v, n_xyz, n_t, n_s) or (n_v, n_xyz, n_s) -> (n_h, n_st)
+        return destruct(np.asarray(U_struct), copy)
 
     def get_u_tuple(self, n_t=None):
         """Construct solution shape."""
@@ -438,13 +630,27 @@ class PodnnModel:
 
     def tensor(self, X):
         """Helper to make sure quantities are tensor of dtype."""
+        import tensorflow as tf
         return tf.convert_to_tensor(X, dtype=self.dtype)
 
     def load_train_data(self):
-        """Load training data, such as datasets."""
+        """Load training data, such as datasets, memory-mapped to be only read
+        when used."""
         if not os.path.exists(self.train_data_path):
+            if os.path.exists(self.train_data_path + PICKLE_EXT):
+                return self.load_train_data_pickle()
             raise FileNotFoundError("Can't find train data.")
-        with open(self.train_data_path, "rb") as f:
+        print("Loading train data")
+        data = load_arrays(self.train_data_path)
+        self.n_L = data.meta["n_L"]
+        self.n_d = data.meta["n_d"]
+        self.V, self.pod_sig = data.get(("V", "pod_sig"))
+        print(f"Mean pod sig: {self.pod_sig.mean()}")
+        return data.get(DATA_NAMES)
+
+    def load_train_data_pickle(self):
+        """Load training data from the former pickle format."""
+        with open(self.train_data_path + PICKLE_EXT, "rb") as f:
             print("Loading train data")
             data = pickle.load(f)
             self.n_L = data[0]
@@ -457,25 +663,60 @@ class PodnnModel:
     def load_init_data(self):
         """Load training data, such as datasets."""
         if not os.path.exists(self.init_data_path):
+            if os.path.exists(self.init_data_path + PICKLE_EXT):
+                with open(self.init_data_path + PICKLE_EXT, "rb") as f:
+                    print("Loading train data")
+                    return pickle.load(f)
             raise FileNotFoundError("Can't find train data.")
-        with open(self.init_data_path, "rb") as f:
-            print("Loading train data")
-            return pickle.load(f)
+        print("Loading train data")
+        return load_arrays(self.init_data_path).get(DATA_NAMES)
 
     def save_train_data(self, X_v_train, v_train, U_train, X_v_val, v_val, U_val):
         """Save training data, such as datasets."""
-
-        with open(self.train_data_path, "wb") as f:
-            pickle.dump((self.n_L, self.n_d, self.V, self.pod_sig,
-                         X_v_train, v_train, U_train, X_v_val, v_val, U_val), f)
+        arrays = dict(zip(DATA_NAMES, (X_v_train, v_train, U_train,
+                                       X_v_val, v_val, U_val)))
+        arrays.update(V=self.V, pod_sig=self.pod_sig)
+        save_arrays(self.train_data_path, arrays,
+                    {"n_L": int(self.n_L), "n_d": int(self.n_d)})
 
     def save_init_data(self, X_v_train, v_train, U_train, X_v_val, v_val, U_val):
         """Save training data, such as datasets."""
-        with open(self.init_data_path, "wb") as f:
-            pickle.dump((X_v_train, v_train, U_train, X_v_val, v_val, U_val), f)
+        save_arrays(self.init_data_path,
+                    dict(zip(DATA_NAMES, (X_v_train, v_train, U_train,
+                                          X_v_val, v_val, U_val))))
+
+    def load_cached_dataset(self, key):
+        """Link the cached dataset of key as the train (and init) data, if any."""
+        cache = DatasetCache(self.dataset_cache_path)
+        meta = cache.get(key, {TRAIN_DATA_NAME: self.train_data_path,
+                               INIT_DATA_NAME: self.init_data_path})
+        if meta is None:
+            return False
+        print(f"Reusing the cached dataset {key}")
+        return True
+
+    def save_cached_dataset(self, key, has_init=False):
+        """Cache the train (and init) data just saved, under key."""
+        srcs = {TRAIN_DATA_NAME: self.train_data_path}
+        if has_init:
+            srcs[INIT_DATA_NAME] = self.init_data_path
+        DatasetCache(self.dataset_cache_path).put(key, srcs)
+
+    def load_pod_spectrum(self):
+        """Load the cached POD spectrum (key, modes, singular values), if any."""
+        if not os.path.exists(self.pod_spectrum_path):
+            return None
+        with open(self.pod_spectrum_path, "rb") as f:
+            return pickle.load(f)
+
+    def save_pod_spectrum(self, key, Phi, D):
+        """Save the POD spectrum, keyed by the snapshots hash."""
+        with open(self.pod_spectrum_path, "wb") as f:
+            pickle.dump((key, Phi, D), f)
 
     def load_model(self):
         """Load the (trained) POD-NN's regression nn and params."""
+        from .varneuralnetwork import VarNeuralNetwork
 
         models_exist = True
         for path in self.model_path:
@@ -526,3 +767,62 @@ class PodnnModel:
         podnnmodel.load_train_data()
         podnnmodel.load_model()
         return podnnmodel
+
+    def export_bundle(self, path=None):
+        """Save what predict needs only: the basis, POD error and ensemble weights."""
+        if self.regnn is None:
+            raise ValueError("Regression model isn't defined, call initVNNs.")
+        path = os.path.join(self.resdir, BUNDLE_NAME) if path is None else path
+        nets = [InferenceNetwork.from_network(regnn) for regnn in self.regnn]
+        arrays = {"x_mesh": self.x_mesh, "V": self.V, "pod_sig": self.pod_sig}
+        meta = {"n_v": self.n_v, "n_t": self.n_t, "n_L": int(self.n_L),
+                "n_d": int(self.n_d), "n_M": len(nets), "nets": []}
+        for i, net in enumerate(nets):
+            for k, w in enumerate(net.weights):
+                arrays[f"net_{i}_w_{k}"] = w
+            bounds = (None, None) if net.norm_bounds is None else net.norm_bounds
+            arrays[f"net_{i}_lb"], arrays[f"net_{i}_ub"] = bounds
+            meta["nets"].append({"layers": [int(n) for n in net.layers],
+                                 "soft_0": float(net.soft_0), "norm": net.norm,
+                                 "n_weights": len(net.weights)})
+        save_arrays(path, arrays, meta)
+        print(f"Exported the inference bundle to {path}")
+        return path
+
+    @classmethod
+    def bundle_is_fresh(cls, save_dir):
+        """Check if the bundle of save_dir is newer than the model it comes from."""
+        meta_path = os.path.join(save_dir, BUNDLE_NAME, META_NAME)
+        if not os.path.exists(meta_path):
+            return False
+        sources = [os.path.join(save_dir, name) for name in os.listdir(save_dir)
+                   if name.startswith(MODEL_NAME) or name == MODEL_PARAMS_NAME]
+        sources.append(os.path.join(save_dir, TRAIN_DATA_NAME, META_NAME))
+        mtimes = [os.path.getmtime(p) for p in sources if os.path.exists(p)]
+        return os.path.getmtime(meta_path) >= max(mtimes, default=0.)
+
+    @classmethod
+    def load_bundle(cls, save_dir):
+        """Recreate a predict-ready POD-NN model, without the datasets, the
+        bundle being exported first if it's missing or outdated."""
+        if not cls.bundle_is_fresh(save_dir):
+            podnnmodel = cls.load(save_dir)
+            podnnmodel.export_bundle()
+            return podnnmodel
+
+        data = load_arrays(os.path.join(save_dir, BUNDLE_NAME), mmap_mode="r")
+        meta = data.meta
+        podnnmodel = cls(save_dir, meta["n_v"], data["x_mesh"], meta["n_t"],
+                         save_setup=False)
+        podnnmodel.n_L, podnnmodel.n_d = meta["n_L"], meta["n_d"]
+        podnnmodel.V, podnnmodel.pod_sig = data.get(("V", "pod_sig"))
+        podnnmodel.regnn = []
+        for i, net in enumerate(meta["nets"]):
+            weights = [data[f"net_{i}_w_{k}"] for k in range(net["n_weights"])]
+            norm_bounds = data.get((f"net_{i}_lb", f"net_{i}_ub"))
+            if norm_bounds[0] is None:
+                norm_bounds = None
+            podnnmodel.regnn.append(InferenceNetwork(
+                weights, net["layers"], net["soft_0"], net["norm"], norm_bounds))
+        podnnmodel.layers = meta["nets"][0]["layers"] if meta["nets"] else None
+        return podnnmodel
@@ -0,0 +1,98 @@
+"""Snapshots matrices, seen (n_h, n_st) or (n_v, n_xyz, n_t, n_s)-wise without copies."""
+
+import numpy as np
+
+
+def restruct(U, n_v, n_t=0, copy=False):
+    """Return the (n_h, n_st) U as (n_v, n_xyz, n_t, n_s), or (n_v, n_xyz, n_s) if n_t=0.
+
+    Snapshots being time-wise first in U, this is a view for any C-ordered U;
+    copy gives a contiguous array instead.
+    """
+    n_h, n_st = U.shape
+    if n_t == 0:
+        U_struct = U.reshape((n_v, n_h // n_v, n_st))
+    else:
+        U_struct = U.reshape((n_v, n_h // n_v, n_st // n_t, n_t)).transpose((0, 1, 3, 2))
+    return np.array(U_struct, order="C") if copy else U_struct
+
+
+def destruct(U_struct, copy=False):
+    """Return the (n_v, n_xyz, n_t, n_s) or (n_v, n_xyz, n_s) U_struct as (n_h, n_st),
+    a view for the outputs of restruct, a single vectorized copy otherwise."""
+    if U_struct.ndim == 4:
+        U_struct = U_struct.transpose((0, 1, 3, 2))
+    U = U_struct.reshape((U_struct.shape[0] * U_struct.shape[1], -1))
+    if copy and np.may_share_memory(U, U_struct):
+        U = U.copy()
+    return U
+
+
+def gather_snapshots(U_flat, cols):
+    """Gather the (n_h, n_cols) columns cols of a (n_h, n_t, n_s) array, in one copy."""
+    n_t = U_flat.shape[1]
+    return np.asarray(U_flat[:, cols % n_t, cols // n_t], dtype=np.float64)
+
+
+class SnapshotArray(np.ndarray):
+    """(n_h, n_st) snapshots matrix, carrying its (n_v, n_t) layout."""
+    def __new__(cls, U, n_v, n_t=0):
+        obj = np.asarray(U).view(cls)
+        obj.n_v = n_v
+        # Time steps per sample, 0 if steady
+        obj.n_t = n_t
+        return obj
+
+    def __array_finalize__(self, obj):
+        # The layout only holds for (n_h, n_st') matrices of whole samples
+        n_v, n_t = getattr(obj, "n_v", None), getattr(obj, "n_t", None)
+        if n_v is None or self.ndim != 2 or self.shape[0] != obj.shape[0] or \
+                (n_t > 0 and self.shape[1] % n_t != 0):
+            n_v, n_t = None, None
+        self.n_v, self.n_t = n_v, n_t
+
+    def __array_wrap__(self, out_arr, context=None, return_scalar=False):
+        # Reductions and other ufunc outputs not shaped as snapshots, as ndarrays
+        out_arr = super().__array_wrap__(out_arr, context, return_scalar)
+        if isinstance(out_arr, SnapshotArray) and out_arr.n_v is None:
+            out_arr = out_arr.view(np.ndarray)
+            if return_scalar:
+                return out_arr[()]
+        return out_arr
+
+    def __getitem__(self, key):
+        # Rows, single columns or elements, as ndarrays
+        item = super().__getitem__(key)
+        if isinstance(item, SnapshotArray) and item.n_v is None:
+            return item.view(np.ndarray)
+        return item
+
+    def transpose(self, *axes):
+        """Return the transposed ndarray, the layout not applying to it."""
+        return np.asarray(self).transpose(*axes)
+
+    @property
+    def T(self):
+        """Return the transposed ndarray, the layout not applying to it."""
+        return np.asarray(self).T
+
+    def __reduce__(self):
+        # Keeping the layout when pickled
+        reconstruct, args, state = super().__reduce__()
+        return reconstruct, args, (state, self.n_v, self.n_t)
+
+    def __setstate__(self, state):
+        super().__setstate__(state[0])
+        self.n_v, self.n_t = state[1], state[2]
+
+    @classmethod
+    def from_struct(cls, U_struct, copy=False):
+        """Build from a (n_v, n_xyz, n_t, n_s) or (n_v, n_xyz, n_s) array."""
+        n_t = U_struct.shape[2] if U_struct.ndim == 4 else 0
+        return cls(destruct(U_struct, copy), U_struct.shape[0], n_t)
+
+    def struct(self, copy=False):
+        """Return the (n_v, n_xyz, n_t, n_s) or (n_v, n_xyz, n_s) view."""
+        if self.n_v is None:
+            raise ValueError("Not a snapshots matrix anymore, its layout is unknown.")
+        return restruct(np.asarray(self), self.n_v, self.n_t, copy)
@@ -0,0 +1,198 @@
+"""On-disk snapshots store, ingested once and read lazily."""
+
+import copy
+import json
+import os
+import numpy as np
+
+
+MANIFEST_NAME = "manifest.json"
+STORE_VERSION = 1
+
+
+class SnapshotStore:
+    """Directory holding the (n_v, n_xyz, n_t, n_s) snapshots, X_v and the mesh.
+
+    Samples are contiguous chunks of a memory-mapped file, appended one at a
+    time, the manifest recording which are complete so an ingestion can resume.
+    select returns a view of some samples, in a given order.
+    """
+    def __init__(self, path, dtype=np.float64):
+        self.path = path
+        # Positions in the files of the selected samples, None for all of them
+        self.order = None
+        os.makedirs(path, exist_ok=True)
+        self.manifest = {"version": STORE_VERSION, "dtype": np.dtype(dtype).str,
+                         "shape": None, "n_d": None, "n_s": 0, "keys": []}
+        if os.path.exists(self.file(MANIFEST_NAME)):
+            with open(self.file(MANIFEST_NAME), "r") as f:
+                self.manifest = json.load(f)
+            if self.manifest["version"] != STORE_VERSION:
+                raise ValueError(f"Unsupported store version: {self.manifest['version']}")
+            # Dropping what was written after the last complete sample
+            for name, size in (("U.dat", self.chunk_size),
+                               ("X_v.dat", self.x_chunk_size)):
+                if os.path.exists(self.file(name)) and \
+                        os.path.getsize(self.file(name)) > size * self.n_stored:
+                    os.truncate(self.file(name), size * self.n_stored)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def __len__(self):
+        return self.n_stored if self.order is None else len(self.order)
+
+    @property
+    def n_stored(self):
+        return self.manifest["n_s"]
+
+    def __contains__(self, key):
+        return key in self.manifest["keys"]
+
+    @property
+    def dtype(self):
+        return np.dtype(self.manifest["dtype"])
+
+    @property
+    def shape(self):
+        """Return the (n_v, n_xyz, n_t, n_s) shape of the snapshots."""
+        if self.manifest["shape"] is None:
+            return None
+        return tuple(self.manifest["shape"]) + (len(self),)
+
+    @property
+    def keys(self):
+        if self.order is None:
+            return list(self.manifest["keys"])
+        return [self.manifest["keys"][i] for i in self.order]
+
+    @property
+    def chunk_size(self):
+        if self.manifest["shape"] is None:
+            return 0
+        return int(np.prod(self.manifest["shape"])) * self.dtype.itemsize
+
+    @property
+    def x_chunk_size(self):
+        if self.manifest["shape"] is None:
+            return 0
+        return self.manifest["shape"][2] * self.manifest["n_d"] * 8
+
+    def save_manifest(self):
+        # Atomic write, the manifest being the only proof of completion
+        tmp_path = self.file(f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.file(MANIFEST_NAME))
+
+    def set_mesh(self, x_mesh, connectivity=None):
+        """Save the mesh, shared by all the snapshots."""
+        np.save(self.file("x_mesh.npy"), x_mesh)
+        if connectivity is not None:
+            np.save(self.file("connectivity.npy"), connectivity)
+
+    @property
+    def x_mesh(self):
+        if not os.path.exists(self.file("x_mesh.npy")):
+            return None
+        return np.load(self.file("x_mesh.npy"))
+
+    @property
+    def connectivity(self):
+        if not os.path.exists(self.file("connectivity.npy")):
+            return None
+        return np.load(self.file("connectivity.npy"))
+
+    def append(self, U_i, X_v_i, key=None):
+        """Add a (n_v, n_xyz, n_t) sample and its (n_t, n_d) inputs, under key."""
+        if self.order is not None:
+            raise ValueError("Samples can't be added to a selection of the store.")
+        U_i = np.asarray(U_i, dtype=self.dtype)
+        X_v_i = np.asarray(X_v_i, dtype=np.float64).reshape((U_i.shape[-1], -1))
+        if self.manifest["shape"] is None:
+            self.manifest["shape"] = list(U_i.shape)
+            self.manifest["n_d"] = X_v_i.shape[1]
+        elif list(U_i.shape) != self.manifest["shape"] or \
+                X_v_i.shape[1] != self.manifest["n_d"]:
+            raise ValueError(f"Sample of shape {U_i.shape} doesn't fit the store, "
+                             f"of shape {tuple(self.manifest['shape'])}.")
+        key = self.n_stored if key is None else key
+        if key in self:
+            raise ValueError(f"Sample {key} is already in the store.")
+
+        with open(self.file("U.dat"), "ab") as f:
+            f.write(np.ascontiguousarray(U_i).tobytes())
+        with open(self.file("X_v.dat"), "ab") as f:
+            f.write(np.ascontiguousarray(X_v_i).tobytes())
+        self.manifest["n_s"] += 1
+        self.manifest["keys"].append(key)
+        self.save_manifest()
+
+    def missing(self, keys):
+        """Return the positions of the keys not ingested yet."""
+        done = set(self.manifest["keys"])
+        return [i for i, key in enumerate(keys) if key not in done]
+
+    def select(self, keys):
+        """Return a view of the store with the samples of keys only, in that order."""
+        positions = {key: i for i, key in enumerate(self.manifest["keys"])}
+        missing = [key for key in keys if key not in positions]
+        if len(missing) > 0:
+            raise ValueError(f"Samples {missing} aren't in the store.")
+        view = copy.copy(self)
+        view.order = [positions[key] for key in keys]
+        return view
+
+    def selected_range(self):
+        """Return the selection as a slice, if it's a contiguous run of the files."""
+        if self.order is None:
+            return slice(0, self.n_stored)
+        start = self.order[0] if len(self.order) > 0 else 0
+        if self.order != list(range(start, start + len(self.order))):
+            return None
+        return slice(start, start + len(self.order))
+
+    def samples_mmap(self):
+        """Return the sample-major (n_s, n_v, n_xyz, n_t) memory map of all the files."""
+        shape = (self.n_stored,) + tuple(self.manifest["shape"] or (0, 0, 0))
+        if self.n_stored == 0:
+            return np.zeros(shape, dtype=self.dtype)
+        return np.memmap(self.file("U.dat"), dtype=self.dtype, mode="r", shape=shape)
+
+    def samples(self):
+        """Return the sample-major snapshots of the selection, as a lazy memory
+        map unless the selection has to be gathered."""
+        U_s = self.samples_mmap()
+        run = self.selected_range()
+        return U_s[self.order] if run is None else U_s[run]
+
+    @property
+    def U(self):
+        """Return a (n_v, n_xyz, n_t, n_s) view of the snapshots, lazy as samples."""
+        return np.moveaxis(self.samples(), 0, -1)
+
+    @property
+    def U_flat(self):
+        """Return a (n_h, n_t, n_s) view of the snapshots, as for LazySnapshots."""
+        U_s = self.samples()
+        return U_s.reshape((len(self), -1, U_s.shape[-1])).transpose((1, 2, 0))
+
+    @property
+    def X_v(self):
+        """Return a (n_s * n_t, n_d) view of the inputs, lazy as samples."""
+        if self.n_stored == 0:
+            return np.zeros((0, self.manifest["n_d"] or 0))
+        n_t, n_d = self.manifest["shape"][2], self.manifest["n_d"]
+        X_v = np.memmap(self.file("X_v.dat"), dtype=np.float64, mode="r",
+                        shape=(self.n_stored, n_t, n_d))
+        run = self.selected_range()
+        X_v = X_v[self.order] if run is None else X_v[run]
+        return X_v.reshape((len(self) * n_t, n_d))
+
+    def iter_samples(self, samples=None):
+        """Yield the (n_h, n_t) snapshots of each sample, e.g. for IncrementalPod."""
+        U_s = self.samples_mmap()
+        order = range(self.n_stored) if self.order is None else self.order
+        samples = range(len(self)) if samples is None else samples
+        for i in samples:
+            yield np.asarray(U_s[order[i]], dtype=np.float64).reshape((-1, U_s.shape[-1]))
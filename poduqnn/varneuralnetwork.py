@@ -7,11 +7,9 @@ import tensorflow as tf
 import tensorflow_probability as tfp
 import numpy as np
 
-tfd = tfp.distributions
+from .handling import NORM_NONE, NORM_MEANSTD, NORM_CENTER
 
-NORM_NONE = "none"
-NORM_MEANSTD = "meanstd"
-NORM_CENTER = "center"
+tfd = tfp.distributions
 
 
 class VarNeuralNetwork:
@@ -191,3 +189,4 @@ class VarNeuralNetwork:
             layers, lr, lam, soft_0, norm, norm_bounds = pickle.load(f)
         print(f"Loading model params from {params_path}")
         return cls(layers, lr, lam, weights_path=weights_path, norm=norm, norm_bounds=norm_bounds)
+
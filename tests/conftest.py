@@ -0,0 +1,9 @@
+"""Tests setup: the package from the repo, compiled kernels in a temporary cache."""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Not polluting the user cache with the tests solutions
+os.environ.setdefault("PODUQNN_JIT_CACHE", tempfile.mkdtemp(prefix="poduqnn-tests-"))
@@ -0,0 +1,88 @@
+"""Adaptive sampling loop, on a fake HiFi solver."""
+
+import os
+import numpy as np
+import pytest
+
+# The tfp layers need Keras 2
+os.environ.setdefault("TF_USE_LEGACY_KERAS", "1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+pytest.importorskip("tensorflow")
+pytest.importorskip("tensorflow_probability")
+
+# pylint: disable=wrong-import-position
+from poduqnn.adaptive import AdaptiveSampler
+from poduqnn.metrics import re_s
+from poduqnn.podnnmodel import PodnnModel
+
+N_XYZ = 20
+
+
+class FakeSolver:
+    """Steady solutions of the parameters, recording what was requested."""
+    def __init__(self):
+        self.x = np.linspace(0., 1., N_XYZ)
+        self.calls = []
+
+    def __call__(self, mu_lhs):
+        self.calls.append(mu_lhs.copy())
+        U = np.stack([mu[1] * np.sin(mu[0] * self.x) for mu in mu_lhs], axis=-1)
+        return mu_lhs.copy(), U
+
+
+def make_sampler(tmp_path):
+    x_mesh = np.hstack((np.arange(N_XYZ).reshape((-1, 1)),
+                        np.linspace(0., 1., N_XYZ).reshape((-1, 1))))
+    model = PodnnModel(str(tmp_path), 1, x_mesh, 0)
+    solver = FakeSolver()
+    sampler = AdaptiveSampler(model, solver, [1., 1.], [3., 2.], seed=0)
+    return model, solver, sampler
+
+
+def test_init_design(tmp_path):
+    model, solver, sampler = make_sampler(tmp_path)
+    X_v_train, v_train, U_train, X_v_val, _, U_val = sampler.init_design(8, (.75, .25))
+    # Validation samples first, then the training ones
+    assert [mu.shape[0] for mu in solver.calls] == [2, 6]
+    assert U_train.shape == (N_XYZ, 6) and U_val.shape == (N_XYZ, 2)
+    np.testing.assert_array_equal(X_v_train, solver.calls[1])
+    assert (model.n_d, v_train.shape) == (2, (6, model.n_L))
+    # Orthonormal basis spanning the snapshots
+    np.testing.assert_allclose(model.V.T.dot(model.V), np.eye(model.n_L), atol=1e-10)
+    np.testing.assert_allclose(model.project_to_U(v_train), U_train, atol=1e-8)
+
+    with pytest.raises(ValueError):
+        make_sampler(tmp_path)[2].init_design(3, (.75, .25))
+
+
+def test_refinement_and_stop(tmp_path):
+    model, solver, sampler = make_sampler(tmp_path)
+    sampler.init_design(8, (.75, .25), n_L=3)
+    model.initVNNs(2, [8], 1e-2, 1e-4, None)
+
+    # Recording the candidates and their scores
+    scored, score = [], sampler.score
+    def record(mu):
+        res = score(mu)
+        scored.append((mu.copy(), res[0]))
+        return res
+    sampler.score = record
+
+    # Never satisfied, refining up to max_iter
+    history = sampler.run(16, 2, 5, tol=0., max_iter=1)
+    assert [h["n_s"] for h in history] == [6, 8]
+    assert sampler.U_train.shape == (N_XYZ, 8) and model.n_L == 3
+    # The new samples are the most uncertain candidates
+    mu_pool, scores = scored[0]
+    np.testing.assert_array_equal(solver.calls[-1], mu_pool[np.argsort(scores)[::-1][:2]])
+    assert scored[1][0].shape[0] == 14
+    # The stopping error is the one of the predicted mean on the validation samples
+    v_pred, _ = model.predict_v(sampler.X_v_val)
+    np.testing.assert_allclose(history[-1]["err"],
+                               re_s(sampler.U_val, model.project_to_U(v_pred)))
+    assert history[-1]["unc"] > 0.
+
+    # Satisfied right away, no HiFi solution requested
+    n_calls = len(solver.calls)
+    history = sampler.run(16, 2, 1, tol=np.inf)
+    assert len(solver.calls) == n_calls and history[-1]["n_s"] == 8
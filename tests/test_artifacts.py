@@ -0,0 +1,48 @@
+"""Artifact directories, their atomic replacement and links."""
+
+import os
+import numpy as np
+import pytest
+
+from poduqnn.artifacts import save_arrays, load_arrays, link_artifact, remove_dir
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "data")
+    arrays = {"U": np.arange(12.).reshape((3, 4)), "idx": np.arange(5), "none": None}
+    save_arrays(path, arrays, {"n_L": 3})
+    data = load_arrays(path)
+    assert data.meta == {"n_L": 3} and "U" in data and "V" not in data
+    U, idx, none = data.get(["U", "idx", "none"])
+    np.testing.assert_array_equal(U, arrays["U"])
+    np.testing.assert_array_equal(idx, arrays["idx"])
+    assert none is None
+    # Copy-on-write
+    U[0, 0] = -1.
+    assert load_arrays(path)["U"][0, 0] == 0.
+    with pytest.raises(FileNotFoundError):
+        load_arrays(str(tmp_path / "missing"))
+
+
+def test_replace(tmp_path):
+    path = str(tmp_path / "data")
+    # Plain directory of an earlier layout
+    os.makedirs(path)
+    save_arrays(path, {"x": np.zeros(3)})
+    data = load_arrays(path)
+    save_arrays(path, {"x": np.ones(4)})
+    # Opened versions are kept consistent, the old one is removed
+    np.testing.assert_array_equal(data["x"], np.zeros(3))
+    np.testing.assert_array_equal(load_arrays(path)["x"], np.ones(4))
+    assert len(os.listdir(str(tmp_path))) == 2
+    remove_dir(path)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_link(tmp_path):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "dst")
+    save_arrays(src, {"x": np.arange(3.)})
+    link_artifact(src, dst)
+    # Independent copies, sharing the data
+    save_arrays(src, {"x": np.zeros(2)})
+    np.testing.assert_array_equal(load_arrays(dst)["x"], np.arange(3.))
@@ -0,0 +1,158 @@
+"""Caches of the POD spectrum, compiled kernels and datasets, and their keys."""
+
+import importlib
+import sys
+import time
+import numpy as np
+import pytest
+from numba.core.caching import FunctionCache, NullCache
+
+from poduqnn.podnnmodel import PodnnModel
+from poduqnn.acceleration import get_kernels, jit_u
+from poduqnn.cache import DatasetCache
+from poduqnn.artifacts import save_arrays
+from poduqnn.pod import compute_pod, POD_AUTO, POD_SVD
+
+
+@pytest.fixture
+def model(tmp_path):
+    x_mesh = np.linspace(0., 1., 50).reshape((-1, 1))
+    return PodnnModel(str(tmp_path), 1, x_mesh, 0)
+
+
+def snapshots(seed):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((50, 8)).dot(np.diag(2.**-np.arange(8))) \
+        .dot(rng.standard_normal((8, 30)))
+
+
+def test_spectrum_cache(model, capsys):
+    U = snapshots(0)
+    model.compute_cached_pod(U, eps=1e-2)
+    key = model.load_pod_spectrum()[0]
+
+    # Only re-truncated for another eps or n_L
+    for eps, n_L in ((1e-6, 0), (0., 3)):
+        V = model.compute_cached_pod(U, eps, n_L)
+        assert "Re-truncating" in capsys.readouterr().out
+        V_ref = compute_pod(U, eps, n_L, verbose=False)
+        np.testing.assert_allclose(V.dot(V.T), V_ref.dot(V_ref.T), atol=1e-8)
+    assert model.load_pod_spectrum()[0] == key
+
+    # Computed again for other snapshots or another method
+    for U_k, method in ((snapshots(1), POD_AUTO), (U, POD_SVD)):
+        model.compute_cached_pod(U_k, 1e-6, pod_method=method)
+        assert "Re-truncating" not in capsys.readouterr().out
+        assert model.load_pod_spectrum()[0] != key
+
+
+SOLUTION = """
+import numpy as np
+from helper_{name} import shift
+
+SCALE = {scale}
+
+
+def u(X, t, mu):
+    return (SCALE * shift(np.sin(mu[0] * X[0]))).reshape((1, -1))
+"""
+
+HELPER = """
+from numba import njit
+
+
+@njit
+def shift(x):
+    return x + {shift}
+"""
+
+
+def load_solution(path, name, scale=1., shift=0.):
+    """Return u from a new solution module, and its helper module."""
+    for module, src in ((f"helper_{name}", HELPER.format(shift=shift)),
+                        (f"solution_{name}", SOLUTION.format(name=name, scale=scale))):
+        (path / f"{module}.py").write_text(src)
+    sys.path.insert(0, str(path))
+    try:
+        # As in a new run
+        sys.modules.pop(f"helper_{name}", None)
+        sys.modules.pop(f"solution_{name}", None)
+        return importlib.import_module(f"solution_{name}").u
+    finally:
+        sys.path.remove(str(path))
+
+
+def run_kernel(u):
+    X = np.linspace(0., 1., 5).reshape((1, -1))
+    mu_lhs = np.array([[1.], [2.]])
+    X_v, U = np.zeros((2, 1)), np.zeros((5, 2))
+    kernels = get_kernels(u)
+    kernels.loop_u(5, X_v, U, U, X, mu_lhs)
+    return kernels.__name__, U
+
+
+def test_kernel_cache(tmp_path):
+    name, U = run_kernel(load_solution(tmp_path, "a"))
+    # Same code, same kernels
+    assert run_kernel(load_solution(tmp_path, "a"))[0] == name
+    # Another constant or helper, other kernels
+    for scale, shift in ((10., 0.), (1., 100.)):
+        name_k, U_k = run_kernel(load_solution(tmp_path, "a", scale, shift))
+        assert name_k != name
+        np.testing.assert_allclose(U_k, scale * (U + shift))
+
+
+def test_jit_u_cache(tmp_path):
+    # Only cached by numba if nothing it reads lives in another file
+    assert isinstance(jit_u(u_local)._cache, FunctionCache)
+    assert isinstance(jit_u(load_solution(tmp_path, "d"))._cache, NullCache)
+
+
+def u_local(X, t, mu):
+    return (mu[0] * X[0]).reshape((1, -1))
+
+
+def generate(model, u, capsys, **kwargs):
+    """Return the train/val data generated for u, and if the cache was used."""
+    args = dict(mu_min=[1.], mu_max=[3.], n_s=12, train_val=(.5, .5), eps=1e-6,
+                seed=2)
+    args.update(kwargs)
+    data = model.generate_dataset(u, **args)
+    return data, "Reusing the cached dataset" in capsys.readouterr().out
+
+
+def test_dataset_cache(model, tmp_path, capsys):
+    u = load_solution(tmp_path, "e")
+    data, hit = generate(model, u, capsys)
+    assert not hit
+    data_k, hit = generate(model, u, capsys)
+    assert hit
+    for A, A_k in zip(data, data_k):
+        np.testing.assert_array_equal(A, A_k)
+    cache = DatasetCache(model.dataset_cache_path)
+    assert len(cache.entries()) == 1
+
+    # Other settings, seed or solution constants, other datasets
+    for kwargs, scale in (({"eps": 1e-3}, 1.), ({"seed": 3}, 1.), ({}, 2.)):
+        data_k, hit = generate(model, load_solution(tmp_path, "e", scale), capsys,
+                               **kwargs)
+        assert not hit
+    np.testing.assert_allclose(data_k[5], 2. * data[5])
+    assert len(cache.entries()) == 4
+
+    # Unseeded datasets can't be reproduced, they aren't cached
+    generate(model, u, capsys, seed=None)
+    assert len(cache.entries()) == 4
+
+
+def test_dataset_cache_eviction(tmp_path):
+    src = str(tmp_path / "src")
+    save_arrays(src, {"x": np.zeros(1000)})
+    cache = DatasetCache(str(tmp_path / "cache"), max_size=30000)
+    for key in ("a", "b", "c"):
+        cache.put(key, {"data": src})
+        time.sleep(.01)
+    # The least recently used go first
+    assert cache.get("a", {"data": str(tmp_path / "dst")}) is not None
+    cache.put("d", {"data": src})
+    assert cache.entries() == ["c", "a", "d"]
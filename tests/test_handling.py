@@ -0,0 +1,124 @@
+"""Designs of experiments, dataset splits and initial-condition removal."""
+
+import numpy as np
+import pytest
+
+from poduqnn.handling import split_samples, split_snapshots, sample_mu, \
+    DESIGN_LHS, DESIGN_MAXIMIN, DESIGN_SOBOL, DESIGN_HALTON
+from poduqnn.podnnmodel import PodnnModel
+
+MU_MIN, MU_MAX = np.array([1., -2., 0.]), np.array([3., 2., 10.])
+DESIGNS = [DESIGN_LHS, DESIGN_MAXIMIN, DESIGN_SOBOL, DESIGN_HALTON]
+
+
+def unit(mu):
+    return (mu - MU_MIN) / (MU_MAX - MU_MIN)
+
+
+def assert_lhs(mu):
+    """Check that each of the n strata of each parameter holds a single point."""
+    n = mu.shape[0]
+    strata = np.floor(unit(mu) * n).astype(int)
+    for j in range(mu.shape[1]):
+        np.testing.assert_array_equal(np.sort(strata[:, j]), np.arange(n))
+
+
+@pytest.mark.parametrize("design", DESIGNS)
+def test_sample_mu_deterministic(design):
+    mu = sample_mu(16, MU_MIN, MU_MAX, design=design, seed=4)
+    assert mu.shape == (16, 3)
+    assert np.all(mu >= MU_MIN) and np.all(mu <= MU_MAX)
+    np.testing.assert_array_equal(sample_mu(16, MU_MIN, MU_MAX, design=design, seed=4), mu)
+    assert not np.allclose(sample_mu(16, MU_MIN, MU_MAX, design=design, seed=5), mu)
+
+
+def test_sample_mu_lhs():
+    # Compiled when unseeded, from numpy generators otherwise
+    assert_lhs(sample_mu(13, MU_MIN, MU_MAX))
+    for design in (DESIGN_LHS, DESIGN_MAXIMIN):
+        assert_lhs(sample_mu(13, MU_MIN, MU_MAX, design=design, seed=0))
+
+
+@pytest.mark.parametrize("design", [DESIGN_LHS, DESIGN_MAXIMIN])
+def test_sample_mu_extend_lhs(design):
+    mu_0 = sample_mu(8, MU_MIN, MU_MAX, design=design, seed=1)
+    mu = sample_mu(8, MU_MIN, MU_MAX, design=design, seed=2, existing=mu_0)
+    # Still a LHS on the grid of the combined design, twice as fine
+    assert_lhs(np.vstack((mu_0, mu)))
+    mu_2 = sample_mu(16, MU_MIN, MU_MAX, design=design, seed=3,
+                     existing=np.vstack((mu_0, mu)))
+    assert_lhs(np.vstack((mu_0, mu, mu_2)))
+
+
+@pytest.mark.parametrize("design", [DESIGN_SOBOL, DESIGN_HALTON])
+def test_sample_mu_extend_sequence(design):
+    mu_full = sample_mu(16, MU_MIN, MU_MAX, design=design, seed=7)
+    mu_0 = sample_mu(8, MU_MIN, MU_MAX, design=design, seed=7)
+    mu = sample_mu(8, MU_MIN, MU_MAX, design=design, seed=7, existing=mu_0)
+    # Resuming the contiguous sequence
+    np.testing.assert_allclose(np.vstack((mu_0, mu)), mu_full)
+    with pytest.raises(ValueError):
+        sample_mu(8, MU_MIN, MU_MAX, design=design, existing=mu_0)
+
+
+def test_sample_mu_maximin():
+    # The most spread of the candidates LHS
+    from scipy.spatial.distance import pdist
+    d_lhs = [pdist(unit(sample_mu(10, MU_MIN, MU_MAX, design=DESIGN_LHS, seed=s))).min()
+             for s in range(8)]
+    d_maximin = pdist(unit(sample_mu(10, MU_MIN, MU_MAX, design=DESIGN_MAXIMIN,
+                                     seed=0))).min()
+    assert d_maximin > np.median(d_lhs)
+    with pytest.raises(ValueError):
+        sample_mu(10, MU_MIN, MU_MAX, design="grid")
+
+
+def test_split_samples():
+    train_idx, val_idx = split_samples(10, .3, seed=1)
+    assert len(train_idx) == 7
+    np.testing.assert_array_equal(np.sort(np.concatenate((train_idx, val_idx))),
+                                  np.arange(10))
+    np.testing.assert_array_equal(split_samples(10, .3, seed=1)[0], train_idx)
+
+
+@pytest.mark.parametrize("n_t", [0, 1, 4])
+def test_split_snapshots(n_t):
+    samples = np.array([3, 0, 2])
+    n_t_s = max(n_t, 1)
+    cols_ref = np.concatenate([np.arange(i * n_t_s, (i + 1) * n_t_s) for i in samples])
+    cols, n_0 = split_snapshots(samples, n_t)
+    np.testing.assert_array_equal(cols, cols_ref)
+    assert n_0 == 0
+
+    # Initial conditions first, the rest in order as with np.delete
+    cols, n_0 = split_snapshots(samples, n_t, rm_init=True)
+    if n_t == 0:
+        np.testing.assert_array_equal(cols, cols_ref)
+        assert n_0 == 0
+    else:
+        idx = np.arange(len(samples)) * n_t
+        assert n_0 == len(samples)
+        np.testing.assert_array_equal(cols[:n_0], cols_ref[idx])
+        np.testing.assert_array_equal(cols[n_0:], np.delete(cols_ref, idx))
+
+
+def test_convert_rm_init(tmp_path):
+    n_xyz, n_t, n_s = 6, 4, 10
+    x_mesh = np.hstack((np.arange(n_xyz).reshape((-1, 1)),
+                        np.linspace(0., 1., n_xyz).reshape((-1, 1))))
+    model = PodnnModel(str(tmp_path), 1, x_mesh, n_t)
+    # (t, mu) inputs, and snapshots keeping track of them
+    t = np.tile(np.arange(n_t, dtype=np.float64), n_s)
+    mu = np.repeat(np.arange(n_s, dtype=np.float64), n_t)
+    X_v = np.stack((t, mu), axis=1)
+    U = np.broadcast_to(10. * mu + t, (1, n_xyz, n_s * n_t)).reshape((1, n_xyz, n_s, n_t)) \
+        .transpose((0, 1, 3, 2)).copy()
+    X_v_train, v_train, X_v_val, v_val, U_val = \
+        model.convert_multigpu_data(U, X_v, (.7, .3), 1e-10, seed=0, use_cache=False)
+    assert X_v_train.shape == (7 * (n_t - 1), 2) and X_v_val.shape == (3 * (n_t - 1), 2)
+    assert np.all(X_v_train[:, 0] > 0.) and np.all(X_v_val[:, 0] > 0.)
+    # Outputs still matching their inputs
+    np.testing.assert_allclose(model.V.dot(v_train.T)[0], 10. * X_v_train[:, 1] +
+                               X_v_train[:, 0])
+    np.testing.assert_allclose(U_val.reshape((n_xyz, -1))[0], 10. * X_v_val[:, 1] +
+                               X_v_val[:, 0])
@@ -0,0 +1,81 @@
+"""Predict-only networks and bundles, against the TensorFlow models, and the
+prediction modes."""
+
+import os
+import numpy as np
+import pytest
+
+# The tfp layers need Keras 2
+os.environ.setdefault("TF_USE_LEGACY_KERAS", "1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+pytest.importorskip("tensorflow")
+pytest.importorskip("tensorflow_probability")
+
+# pylint: disable=wrong-import-position
+from poduqnn.varneuralnetwork import VarNeuralNetwork
+from poduqnn.inference import InferenceNetwork
+from poduqnn.podnnmodel import PodnnModel, PRED_ANALYTIC, PRED_MC
+from poduqnn.handling import NORM_NONE, NORM_MEANSTD, NORM_CENTER
+
+
+@pytest.fixture
+def X():
+    return np.random.default_rng(0).uniform(1., 3., (20, 2))
+
+
+@pytest.mark.parametrize("norm,soft_0", [(NORM_NONE, 1.), (NORM_MEANSTD, .5),
+                                         (NORM_CENTER, 2.)])
+def test_forward_parity(X, norm, soft_0):
+    regnn = VarNeuralNetwork([2, 8, 8, 3], 1e-3, 1e-3, None, soft_0, norm)
+    regnn.set_normalize_bounds(X)
+    net = InferenceNetwork.from_network(regnn)
+    for y, y_ref in zip(net.predict(X), regnn.predict(X)):
+        np.testing.assert_allclose(y, y_ref, rtol=1e-10, atol=1e-12)
+    dist, dist_ref = net.predict_dist(X), regnn.predict_dist(X)
+    np.testing.assert_allclose(dist.stddev().numpy(), dist_ref.stddev().numpy(),
+                               rtol=1e-10)
+
+
+def make_model(tmp_path, X, n_xyz=12, n_L=3):
+    """Untrained ensemble of 2 networks, on a random orthonormal basis."""
+    x_mesh = np.hstack((np.arange(n_xyz).reshape((-1, 1)),
+                        np.linspace(0., 1., n_xyz).reshape((-1, 1))))
+    model = PodnnModel(str(tmp_path), 1, x_mesh, 0)
+    rng = np.random.default_rng(1)
+    model.V = np.linalg.qr(rng.standard_normal((n_xyz, n_L)))[0]
+    model.pod_sig = rng.random(n_xyz)
+    model.n_L, model.n_d = n_L, 2
+    model.initVNNs(2, [8], 1e-3, 1e-3, None, .5, NORM_MEANSTD)
+    for regnn in model.regnn:
+        regnn.set_normalize_bounds(X)
+    return model
+
+
+def test_predict_analytic_mc(tmp_path, X):
+    import tensorflow as tf
+    model = make_model(tmp_path, X)
+    U_pred, U_pred_sig = model.predict(X, mode=PRED_ANALYTIC)
+    tf.random.set_seed(0)
+    n_mc = 4000
+    U_mc, U_mc_sig = model.predict(X, samples=n_mc, mode=PRED_MC)
+    assert U_pred.shape == U_mc.shape == (12, X.shape[0])
+    # Within 5 standard errors of the Monte Carlo estimates
+    U_pred_sig = np.asarray(U_pred_sig)
+    np.testing.assert_array_less(np.abs(U_mc - U_pred), 5 * U_pred_sig / np.sqrt(n_mc))
+    np.testing.assert_array_less(np.abs(U_mc_sig - U_pred_sig),
+                                 5 * U_pred_sig / np.sqrt(2 * n_mc))
+    with pytest.raises(ValueError):
+        model.predict(X, mode="exact")
+
+
+def test_bundle_round_trip(tmp_path, X):
+    model = make_model(tmp_path, X)
+    model.export_bundle()
+
+    assert PodnnModel.bundle_is_fresh(str(tmp_path))
+    bundle = PodnnModel.load_bundle(str(tmp_path))
+    assert all(isinstance(net, InferenceNetwork) for net in bundle.regnn)
+    np.testing.assert_array_equal(bundle.V, model.V)
+    np.testing.assert_array_equal(bundle.pod_sig, model.pod_sig)
+    for U, U_ref in zip(bundle.predict(X), model.predict(X)):
+        np.testing.assert_allclose(np.asarray(U), np.asarray(U_ref), rtol=1e-10)
@@ -0,0 +1,313 @@
+"""Mesh readers: binary copies of the text solutions, multi-run ingestion."""
+
+import os
+import subprocess
+import sys
+import zlib
+from functools import partial
+import numpy as np
+import pytest
+
+from poduqnn import mesh
+from poduqnn.mesh import convert_txt_dir, read_txt_data, load_txt_cached, \
+    list_multi_files, read_multi_files, read_point_data, read_vtk_data, \
+    extract_submesh, read_vtk_conf
+
+QTIES = ["h", "u"]
+
+
+def write_txt(path, j, n_pts):
+    U = np.arange(n_pts * 3.).reshape((n_pts, 3)) + j
+    np.savetxt(str(path / f"0_sol_nodes_{j}.txt"), U, delimiter="\t")
+    return U
+
+
+def test_txt_cache(tmp_path):
+    run_dir, cache_dir = tmp_path / "multi_1", str(tmp_path / "cache")
+    run_dir.mkdir()
+    # Meshes of different sizes
+    arrays = [write_txt(run_dir, j, n_pts) for j, n_pts in enumerate((4, 6, 5))]
+    assert convert_txt_dir(str(run_dir), cache_dir)
+    assert not convert_txt_dir(str(run_dir), cache_dir)
+    for j, U in enumerate(arrays):
+        path = str(run_dir / f"0_sol_nodes_{j}.txt")
+        np.testing.assert_array_equal(load_txt_cached(path, cache_dir), U)
+        np.testing.assert_array_equal(read_txt_data(path, None, cache_dir=cache_dir), U.T)
+
+    # A modified file isn't read from its outdated copy
+    U = write_txt(run_dir, 1, 2)
+    os.utime(str(run_dir / "0_sol_nodes_1.txt"), ns=(1, 1))
+    path = str(run_dir / "0_sol_nodes_1.txt")
+    assert load_txt_cached(path, cache_dir) is None
+    np.testing.assert_array_equal(read_txt_data(path, None, cache_dir=cache_dir), U.T)
+    assert convert_txt_dir(str(run_dir), cache_dir)
+    np.testing.assert_array_equal(load_txt_cached(path, cache_dir), U)
+
+
+def write_runs(root, n_s, n_t, n_pts=7):
+    """Write n_s run directories of n_t VTK files, returning U (n_v, n_xyz, n_t, n_s)."""
+    import meshio
+    points = np.column_stack((np.arange(n_pts), np.arange(n_pts) ** 2, np.zeros(n_pts)))
+    cells = [("triangle", np.array([[i, i + 1, i + 2] for i in range(n_pts - 2)]))]
+    U = np.zeros((len(QTIES), n_pts, n_t, n_s))
+    for i in range(n_s):
+        run_dir = os.path.join(root, f"multi_{i+1}")
+        os.makedirs(run_dir)
+        for j in range(n_t):
+            U[:, :, j, i] = np.arange(len(QTIES) * n_pts).reshape((len(QTIES), n_pts)) \
+                + 10. * i + .5 * j
+            point_data = {key: U[k, :, j, i] for k, key in enumerate(QTIES)}
+            meshio.write_points_cells(os.path.join(run_dir, f"0_FV-Paraview_{j}.vtk"),
+                                      points, cells, point_data=point_data)
+    return points, U
+
+
+def test_read_multi_files_serial(tmp_path):
+    points, U_ref = write_runs(str(tmp_path), 3, 4)
+    files_ij = list_multi_files(4, range(3), str(tmp_path))
+    x_mesh, _, U, _ = read_multi_files(3, 4, files_ij, QTIES, n_workers=1)
+    np.testing.assert_allclose(x_mesh, points)
+    np.testing.assert_array_equal(U, U_ref)
+
+
+def test_read_multi_files_pool(tmp_path):
+    # From a fresh process, the pool forking only until numba's threads run
+    write_runs(str(tmp_path), 5, 3)
+    script = ("import os\n"
+              "import numpy as np\n"
+              "import conftest\n"
+              "from poduqnn import mesh\n"
+              f"root = {str(tmp_path)!r}\n"
+              "pids_dir = os.path.join(root, 'pids')\n"
+              "os.makedirs(pids_dir)\n"
+              "read_vtk_data = mesh.read_vtk_data\n"
+              "def read_data(*args):\n"
+              "    open(os.path.join(pids_dir, str(os.getpid())), 'w').close()\n"
+              "    return read_vtk_data(*args)\n"
+              "files_ij = mesh.list_multi_files(3, range(5), root)\n"
+              "_, _, U_ref, _ = mesh.read_multi_files(5, 3, files_ij, ['h', 'u'],\n"
+              "                                       n_workers=1)\n"
+              "mesh.read_vtk_data = read_data\n"
+              "_, _, U, _ = mesh.read_multi_files(5, 3, files_ij, ['h', 'u'],\n"
+              "                                   n_workers=2)\n"
+              "np.testing.assert_array_equal(U, U_ref)\n"
+              "print(os.getpid())\n")
+    res = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(__file__),
+                         check=True, timeout=120, capture_output=True, text=True)
+    parent = res.stdout.split()[-1]
+    assert len(set(os.listdir(str(tmp_path / "pids"))) - {parent}) > 0
+
+
+def write_legacy(path, points, cells, point_data, binary):
+    """Write a legacy VTK file, the point data as SCALARS sections."""
+    def data(a, dtype):
+        if binary:
+            return np.asarray(a, dtype=">" + dtype).tobytes() + b"\n"
+        return " ".join(str(x) for x in np.ravel(a)).encode() + b"\n"
+    n_c = cells.shape[0]
+    out = [b"# vtk DataFile Version 4.2\nwritten by hand\n",
+           b"BINARY\n" if binary else b"ASCII\n", b"DATASET UNSTRUCTURED_GRID\n",
+           b"POINTS %d double\n" % points.shape[0], data(points, "f8"),
+           b"CELLS %d %d\n" % (n_c, 4 * n_c),
+           data(np.hstack((np.full((n_c, 1), 3), cells)), "i4"),
+           b"CELL_TYPES %d\n" % n_c, data(np.full(n_c, 5), "i4"),
+           b"POINT_DATA %d\n" % points.shape[0]]
+    for key, a in point_data.items():
+        out += [b"SCALARS %s double 1\nLOOKUP_TABLE default\n" % key.encode(),
+                data(a, "f8")]
+    with open(path, "wb") as f:
+        f.write(b"".join(out))
+
+
+def write_vtu_appended(path, points, cells, point_data, zlib_block=0):
+    """Write a VTU file with raw appended data, zlib-compressed by blocks if given."""
+    def block(a):
+        raw = np.ascontiguousarray(a).tobytes()
+        if zlib_block == 0:
+            return np.uint64(len(raw)).tobytes() + raw
+        chunks = [zlib.compress(raw[k:k + zlib_block])
+                  for k in range(0, len(raw), zlib_block)]
+        last = len(raw) - zlib_block * (len(chunks) - 1)
+        header = [len(chunks), zlib_block, last] + [len(c) for c in chunks]
+        return np.array(header, dtype="<u8").tobytes() + b"".join(chunks)
+    arrays = [("Points", "Float64", 3, None, points.astype("<f8")),
+              ("Cells", "Int64", 1, "connectivity", cells.astype("<i8")),
+              ("Cells", "Int64", 1, "offsets", 3 * np.arange(1, cells.shape[0] + 1)),
+              ("Cells", "UInt8", 1, "types", np.full(cells.shape[0], 5, dtype="u1"))]
+    arrays += [("PointData", "Float64", 1, key, np.asarray(a, dtype="<f8"))
+               for key, a in point_data.items()]
+    xml, app, offset = {}, [], 0
+    for section, vtu_type, n_comp, name, a in arrays:
+        name = "" if name is None else f' Name="{name}"'
+        xml.setdefault(section, []).append(
+            f'<DataArray type="{vtu_type}"{name} NumberOfComponents="{n_comp}" '
+            f'format="appended" offset="{offset}"/>')
+        app.append(block(a))
+        offset += len(app[-1])
+    compressor = ' compressor="vtkZLibDataCompressor"' if zlib_block else ""
+    head = (f'<?xml version="1.0"?>\n<VTKFile type="UnstructuredGrid" version="1.0" '
+            f'byte_order="LittleEndian" header_type="UInt64"{compressor}>\n'
+            f'<UnstructuredGrid>\n<Piece NumberOfPoints="{points.shape[0]}" '
+            f'NumberOfCells="{cells.shape[0]}">\n'
+            + "".join(f"<{s}>\n" + "\n".join(xml[s]) + f"\n</{s}>\n"
+                      for s in ("Points", "Cells", "PointData"))
+            + '</Piece>\n</UnstructuredGrid>\n<AppendedData encoding="raw">\n_')
+    with open(path, "wb") as f:
+        f.write(head.encode() + b"".join(app) + b"\n</AppendedData>\n</VTKFile>\n")
+
+
+def write_meshio(ext, **kwargs):
+    def write(path, points, cells, point_data):
+        import meshio
+        meshio.write_points_cells(path, points, [("triangle", cells)],
+                                  point_data=point_data, file_format=ext, **kwargs)
+    return write
+
+
+# (extension, writer) of each encoding handled by the direct reader
+VTK_WRITERS = {
+    "vtk-field-ascii": (".vtk", write_meshio("vtk", binary=False)),
+    "vtk-field-binary": (".vtk", write_meshio("vtk", binary=True)),
+    "vtk-scalars-ascii": (".vtk", partial(write_legacy, binary=False)),
+    "vtk-scalars-binary": (".vtk", partial(write_legacy, binary=True)),
+    "vtu-ascii": (".vtu", write_meshio("vtu", binary=False)),
+    "vtu-base64": (".vtu", write_meshio("vtu", binary=True, compression=None)),
+    "vtu-base64-zlib": (".vtu", write_meshio("vtu", binary=True, compression="zlib")),
+    "vtu-raw": (".vtu", write_vtu_appended),
+    "vtu-raw-zlib": (".vtu", partial(write_vtu_appended, zlib_block=24)),
+}
+
+
+def write_vtk(path, fmt, values, keys=("h", "u")):
+    """Write a small mesh with the point data keys in format fmt, returning the path."""
+    ext, write = VTK_WRITERS[fmt]
+    n_pts = 9
+    points = np.column_stack((np.arange(n_pts), np.arange(n_pts) ** 2, np.zeros(n_pts)))
+    cells = np.array([[i, i + 1, i + 2] for i in range(n_pts - 2)])
+    point_data = {key: np.linspace(0., 1., n_pts) * (k + 1) + values
+                  for k, key in enumerate(keys)}
+    path = str(path) + ext
+    write(path, points.astype(np.float64), cells, point_data)
+    return path
+
+
+def meshio_data(path, keys):
+    import meshio
+    vtk = meshio.read(path)
+    return np.stack([np.ravel(vtk.point_data[key]) for key in keys])
+
+
+@pytest.mark.parametrize("fmt", sorted(VTK_WRITERS))
+def test_read_point_data(tmp_path, monkeypatch, fmt):
+    monkeypatch.setattr(mesh, "_VTK_LAYOUTS", {})
+    path = write_vtk(tmp_path / "sol", fmt, .5)
+    U_ref = meshio_data(path, ["u", "h"])
+    np.testing.assert_array_equal(read_point_data(path, ["u", "h"]), U_ref)
+    points_idx = np.array([1, 4, 8])
+    np.testing.assert_array_equal(read_vtk_data(path, ["u", "h"], points_idx),
+                                  U_ref[:, points_idx])
+
+
+@pytest.mark.parametrize("fmt", ["vtk-field-binary", "vtk-scalars-binary",
+                                 "vtu-base64", "vtu-raw"])
+def test_point_data_layout_cache(tmp_path, monkeypatch, fmt):
+    monkeypatch.setattr(mesh, "_VTK_LAYOUTS", {})
+    path_0 = write_vtk(tmp_path / "sol_0", fmt, 0.)
+    read_point_data(path_0, ["h", "u"])
+
+    # Files of the same layout aren't parsed again
+    path_1 = write_vtk(tmp_path / "sol_1", fmt, 1.)
+    with monkeypatch.context() as m:
+        def no_parse(*args):
+            raise AssertionError("Layout parsed again")
+        m.setattr(mesh, "parse_vtk_layout", no_parse)
+        m.setattr(mesh, "parse_vtu_layout", no_parse)
+        np.testing.assert_array_equal(read_point_data(path_1, ["h", "u"]),
+                                      meshio_data(path_1, ["h", "u"]))
+
+    # Same size, but arrays in another order, the layout being parsed again
+    path_2 = write_vtk(tmp_path / "sol_2", fmt, 2., keys=("u", "h"))
+    assert os.path.getsize(path_2) == os.path.getsize(path_0)
+    np.testing.assert_array_equal(read_point_data(path_2, ["h", "u"]),
+                                  meshio_data(path_2, ["h", "u"]))
+    np.testing.assert_array_equal(read_point_data(path_0, ["h", "u"]),
+                                  meshio_data(path_0, ["h", "u"]))
+
+
+def looped_submesh(points, cells, sel):
+    """The point by point extraction extract_submesh replaced."""
+    cells = cells[sel].copy()
+    points_idx = np.unique(cells.flatten())
+    sub_points = np.zeros((points_idx.shape[0], points.shape[1]))
+    for i, pt in enumerate(points_idx.tolist()):
+        sub_points[i] = points[pt]
+        cells[cells == pt] = i
+    return sub_points, cells, points_idx
+
+
+def write_mixed_mesh(path):
+    """A grid of triangles, then quads, returning the points and the triangles,
+    the first cells block being the one read_vtk_conf keeps."""
+    import meshio
+    rng = np.random.default_rng(0)
+    n_x = 6
+    points = np.array([[x, y, 0.] for y in range(n_x) for x in range(n_x)], dtype=float)
+    points[:, :2] += rng.random((points.shape[0], 2)) * .1
+    tris, quads = [], []
+    for y in range(n_x - 1):
+        for x in range(n_x - 1):
+            p = y * n_x + x
+            if y < 3:
+                tris += [[p, p + 1, p + n_x], [p + 1, p + n_x + 1, p + n_x]]
+            else:
+                quads.append([p, p + 1, p + n_x + 1, p + n_x])
+    meshio.write_points_cells(path, points, [("triangle", np.array(tris)),
+                                             ("quad", np.array(quads))])
+    return points, np.array(tris)
+
+
+@pytest.mark.parametrize("sel", ["indices", "mask"])
+def test_extract_submesh(tmp_path, sel):
+    path = str(tmp_path / "mesh.vtu")
+    points, tris = write_mixed_mesh(path)
+    rng = np.random.default_rng(1)
+    idx = np.sort(rng.choice(tris.shape[0], 12, replace=False))
+    sel = idx if sel == "indices" else np.isin(np.arange(tris.shape[0]), idx)
+    ref = looped_submesh(points, tris, sel)
+    for res in (extract_submesh(points, tris, sel), read_vtk_conf(path, sel, None)):
+        np.testing.assert_allclose(res[0], ref[0])
+        np.testing.assert_array_equal(res[1], ref[1])
+        np.testing.assert_array_equal(res[2], ref[2])
+
+
+def test_submesh_cache(tmp_path, monkeypatch):
+    import meshio
+    path, cache_dir = str(tmp_path / "mesh.vtu"), str(tmp_path / "cache")
+    points, tris = write_mixed_mesh(path)
+    sel_a, sel_b = np.arange(0, 20, 2), np.arange(5, 15)
+    res_a = read_vtk_conf(path, sel_a, cache_dir)
+    res_full = read_vtk_conf(path, None, cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+    # Cached selections are loaded without reading the mesh
+    with monkeypatch.context() as m:
+        def no_read(*args, **kwargs):
+            raise AssertionError("Mesh read again")
+        m.setattr(meshio, "read", no_read)
+        for res, ref in zip(read_vtk_conf(path, sel_a, cache_dir), res_a):
+            np.testing.assert_array_equal(res, ref)
+        points_full, cells_full, points_idx = read_vtk_conf(path, None, cache_dir)
+        np.testing.assert_array_equal(points_full, points)
+        np.testing.assert_array_equal(cells_full, tris)
+        assert points_idx is None and res_full[2] is None
+
+    # Another selection, or a modified mesh, aren't
+    ref = looped_submesh(points, tris, sel_b)
+    np.testing.assert_array_equal(read_vtk_conf(path, sel_b, cache_dir)[1], ref[1])
+    os.utime(path, ns=(1, 1))
+    with monkeypatch.context() as m:
+        calls = []
+        read = meshio.read
+        m.setattr(meshio, "read", lambda *args: calls.append(args) or read(*args))
+        np.testing.assert_array_equal(read_vtk_conf(path, sel_a, cache_dir)[1], res_a[1])
+        assert len(calls) == 1
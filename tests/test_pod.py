@@ -0,0 +1,136 @@
+"""POD backends, checked against the subspaces of np.linalg.svd."""
+
+import numpy as np
+import pytest
+
+from poduqnn import pod as pod_module
+from poduqnn.pod import perform_rand_pod, perform_snapshots_pod, compute_pod, \
+    POD_AUTO, POD_SVD, POD_SNAPSHOTS, IncrementalPod, LazySnapshots, perform_tsqr_pod, \
+    perform_fast_pod
+from poduqnn.podnnmodel import PodnnModel
+
+# Modes above the noise floor of the test snapshots
+N_L = 5
+EPS = 1e-9
+
+
+@pytest.fixture
+def U():
+    """(n_h, n_st) snapshots with N_L decaying modes, then a noise floor."""
+    rng = np.random.default_rng(0)
+    n_h, n_st = 400, 60
+    Q_l, _ = np.linalg.qr(rng.standard_normal((n_h, n_st)))
+    Q_r, _ = np.linalg.qr(rng.standard_normal((n_st, n_st)))
+    D = np.concatenate((100. * 10.**-np.arange(N_L), 1e-6 * rng.random(n_st - N_L)))
+    return (Q_l * D).dot(Q_r.T)
+
+
+def svd_basis(U, n_L=N_L):
+    return np.linalg.svd(U, full_matrices=False)[0][:, :n_L]
+
+
+def assert_same_subspace(V, W, atol=1e-6):
+    """Check V is orthonormal, and spans the same subspace as W."""
+    assert V.shape == W.shape
+    np.testing.assert_allclose(V.T.dot(V), np.eye(V.shape[1]), atol=atol)
+    np.testing.assert_allclose(V.dot(V.T), W.dot(W.T), atol=atol)
+
+
+def test_rand_pod(U):
+    assert_same_subspace(perform_rand_pod(U, n_L=N_L, seed=0, verbose=False),
+                         svd_basis(U))
+    # Growing the rank from below until the energy criterion is met
+    assert_same_subspace(perform_rand_pod(U, eps=EPS, rank_0=2, seed=0, verbose=False),
+                         svd_basis(U))
+
+
+def test_snapshots_pod(U):
+    assert_same_subspace(perform_snapshots_pod(U, n_L=N_L, verbose=False), svd_basis(U))
+    assert_same_subspace(perform_snapshots_pod(U, eps=EPS, block_size=7, n_workers=2,
+                                               verbose=False),
+                         svd_basis(U))
+    # Picked for these tall snapshots
+    assert_same_subspace(compute_pod(U, eps=EPS, method=POD_AUTO, verbose=False),
+                         svd_basis(U))
+
+
+def test_pod_workers(U, tmp_path, monkeypatch):
+    # Reaching the correlation matrix blocks from the POD entry points
+    workers, snapshots_eig = [], pod_module.snapshots_eig
+    def record(U, block_size=0, n_workers=1):
+        workers.append(n_workers)
+        return snapshots_eig(U, block_size, n_workers)
+    monkeypatch.setattr(pod_module, "snapshots_eig", record)
+    assert_same_subspace(compute_pod(U, eps=EPS, method=POD_SNAPSHOTS, verbose=False,
+                                     n_workers=2),
+                         svd_basis(U))
+    model = PodnnModel(str(tmp_path), 1, np.zeros((U.shape[0], 2)), 0)
+    assert_same_subspace(model.compute_cached_pod(U, EPS, pod_method=POD_SNAPSHOTS,
+                                                  n_workers=3),
+                         svd_basis(U))
+    assert workers == [2, 3]
+
+
+def test_compute_pod_options(U):
+    # The compiled SVD has no options, the others reject unknown ones as well
+    assert_same_subspace(compute_pod(U, n_L=N_L, method=POD_SVD, verbose=False,
+                                     n_workers=2),
+                         svd_basis(U))
+    for method in (POD_SVD, POD_SNAPSHOTS):
+        with pytest.raises(TypeError):
+            compute_pod(U, n_L=N_L, method=method, verbose=False, blocksize=8)
+
+
+def test_incremental_pod(U):
+    pod = IncrementalPod()
+    # Uneven blocks, then single columns
+    for start, end in ((0, 7), (7, 30), (30, 55)):
+        pod.update(U[:, start:end])
+    for j in range(55, U.shape[1]):
+        pod.update(U[:, j])
+    assert pod.n_st == U.shape[1]
+    assert_same_subspace(pod.get_basis(n_L=N_L, verbose=False), svd_basis(U))
+    assert_same_subspace(pod.get_basis(eps=EPS, verbose=False), svd_basis(U))
+
+
+def test_incremental_pod_max_rank(U):
+    pod = IncrementalPod(max_rank=N_L)
+    for start in range(0, U.shape[1], 10):
+        pod.update(U[:, start:start+10])
+    assert pod.Phi.shape[1] == N_L
+    assert_same_subspace(pod.get_basis(verbose=False), svd_basis(U), atol=1e-5)
+
+
+def test_tsqr_pod(U, tmp_path):
+    assert_same_subspace(perform_tsqr_pod(U, n_L=N_L, verbose=False), svd_basis(U))
+    # From disk, in more blocks than reduced at once
+    path = str(tmp_path / "U.npy")
+    np.save(path, U)
+    assert_same_subspace(perform_tsqr_pod(path, eps=EPS, block_size=20, n_workers=2,
+                                          verbose=False),
+                         svd_basis(U))
+
+
+def test_tsqr_pod_lazy(U):
+    # (n_h, n_t, n_s) samples, of which only some are used
+    U_struct = U.reshape((U.shape[0], 4, -1))
+    samples = [3, 0, 7, 12, 5, 9]
+    U_lazy = LazySnapshots(U_struct, samples)
+    U_dense = U_struct[:, :, samples].transpose((0, 2, 1)).reshape((U.shape[0], -1))
+    np.testing.assert_array_equal(U_lazy[10:50], U_dense[10:50])
+    assert_same_subspace(perform_tsqr_pod(U_lazy, eps=EPS, block_size=50, verbose=False),
+                         svd_basis(U_dense))
+
+
+def test_fast_pod():
+    # Time-trajectories of rank 3, spanning N_L modes together
+    rng = np.random.default_rng(1)
+    n_h, n_t, n_s = 200, 10, 9
+    Phi, _ = np.linalg.qr(rng.standard_normal((n_h, N_L)))
+    U_struct = np.zeros((n_h, n_t, n_s))
+    for k in range(n_s):
+        modes = rng.choice(N_L, 3, replace=False)
+        U_struct[:, :, k] = Phi[:, modes].dot(rng.standard_normal((3, n_t)))
+    U = U_struct.transpose((0, 2, 1)).reshape((n_h, -1))
+    assert_same_subspace(perform_fast_pod(U_struct, EPS, EPS, n_workers=2),
+                         svd_basis(U))
@@ -0,0 +1,203 @@
+"""Snapshots executors, checked against the generic compiled loops, and layouts."""
+
+import os
+import pickle
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+from poduqnn.podnnmodel import PodnnModel
+from poduqnn.acceleration import jit_u, loop_u, loop_u_t
+from poduqnn.snapshots import SnapshotArray, restruct, destruct
+
+N_XYZ = 16
+N_T = 5
+MU = np.array([[1., 2.], [1.5, 1.], [.5, 3.], [2., .5], [1., 1.], [3., 2.]])
+
+
+def u_steady(X, t, mu):
+    return (mu[0] * np.sin(mu[1] * X[0])).reshape((1, -1))
+
+
+def u_scalar(X, t, mu):
+    return (np.exp(-mu[0] * t) * np.sin(mu[1] * X[0])).reshape((1, -1))
+
+
+def u_batch(X, t, mu):
+    return np.outer(np.sin(mu[1] * X[0]), np.exp(-mu[0] * t)).reshape((1, X.shape[1], -1))
+
+
+def make_model(resdir, n_t):
+    x_mesh = np.hstack((np.arange(N_XYZ).reshape((-1, 1)),
+                        np.linspace(0., 1., N_XYZ).reshape((-1, 1))))
+    return PodnnModel(str(resdir), 1, x_mesh, n_t)
+
+
+def reference(model, u, u_noise=0., x_noise=0., seed=0):
+    """Snapshots from the loops taking u as argument, a time step per call."""
+    X = model.x_mesh[:, 1:].T
+    n_st = MU.shape[0] * max(model.n_t, 1)
+    n_d = MU.shape[1] + model.has_t
+    X_v, U, U_no_noise = np.zeros((n_st, n_d)), np.zeros((N_XYZ, n_st)), \
+        np.zeros((N_XYZ, n_st))
+    if model.has_t:
+        loop_u_t(jit_u(u), N_T, 1, N_XYZ, N_XYZ, X_v, U, U_no_noise, X, MU, 0., 1.,
+                 u_noise, x_noise, seed, 0, True)
+    else:
+        loop_u(jit_u(u), N_XYZ, X_v, U, U_no_noise, X, MU, u_noise, x_noise, seed,
+               0, True)
+    return X_v, U, U_no_noise
+
+
+@pytest.mark.parametrize("noise", [(0., 0.), (.1, .05)])
+def test_numba_steady(tmp_path, noise):
+    model = make_model(tmp_path, 0)
+    X_v_ref, U_ref, U_nn_ref = reference(model, u_steady, *noise, seed=3)
+    # Same streams whatever the threads count
+    for n_threads in (1, 2):
+        X_v, U, _, U_nn = model.create_snapshots(2, N_XYZ, u_steady, MU,
+                                                 u_noise=noise[0], x_noise=noise[1],
+                                                 seed=3, n_threads=n_threads,
+                                                 no_noise=True)
+        np.testing.assert_allclose(X_v, X_v_ref)
+        np.testing.assert_allclose(U, U_ref)
+        np.testing.assert_allclose(U_nn, U_nn_ref if noise[0] > 0. else U_ref)
+
+
+@pytest.mark.parametrize("noise", [(0., 0.), (.1, .05)])
+def test_numba_batched_t(tmp_path, noise):
+    model = make_model(tmp_path, N_T)
+    X_v_ref, U_ref, _ = reference(model, u_scalar, *noise, seed=3)
+    for u, batched_t in ((u_scalar, False), (u_batch, True), (u_batch, None)):
+        X_v, U, _, _ = model.create_snapshots(3, N_XYZ, u, MU, 0., 1., *noise, seed=3,
+                                              batched_t=batched_t)
+        np.testing.assert_allclose(X_v, X_v_ref)
+        np.testing.assert_allclose(U, U_ref)
+
+
+def test_write_snapshots_chunks(tmp_path):
+    model = make_model(tmp_path, N_T)
+    X_v_ref, U_ref, _ = reference(model, u_scalar, .1, .05, seed=3)
+    X_v, U = model.write_snapshots(str(tmp_path / "U.npy"), 3, N_XYZ, u_batch, MU,
+                                   0., 1., .1, .05, chunk_size=4, seed=3)
+    np.testing.assert_allclose(X_v, X_v_ref)
+    np.testing.assert_allclose(np.load(str(tmp_path / "U.npy")), U_ref)
+
+
+def u_python(X, t, mu):
+    # Not supported by numba, so computed from processes
+    from scipy.special import erf
+    return (mu[0] * erf(mu[1] * X[0])).reshape((1, -1))
+
+
+@pytest.mark.parametrize("n_t", [0, N_T])
+def test_process_executor(tmp_path, n_t):
+    model = make_model(tmp_path, n_t)
+    u = u_scalar if n_t > 0 else u_steady
+    X_v_ref, U_ref, U_nn_ref = reference(model, u, .1, .05, seed=3)
+    X_v, U, _, U_nn = model.create_snapshots(2 + model.has_t, N_XYZ, u, MU, 0., 1.,
+                                             .1, .05, seed=3, no_noise=True,
+                                             n_threads=2, executor="process")
+    np.testing.assert_allclose(X_v, X_v_ref)
+    np.testing.assert_allclose(U, U_ref)
+    np.testing.assert_allclose(U_nn, U_nn_ref)
+
+
+def test_process_fallback(tmp_path):
+    model = make_model(tmp_path, 0)
+    _, U, _, _ = model.create_snapshots(2, N_XYZ, u_python, MU, n_threads=2)
+    X = model.x_mesh[:, 1:].T
+    np.testing.assert_allclose(U, np.hstack([u_python(X, 0, mu).T for mu in MU]))
+
+
+def test_process_after_numba_threads(tmp_path):
+    # Forking once numba's threads run used to hang the process at exit
+    script = ("import conftest\n"
+              "from test_snapshots import make_model, u_steady, MU, N_XYZ\n"
+              f"model = make_model({str(tmp_path)!r}, 0)\n"
+              "model.create_snapshots(2, N_XYZ, u_steady, MU, n_threads=2)\n"
+              "model.create_snapshots(2, N_XYZ, u_steady, MU, n_threads=2,\n"
+              "                       executor='process')\n")
+    # Imported as by pytest, for numba to find the cached solutions
+    subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(__file__),
+                   check=True, timeout=120, stdout=subprocess.DEVNULL)
+
+
+def test_process_pool_after_sampling(tmp_path):
+    # Sampling first, as in the pred.py scripts, must still leave the pool its workers
+    script = ("import os\n"
+              "import numpy as np\n"
+              "import conftest\n"
+              "from poduqnn.handling import sample_mu\n"
+              "from test_snapshots import make_model, N_XYZ\n"
+              f"pids_dir = {str(tmp_path / 'pids')!r}\n"
+              "os.makedirs(pids_dir)\n"
+              "def u(X, t, mu):\n"
+              "    open(os.path.join(pids_dir, str(os.getpid())), 'w').close()\n"
+              "    return (mu[0] * np.sin(mu[1] * X[0])).reshape((1, -1))\n"
+              "mu_min, mu_max = np.array([1., 1.]), np.array([2., 3.])\n"
+              "sample_mu(8, mu_min, mu_max)\n"
+              f"model = make_model({str(tmp_path / 'model')!r}, 0)\n"
+              "X_v, _, U, _, _, _ = model.generate_dataset(\n"
+              "    u, mu_min, mu_max, 12, (.75, .25), seed=3, use_cache=False,\n"
+              "    n_workers=2)\n"
+              "X = model.x_mesh[:, 1:].T\n"
+              "U_ref = np.hstack([(mu[0] * np.sin(mu[1] * X[0]))[:, None] for mu in X_v])\n"
+              "np.testing.assert_allclose(U, U_ref)\n"
+              "print(os.getpid())\n")
+    os.makedirs(str(tmp_path / "model"))
+    res = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(__file__),
+                         check=True, timeout=120, capture_output=True, text=True)
+    parent = res.stdout.split()[-1]
+    workers = set(os.listdir(str(tmp_path / "pids"))) - {parent}
+    assert len(workers) > 0
+
+
+def looped_struct(U, n_v, n_t):
+    """(n_v, n_xyz, n_t, n_s) copy of U, filled snapshot by snapshot."""
+    n_xyz, n_s = U.shape[0] // n_v, U.shape[1] // n_t
+    U_struct = np.zeros((n_v, n_xyz, n_t, n_s))
+    for i in range(n_s):
+        for j in range(n_t):
+            U_struct[:, :, j, i] = U[:, n_t*i + j].reshape((n_v, n_xyz))
+    return U_struct
+
+
+@pytest.mark.parametrize("n_t", [0, 3])
+def test_restruct_views(n_t):
+    U = np.random.default_rng(0).random((2 * 5, 4 * max(n_t, 1)))
+    U_struct = restruct(U, 2, n_t)
+    assert np.shares_memory(U_struct, U)
+    ref = looped_struct(U, 2, max(n_t, 1))
+    np.testing.assert_array_equal(U_struct, ref if n_t > 0 else ref[:, :, 0])
+    assert np.shares_memory(destruct(U_struct), U)
+    np.testing.assert_array_equal(destruct(U_struct), U)
+
+    # Contiguous copies on request
+    U_copy = restruct(U, 2, n_t, copy=True)
+    assert not np.shares_memory(U_copy, U) and U_copy.flags.c_contiguous
+    np.testing.assert_array_equal(U_copy, U_struct)
+    U_back = destruct(U_struct, copy=True)
+    assert not np.shares_memory(U_back, U)
+    np.testing.assert_array_equal(U_back, U)
+
+
+def test_snapshot_array_layout():
+    U = SnapshotArray(np.arange(24.).reshape((6, 4)), 2, 2)
+    assert (U[:, :2].n_v, U[:, :2].n_t) == (2, 2)
+    np.testing.assert_array_equal(U[:, 2:].struct(), restruct(np.asarray(U)[:, 2:], 2, 2))
+    # Arrays that aren't snapshots matrices anymore are plain ndarrays
+    for derived in (U.T, U[:, 0], U[:3], U[:, :3], U.mean(0), U.mean(1)):
+        assert type(derived) is np.ndarray
+    assert type(U.mean()) is np.float64 and U.mean() == 11.5
+    assert type(U.sum()) is np.float64
+    assert U.reshape((4, 6)).n_v is None
+    with pytest.raises(ValueError):
+        U.reshape((4, 6)).struct()
+
+    # Pickled with its layout
+    U_p = pickle.loads(pickle.dumps(U))
+    assert type(U_p) is SnapshotArray and (U_p.n_v, U_p.n_t) == (2, 2)
+    np.testing.assert_array_equal(U_p, U)
+    np.testing.assert_array_equal(U_p.struct(), U.struct())
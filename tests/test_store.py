@@ -0,0 +1,85 @@
+"""Snapshots store: ingestion, resuming, and selections of samples."""
+
+import os
+import numpy as np
+import pytest
+
+from poduqnn.store import SnapshotStore
+from poduqnn.mesh import stored_outputs
+
+SHAPE = (2, 5, 3)
+
+
+def sample(key):
+    return np.full(SHAPE, float(key)), np.full((SHAPE[-1], 2), float(key))
+
+
+def fill(store, keys):
+    for key in keys:
+        store.append(*sample(key), key=key)
+
+
+def test_resume(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    fill(store, [4, 2])
+    # Reopened, e.g. by the next run
+    store = SnapshotStore(str(tmp_path))
+    assert store.keys == [4, 2]
+    assert store.missing([1, 2, 3, 4]) == [0, 2]
+    fill(store, [1, 3])
+    assert store.shape == SHAPE + (4,)
+    np.testing.assert_array_equal(store.U[0, 0, 0], [4., 2., 1., 3.])
+    np.testing.assert_array_equal(store.X_v[::SHAPE[-1], 0], [4., 2., 1., 3.])
+    with pytest.raises(ValueError):
+        store.append(*sample(2), key=2)
+    with pytest.raises(ValueError):
+        store.append(np.zeros((2, 4, 3)), np.zeros((3, 2)), key=5)
+
+
+def test_truncate(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    fill(store, [0, 1])
+    # Interrupted while writing a third sample
+    with open(store.file("U.dat"), "ab") as f:
+        f.write(np.ones(7).tobytes())
+    store = SnapshotStore(str(tmp_path))
+    assert os.path.getsize(store.file("U.dat")) == 2 * store.chunk_size
+    fill(store, [2])
+    np.testing.assert_array_equal(store.U[1, 4, 2], [0., 1., 2.])
+
+
+def test_select(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    fill(store, [5, 3, 9, 1])
+    view = store.select([9, 5, 1])
+    assert len(view) == 3 and view.keys == [9, 5, 1]
+    np.testing.assert_array_equal(view.U[0, 0, 0], [9., 5., 1.])
+    np.testing.assert_array_equal(view.U_flat[0, 0], [9., 5., 1.])
+    np.testing.assert_array_equal(view.X_v[:, 0], np.repeat([9., 5., 1.], SHAPE[-1]))
+    assert [U_i[0, 0] for U_i in view.iter_samples()] == [9., 5., 1.]
+    # Contiguous selections stay memory-mapped
+    assert isinstance(store.select([3, 9]).U.base, np.memmap)
+    with pytest.raises(ValueError):
+        store.select([7])
+    with pytest.raises(ValueError):
+        view.append(*sample(7), key=7)
+
+
+class PodRecorder:
+    """Stand-in for IncrementalPod, recording the samples it's fed."""
+    def __init__(self):
+        self.samples = []
+
+    def update(self, U_b):
+        self.samples.append(U_b[0, 0])
+
+
+def test_stored_outputs(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    fill(store, [5, 3, 9, 1])
+    _, _, U, _ = stored_outputs(store.select([1, 9]), SHAPE[-1], None, None, None, None)
+    np.testing.assert_array_equal(U[0, 0, 0], [1., 9.])
+    pod = PodRecorder()
+    _, _, U, _ = stored_outputs(store.select([1, 9, 3]), SHAPE[-1], pod, None, None,
+                                None)
+    assert U is None and pod.samples == [1., 9., 3.]